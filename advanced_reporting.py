@@ -17,7 +17,8 @@ class AdvancedReporting:
         self.db_manager = db_manager
 
     async def generate_advanced_report(self, user_id: int, start_date: str, end_date: str) -> Dict:
-        trades = await self.db_manager.get_user_trades(user_id, start_date, end_date)
+        # Столбцы сделок загружаются сразу в массивы NumPy, без списка строк
+        trades = await self.db_manager.load_trade_columns(user_id, start_date, end_date)
         df = pd.DataFrame(trades)
         
         if df.empty:
@@ -69,8 +70,9 @@ class AdvancedReporting:
 
     def analyze_trades(self, df: pd.DataFrame) -> Dict:
         return {
-            "most_profitable_pair": df.groupby('symbol')['profit'].sum().idxmax(),
-            "least_profitable_pair": df.groupby('symbol')['profit'].sum().idxmin(),
+            # Единица торговли арбитража — путь (trades.path), отдельной пары у сделки нет
+            "most_profitable_pair": df.groupby('path')['profit'].sum().idxmax(),
+            "least_profitable_pair": df.groupby('path')['profit'].sum().idxmin(),
             "best_day": df.resample('D')['profit'].sum().idxmax().strftime('%Y-%m-%d'),
             "worst_day": df.resample('D')['profit'].sum().idxmin().strftime('%Y-%m-%d'),
             "best_hour": df.groupby(df.index.hour)['profit'].mean().idxmax(),
@@ -160,7 +162,7 @@ class AdvancedReporting:
         }
 
     def analyze_trade_size(self, df: pd.DataFrame) -> Dict:
-        df['trade_size'] = df['entry_price'] * df['quantity']
+        df['trade_size'] = df['volume']
         size_groups = pd.qcut(df['trade_size'], q=5)
         size_performance = df.groupby(size_groups)['profit'].mean()
         
@@ -171,6 +173,9 @@ class AdvancedReporting:
         }
 
     def analyze_market_conditions(self, df: pd.DataFrame) -> Dict:
+        # Рыночные цены (close) в сделках не хранятся
+        if 'close' not in df:
+            return {}
         df['market_trend'] = np.where(df['close'] > df['close'].shift(20), 'bullish', 'bearish')
         df['volatility'] = df['close'].pct_change().rolling(window=20).std()
         volatility_groups = pd.qcut(df['volatility'], q=3, labels=['low', 'medium', 'high'])
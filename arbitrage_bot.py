@@ -1,10 +1,16 @@
 import asyncio
+import math
+import time
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
 from config import Config
 from binance_api import BinanceAPI
+from market_stream import MarketDataStream
+from arbitrage_logic import ArbitrageLogic, cycle_monitor
+from session_data import SessionData
 from database_manager import DatabaseManager
 from trade_executor import TradeExecutor
+from risk_manager import RiskManager
 from notification_manager import NotificationManager
 from performance_monitor import PerformanceMonitor
 from external_data_provider import ExternalDataProvider
@@ -14,21 +20,35 @@ from dex_integration import DEXIntegration
 from auto_trading import AutoTrader
 from defi_integration import DeFiIntegration
 from advanced_analytics import AdvancedAnalytics
+from opportunity_store import OpportunityRegistry
+from fill_simulator import FillSimulator, BUY, SELL
 from buttons import get_main_menu, get_settings_menu
 from help_texts import HELP_TEXT, OPPORTUNITY_HELP, AUTO_TRADING_HELP, DEFI_HELP, ADVANCED_REPORT_HELP
 import logging
 import traceback
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# Пары, по которым держатся локальные стаканы из потока, если в конфиге не задан STREAM_SYMBOLS
+DEFAULT_STREAM_SYMBOLS = ['BTCUSDT', 'ETHUSDT', 'ETHBTC', 'BNBUSDT', 'BNBBTC', 'BNBETH']
+
 class ArbitrageBot:
     def __init__(self, config: Config):
         self.config = config
-        self.application = Application.builder().token(config.TELEGRAM_BOT_TOKEN).build()
+        self.application = (
+            Application.builder()
+            .token(config.TELEGRAM_BOT_TOKEN)
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+            .build()
+        )
         self.binance_api = BinanceAPI(config.BINANCE_API_KEY, config.BINANCE_API_SECRET)
         self.db_manager = DatabaseManager(config.DATABASE_URL)
-        self.trade_executor = TradeExecutor(self.binance_api, self.db_manager)
         self.notification_manager = NotificationManager(self.application.bot)
+        self.risk_manager = RiskManager(getattr(config, 'INITIAL_BALANCE', 1000.0))
+        self.trade_executor = TradeExecutor(self.binance_api, self.risk_manager, self.db_manager, self.notification_manager)
+        self.trade_executor.add_exchange(self.binance_api.exchange_name, self.binance_api)
         self.performance_monitor = PerformanceMonitor(self.db_manager)
         self.external_data_provider = ExternalDataProvider()
         self.security_manager = SecurityManager(self.db_manager)
@@ -37,6 +57,32 @@ class ArbitrageBot:
         self.auto_trader = AutoTrader(self, config.AUTO_TRADER_CONFIG)
         self.defi_integration = DeFiIntegration(config.DEFI_CONFIG)
         self.advanced_analytics = AdvancedAnalytics(self.db_manager)
+        self.opportunity_registry = OpportunityRegistry(ttl=getattr(config, 'OPPORTUNITY_TTL', 60.0))
+        self.fill_simulator = FillSimulator(fee_rate=getattr(config, 'TAKER_FEE', 0.001))
+        # Стаканы и лучшие цены из WebSocket-потока: мониторинг позиций работает по событиям, а не опросом REST
+        self.market_stream = MarketDataStream(self.binance_api, getattr(config, 'STREAM_SYMBOLS', DEFAULT_STREAM_SYMBOLS))
+        self.trade_executor.set_market_stream(self.market_stream, self.binance_api.exchange_name)
+        # Непрерывный поиск циклов из N ног работает фоновой задачей между post_init и post_shutdown
+        self.arbitrage_logic = ArbitrageLogic(SessionData(), self.binance_api, market_stream=self.market_stream,
+                                              fee_rate=getattr(config, 'TAKER_FEE', 0.001))
+        self.cycle_monitor_task = None
+
+    async def post_init(self, application: Application):
+        await self.binance_api.start()
+        await self.binance_api.metadata.start()
+        await self.market_stream.start()
+        self.cycle_monitor_task = asyncio.create_task(
+            cycle_monitor(self.arbitrage_logic, getattr(self.config, 'CYCLE_SCAN_INTERVAL', 1.0)))
+
+    async def post_shutdown(self, application: Application):
+        if self.cycle_monitor_task is not None:
+            self.cycle_monitor_task.cancel()
+            await asyncio.gather(self.cycle_monitor_task, return_exceptions=True)
+            self.cycle_monitor_task = None
+        self.arbitrage_logic.close()
+        await self.market_stream.stop()
+        await self.binance_api.metadata.stop()
+        await self.binance_api.close()
 
     def setup_handlers(self):
         self.application.add_handler(CommandHandler("start", self.start))
@@ -107,33 +153,88 @@ class ArbitrageBot:
             response = "В данный момент арбитражных возможностей не найдено."
         await update.message.reply_text(response)
 
-    async def find_arbitrage_opportunities(self):
+    async def find_arbitrage_opportunities(self, snapshot_mode: bool = True):
         markets = await self.binance_api.get_markets()
+        if snapshot_mode:
+            markets = await self.filter_markets_by_snapshot(markets)
+        orderbooks = await asyncio.gather(*(self.binance_api.get_orderbook(market['symbol']) for market in markets))
+        candidates = [(market, orderbook) for market, orderbook in zip(markets, orderbooks)
+                      if self.calculate_arbitrage(market, orderbook)]
         opportunities = []
-        for market in markets:
-            orderbook = await self.binance_api.get_orderbook(market['symbol'])
-            opportunity = self.calculate_arbitrage(market, orderbook)
-            if opportunity:
-                ml_prediction = await self.ml_predictor.predict_opportunity(opportunity)
-                opportunity['ml_prediction'] = ml_prediction
-                opportunities.append(opportunity)
+        snapshot = {}
+        for opportunity in self.size_by_depth(candidates):
+            ml_prediction = await self.ml_predictor.predict_opportunity(opportunity)
+            opportunity['ml_prediction'] = ml_prediction
+            opportunities.append(opportunity)
+            snapshot[opportunity['symbol']] = {'bid': opportunity['bid'], 'ask': opportunity['ask']}
         
         opportunities.sort(key=lambda x: x['profit'], reverse=True)
+        self.opportunity_registry.register(opportunities, self.binance_api.exchange_name, snapshot)
+        return opportunities
+
+    async def filter_markets_by_snapshot(self, markets):
+        # Первый этап: один bulk-запрос bookTicker вместо стакана по каждой паре.
+        # Полная глубина запрашивается только для прошедших фильтр пар
+        snapshot = await self.binance_api.get_book_tickers()
+        return [market for market in markets
+                if market['symbol'] in snapshot and self.calculate_arbitrage(market, snapshot[market['symbol']])]
+
+    def size_by_depth(self, candidates):
+        # Кандидаты с выгодным верхом стакана пересчитываются по всей глубине одним пакетом:
+        # покупка по asks и продажа по bids, размер — максимально прибыльный в пределах TRADE_AMOUNT
+        if not candidates:
+            return []
+        books = {market['symbol']: orderbook for market, orderbook in candidates}
+        batch = self.fill_simulator.build_batch([[(symbol, BUY), (symbol, SELL)] for symbol in books], books)
+        sized = self.fill_simulator.max_profitable_size(batch, max_size=self.config.TRADE_AMOUNT)
+        opportunities = []
+        for i, (market, orderbook) in enumerate(candidates):
+            if not sized['profitable'][i]:
+                continue
+            size = float(sized['size'][i])
+            opportunities.append({
+                'id': f"{market['symbol']}_{int(time.time())}",
+                'symbol': market['symbol'],
+                'profit': float(sized['profit'][i]),
+                'profit_percent': float(sized['profit_percent'][i]) / 100,
+                'volume': size,
+                'bid': float(orderbook['bids'][0][0]),
+                'ask': float(orderbook['asks'][0][0]),
+                'vwap_buy': float(sized['vwap'][i, 0]),
+                'vwap_sell': float(sized['vwap'][i, 1]),
+                'slippage': float(np.nansum(sized['slippage'][i])),
+            })
         return opportunities
 
     def calculate_arbitrage(self, market, orderbook):
-        best_bid = orderbook['bids'][0][0]
-        best_ask = orderbook['asks'][0][0]
-        spread = (best_bid - best_ask) / best_ask
+        if len(orderbook['bids']) == 0 or len(orderbook['asks']) == 0:
+            return None
+        best_bid = float(orderbook['bids'][0][0])
+        best_ask = float(orderbook['asks'][0][0])
+        # Исполнимая прибыль: покупка по ask и продажа по bid с комиссией тейкера на обеих ногах,
+        # количество округляется вниз до stepSize и проверяется по minQty/minNotional
+        fee = getattr(self.config, 'TAKER_FEE', 0.001)
+        quantity = self.config.TRADE_AMOUNT / best_ask
+        info = self.binance_api.metadata.get_symbol(market['symbol'])
+        if info is not None:
+            if info.step_size > 0:
+                quantity = math.floor(quantity / info.step_size) * info.step_size
+            if info.max_qty > 0:
+                quantity = min(quantity, info.max_qty)
+            if quantity <= 0 or quantity < info.min_qty or quantity * best_ask < info.min_notional:
+                return None
+        cost = quantity * best_ask * (1 + fee)
+        profit = quantity * best_bid * (1 - fee) - cost
+        spread = profit / cost if cost > 0 else 0
         
         if spread > self.config.MIN_SPREAD:
-            profit = spread * self.config.TRADE_AMOUNT
             return {
                 'id': f"{market['symbol']}_{int(time.time())}",
                 'symbol': market['symbol'],
                 'profit': profit,
                 'profit_percent': spread,
-                'volume': self.config.TRADE_AMOUNT,
+                'volume': quantity * best_ask,
+                'quantity': quantity,
                 'bid': best_bid,
                 'ask': best_ask
             }
@@ -150,29 +251,66 @@ class ArbitrageBot:
         if not opportunity:
             await update.message.reply_text("Неверный ID возможности или возможность устарела.")
             return
+        opportunity = await self.revalidate_opportunity(opportunity_id)
+        if not opportunity:
+            await update.message.reply_text("Цены изменились, возможность больше не выгодна.")
+            return
 
-        result = await self.trade_executor.execute_arbitrage(opportunity)
+        # Спред одной пары исполняется как путь quote -> base -> quote: покупка по ask, продажа по bid
+        info = self.binance_api.metadata.get_symbol(opportunity['symbol'])
+        if info is None:
+            await update.message.reply_text(f"Пара {opportunity['symbol']} не найдена в метаданных биржи.")
+            return
+        exchange = opportunity['exchange']
+        path = f"{info.quote_asset}->{info.base_asset}->{info.quote_asset}"
+        result = await self.trade_executor.execute_arbitrage(
+            exchange, {**opportunity, 'path': path, 'user_id': user_id}, opportunity['volume'])
         if result['status'] == 'success':
             profit = result['profit']
             await update.message.reply_text(f"Арбитраж выполнен успешно. Прибыль: {profit:.2f} USDT")
-            await self.db_manager.add_trade(user_id, opportunity['symbol'], profit)
-            await self.notification_manager.send_trade_notification(user_id, opportunity['symbol'], profit)
+            await self.db_manager.add_trade(user_id, exchange, path, profit, result['size'])
+            await self.notification_manager.send_trade_execution(user_id, {
+                'id': result['trade_id'], 'path': path, 'volume': result['size'],
+                'expected_profit': opportunity['profit_percent'] * 100})
+        elif result['status'] == 'test':
+            await update.message.reply_text(result['message'])
         else:
             await update.message.reply_text(f"Ошибка при выполнении арбитража: {result['message']}")
 
     def get_opportunity_by_id(self, opportunity_id):
-        opportunities = self.find_arbitrage_opportunities()
-        return next((opp for opp in opportunities if opp['id'] == opportunity_id), None)
+        entry = self.opportunity_registry.get(opportunity_id)
+        return entry.opportunity if entry else None
+
+    async def revalidate_opportunity(self, opportunity_id):
+        # Перед исполнением перепроверяются только ноги этой возможности по свежим котировкам
+        entry = self.opportunity_registry.get(opportunity_id)
+        if entry is None:
+            return None
+        legs = list(entry.snapshot)
+        orderbooks = await asyncio.gather(*(self.binance_api.get_orderbook(symbol, limit=5) for symbol in legs))
+        fresh = None
+        for symbol, orderbook in zip(legs, orderbooks):
+            fresh = self.calculate_arbitrage({'symbol': symbol}, orderbook)
+            if fresh is None:
+                logger.info(f"Возможность {opportunity_id} больше не выгодна: {symbol} "
+                            f"было {entry.snapshot[symbol]}, стало bid={orderbook['bids'][:1]} ask={orderbook['asks'][:1]}")
+                self.opportunity_registry.discard(opportunity_id)
+                return None
+        fresh['id'] = opportunity_id
+        fresh['exchange'] = entry.exchange
+        fresh['ml_prediction'] = entry.opportunity.get('ml_prediction')
+        return fresh
 
     async def show_trade_history(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
-        history = await self.db_manager.get_user_trade_history(user_id)
+        # Читается только показываемая страница, а не вся история пользователя
+        history = await self.db_manager.get_user_trade_history(user_id, limit=10)
         if history:
             response = "История торговли:\n\n"
-            for trade in history[:10]:
-                response += f"Дата: {trade['timestamp']}\n"
-                response += f"Пара: {trade['symbol']}\n"
-                response += f"Прибыль: {trade['profit']:.2f} USDT\n\n"
+            for trade_id, created_at, path, profit, status in history:
+                response += f"Дата: {created_at}\n"
+                response += f"Путь: {path}\n"
+                response += f"Прибыль: {profit or 0.0:.2f} USDT\n\n"
         else:
             response = "История торговли пуста."
         await update.message.reply_text(response)
@@ -360,6 +498,13 @@ class ArbitrageBot:
             return
 
         metrics = await self.performance_monitor.get_real_time_metrics(user_id)
+        # Баланс — свободный USDT на счете Binance
+        balances = await self.binance_api.get_account_balance()
+        metrics['current_balance'] = sum(float(b['free']) for b in balances if b['asset'] == 'USDT')
+        # Открытые позиции переоцениваются по текущим курсам одной операцией на биржу
+        positions = self.trade_executor.get_position_metrics(user_id)
+        metrics['open_positions'] = positions['open_positions']
+        metrics['unrealized_pnl'] = positions['unrealized_pnl']
         response = "Метрики в реальном времени:\n\n"
         response += f"Текущий баланс: {metrics['current_balance']:.2f} USDT\n"
         response += f"Открытые позиции: {metrics['open_positions']}\n"
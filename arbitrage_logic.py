@@ -1,108 +1,237 @@
 import logging
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 import asyncio
+import time
 from datetime import datetime, timedelta
+import numpy as np
+from triangle_index import TriangleIndex
+from cycle_search import NegativeCycleSearch
+from market_table import MarketTable
+from opportunity_store import OpportunityStore
+from sharded_scan import ShardedScanner
+from fill_simulator import FillSimulator, legs_for_path
 
 logger = logging.getLogger(__name__)
 
 class ArbitrageLogic:
-    def __init__(self, session_data, binance_api):
+    def __init__(self, session_data, binance_api, market_stream=None, fee_rate=0.001, max_cycle_legs=4,
+                 scan_workers=0, volume_fraction=0.01):
         self.session_data = session_data
         self.binance_api = binance_api
-        self.opportunities = {}
+        self.market_stream = market_stream
+        self.fee_rate = fee_rate
+        self.max_cycle_legs = max_cycle_legs
+        # Доля 24ч объема пары, которую можно занять одной ногой
+        self.volume_fraction = volume_fraction
+        self.cycle_search = None
+        self.opportunities = OpportunityStore(capacity=10, ttl=300.0)
         self.last_update = {}
+        self.triangle_index = None
+        # scan_workers > 0 включает скан треугольников шардами в пуле процессов
+        self.scan_workers = scan_workers
+        self.sharded_scanner = None
+        self.fill_simulator = FillSimulator(fee_rate)
 
-    async def find_triangular_arbitrage_opportunities(self, prices, volumes, graph):
+    @property
+    def market_table(self):
+        # Общая с TradeExecutor таблица цен по интернированным парам
+        return self.binance_api.metadata.get_market_table()
+
+    def get_triangle_index(self):
+        # Треугольники перечисляются один раз на версию метаданных биржи
+        table = self.market_table
+        if self.triangle_index is None or self.triangle_index.table is not table:
+            self.triangle_index = TriangleIndex(table)
+        return self.triangle_index
+
+    async def find_triangular_arbitrage_opportunities(self, prices, volumes):
+        await self.binance_api.metadata.ensure_fresh()
+        index = self.get_triangle_index()
+        index.table.load(prices, volumes)
+        if self.scan_workers:
+            scanner = self.get_sharded_scanner()
+            cycle_ids, result = await scanner.scan(self.session_data.min_profit_percent,
+                                                   self.session_data.min_volume,
+                                                   self.session_data.min_volatility_percent,
+                                                   self.session_data.max_volatility_percent)
+            return self._collect_opportunities(index, cycle_ids, result)
+        result = index.evaluate()
+        return self._collect_opportunities(index, np.arange(len(index)), result)
+
+    def get_sharded_scanner(self):
+        index = self.get_triangle_index()
+        if self.sharded_scanner is None or self.sharded_scanner.index is not index:
+            if self.sharded_scanner is not None:
+                self.sharded_scanner.close()
+            self.sharded_scanner = ShardedScanner(index, self.scan_workers)
+        return self.sharded_scanner
+
+    def close(self):
+        if self.sharded_scanner is not None:
+            self.sharded_scanner.close()
+            self.sharded_scanner = None
+
+    def rescore_pairs(self, updates, volumes=None):
+        # Инкрементальный пересчет: пересчитываются только циклы, содержащие изменившиеся пары
+        index = self.get_triangle_index()
+        changed = index.table.update(updates, volumes)
+        cycle_ids = index.cycles_for_pairs(changed)
+        if len(cycle_ids) == 0:
+            return []
+        result = index.evaluate(cycle_ids)
+        # Затронутые циклы, которые больше не проходят фильтры, убираются из набора возможностей
+        exchange = self.binance_api.exchange_name
+        current = self.opportunities.items(exchange)
+        if current:
+            stale = np.isin([op.get('cycle_id', -1) for op in current], cycle_ids)
+            for op, is_stale in zip(current, stale):
+                if is_stale and op.get('index_version') == index.version:
+                    self.opportunities.remove(exchange, op['path'])
+        return self._collect_opportunities(index, cycle_ids, result)
+
+    def _collect_opportunities(self, index, cycle_ids, result):
+        selected = index.filter(result,
+                                self.session_data.min_profit_percent,
+                                self.session_data.min_volume,
+                                self.session_data.min_volatility_percent,
+                                self.session_data.max_volatility_percent)
+        # Кандидаты, не исполнимые после комиссий и фильтров биржи, отбрасываются до уведомлений
+        execution = index.table.executable(index.leg_edge[cycle_ids[selected]], self.volume_fraction)
+        keep = execution['executable'] & (execution['net_profit'] > self.session_data.min_profit_percent)
+        timestamp = datetime.now()
+        opportunities = []
+        for i, net_profit, max_size in zip(selected[keep], execution['net_profit'][keep], execution['max_size'][keep]):
+            opportunity = {
+                'path': '->'.join(index.path(cycle_ids[i])),
+                'profit': float(result['profit'][i]),
+                'net_profit': float(net_profit),
+                'max_size': float(max_size),
+                'volume': float(result['volume'][i]),
+                'volatility': float(result['volatility'][i]),
+                'timestamp': timestamp,
+                'cycle_id': int(cycle_ids[i]),
+                'index_version': index.version
+            }
+            opportunities.append(opportunity)
+            self.update_opportunity(opportunity)
+        return opportunities
+
+    async def find_cycle_arbitrage_opportunities(self, prices, volumes, graph=None):
+        # Циклы произвольной длины (до max_cycle_legs) с учетом комиссии на каждой ноге
+        if graph is not None:
+            engine = NegativeCycleSearch(MarketTable.from_graph(graph), self.fee_rate, self.max_cycle_legs)
+        else:
+            await self.binance_api.metadata.ensure_fresh()
+            table = self.market_table
+            if self.cycle_search is None or self.cycle_search.table is not table:
+                self.cycle_search = NegativeCycleSearch(table, self.fee_rate, self.max_cycle_legs)
+            engine = self.cycle_search
+        table = engine.table
+        table.load(prices, volumes)
+        timestamp = datetime.now()
         opportunities = []
-        for start_symbol in graph:
-            for mid_symbol in graph[start_symbol]:
-                for end_symbol in graph[mid_symbol]:
-                    if end_symbol == start_symbol:
-                        try:
-                            path = [start_symbol, mid_symbol, end_symbol]
-                            if not all(self.get_price(prices, s1, s2) for s1, s2 in zip(path, path[1:])):
-                                continue
-                            profit = self.calculate_profit(path, prices)
-                            if profit > self.session_data.min_profit_percent:
-                                volume = min(self.get_volume(volumes, s1, s2) for s1, s2 in zip(path, path[1:]))
-                                if volume >= self.session_data.min_volume:
-                                    volatility = self.calculate_volatility(path, prices)
-                                    if self.session_data.min_volatility_percent <= volatility <= self.session_data.max_volatility_percent:
-                                        opportunity = {
-                                            'path': '->'.join(path),
-                                            'profit': profit,
-                                            'volume': volume,
-                                            'volatility': volatility,
-                                            'timestamp': datetime.now()
-                                        }
-                                        opportunities.append(opportunity)
-                                        self.update_opportunity(opportunity)
-                        except Exception as e:
-                            logger.error(f"Ошибка при анализе пути {start_symbol}->{mid_symbol}->{end_symbol}: {str(e)}")
+        for cycle_edges, total_weight in engine.search():
+            profit = (np.exp(-total_weight) - 1) * 100
+            if profit <= self.session_data.min_profit_percent:
+                continue
+            volume = float(table.volume[cycle_edges].min())
+            leg_volatility = table.volatility[cycle_edges]
+            volatility = float(np.nanmax(leg_volatility)) if not np.isnan(leg_volatility).all() else 0
+            if volume < self.session_data.min_volume:
+                continue
+            if not self.session_data.min_volatility_percent <= volatility <= self.session_data.max_volatility_percent:
+                continue
+            execution = table.executable(np.array([cycle_edges]), self.volume_fraction)
+            if not execution['executable'][0] or execution['net_profit'][0] <= self.session_data.min_profit_percent:
+                continue
+            opportunity = {
+                'path': '->'.join(engine.path(cycle_edges)),
+                'profit': float(profit),
+                'net_profit': float(execution['net_profit'][0]),
+                'max_size': float(execution['max_size'][0]),
+                'volume': volume,
+                'volatility': volatility,
+                'timestamp': timestamp
+            }
+            opportunities.append(opportunity)
+            self.update_opportunity(opportunity)
         return opportunities
 
-    def get_price(self, prices, symbol1, symbol2):
-        pair = f"{symbol1}{symbol2}"
-        if pair in prices and 'price' in prices[pair]:
-            return prices[pair]['price']
-        pair = f"{symbol2}{symbol1}"
-        if pair in prices and 'price' in prices[pair]:
-            return 1 / prices[pair]['price']
-        return None
-
-    def get_volume(self, volumes, symbol1, symbol2):
-        pair = f"{symbol1}{symbol2}"
-        if pair in volumes:
-            return volumes[pair]
-        pair = f"{symbol2}{symbol1}"
-        if pair in volumes:
-            return volumes[pair]
-        return 0
-
-    def calculate_profit(self, path, prices):
-        rate = 1
-        for i in range(len(path) - 1):
-            price = self.get_price(prices, path[i], path[i+1])
-            if price is None:
-                return 0
-            rate *= price
-        return (rate - 1) * 100
-
-    def calculate_volatility(self, path, prices):
-        volatilities = []
-        for i in range(len(path) - 1):
-            pair = f"{path[i]}{path[i+1]}"
-            if pair in prices and 'volatility' in prices[pair]:
-                volatilities.append(prices[pair]['volatility'])
-            else:
-                pair = f"{path[i+1]}{path[i]}"
-                if pair in prices and 'volatility' in prices[pair]:
-                    volatilities.append(prices[pair]['volatility'])
-        return max(volatilities) if volatilities else 0
+    async def size_by_depth(self, opportunities, max_size=None):
+        # Пути пересчитываются по полной глубине стаканов всех ног одним пакетом:
+        # VWAP и проскальзывание по ногам, максимально прибыльный размер во входном активе пути
+        table = self.market_table
+        legs = [legs_for_path(table, op['path'].split('->')) for op in opportunities]
+        sized = [(op, path_legs) for op, path_legs in zip(opportunities, legs) if path_legs]
+        if not sized:
+            return []
+        symbols = sorted({symbol for _, path_legs in sized for symbol, _ in path_legs})
+        source = self.market_stream if self.market_stream is not None else self.binance_api
+        books = dict(zip(symbols, await asyncio.gather(*(source.get_orderbook(symbol) for symbol in symbols))))
+        batch = self.fill_simulator.build_batch([path_legs for _, path_legs in sized], books)
+        result = self.fill_simulator.max_profitable_size(batch, max_size)
+        profitable = []
+        for i, (opportunity, _) in enumerate(sized):
+            if not result['profitable'][i]:
+                continue
+            opportunity['fill_size'] = float(result['size'][i])
+            opportunity['fill_profit'] = float(result['profit_percent'][i])
+            opportunity['vwap'] = result['vwap'][i, :len(batch.legs[i])].tolist()
+            opportunity['slippage'] = result['slippage'][i, :len(batch.legs[i])].tolist()
+            profitable.append(opportunity)
+        return profitable
+
+    def get_price(self, symbol1, symbol2):
+        table = self.market_table
+        edge = table.edge_id(symbol1, symbol2)
+        if edge < 0 or not table.rate[edge] > 0:
+            return None
+        return float(table.rate[edge])
+
+    def get_volume(self, symbol1, symbol2):
+        table = self.market_table
+        edge = table.edge_id(symbol1, symbol2)
+        return float(table.volume[edge]) if edge >= 0 else 0
+
+    def calculate_profit(self, path):
+        # Чистая прибыль пути в % после комиссии тейкера на каждой ноге
+        table = self.market_table
+        edges = table.path_edges(path)
+        if (edges < 0).any():
+            return 0
+        rates = table.rate[edges]
+        if not (rates > 0).all():
+            return 0
+        fees = table.taker_fee[table.edge_pair[edges]]
+        return (float(np.prod(rates * (1 - fees))) - 1) * 100
+
+    def calculate_volatility(self, path):
+        table = self.market_table
+        edges = table.path_edges(path)
+        volatilities = table.volatility[edges[edges >= 0]]
+        volatilities = volatilities[~np.isnan(volatilities)]
+        return float(volatilities.max()) if len(volatilities) else 0
 
     def update_opportunity(self, opportunity):
         exchange = self.binance_api.exchange_name
-        if exchange not in self.opportunities:
-            self.opportunities[exchange] = []
-        self.opportunities[exchange] = [op for op in self.opportunities[exchange] if (datetime.now() - op['timestamp']).total_seconds() < 300]
-        self.opportunities[exchange].append(opportunity)
-        self.opportunities[exchange].sort(key=lambda x: x['profit'], reverse=True)
-        self.opportunities[exchange] = self.opportunities[exchange][:10]
-        self.last_update[exchange] = datetime.now()
+        self.opportunities.push(exchange, opportunity)
+        self.last_update[exchange] = time.monotonic()
 
     async def get_last_opportunity(self, exchange):
-        if exchange not in self.last_update or (datetime.now() - self.last_update[exchange]).total_seconds() > 60:
+        if exchange not in self.last_update or time.monotonic() - self.last_update[exchange] > 60:
             await self.update_opportunities(exchange)
-        if exchange in self.opportunities and self.opportunities[exchange]:
-            return self.opportunities[exchange][0]
-        return None
+        return self.opportunities.best(exchange)
+
+    def get_opportunities(self, exchange):
+        return self.opportunities.items(exchange)
 
     async def update_opportunities(self, exchange):
         try:
-            prices = await self.binance_api.get_prices()
+            # Локальные стаканы из потока читаются без сетевой задержки
+            source = self.market_stream if self.market_stream is not None else self.binance_api
+            prices = await source.get_prices()
             volumes = await self.binance_api.get_24h_volumes()
-            graph = await self.binance_api.build_market_graph()
-            await self.find_triangular_arbitrage_opportunities(prices, volumes, graph)
+            await self.find_triangular_arbitrage_opportunities(prices, volumes)
         except Exception as e:
             logger.error(f"Ошибка при обновлении возможностей для биржи {exchange}: {str(e)}")
 
@@ -115,4 +244,15 @@ class ArbitrageLogic:
                f"Время: {opportunity['timestamp'].strftime('%Y-%m-%d %H:%M:%S')}"
         keyboard = [[InlineKeyboardButton("Выполнить арбитраж", callback_data=f"execute_arbitrage_{opportunity['path']}")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        return await context.bot.send_message(chat_id=user_id, text=text, reply_markup=reply_markup)
\ No newline at end of file
+        return await context.bot.send_message(chat_id=user_id, text=text, reply_markup=reply_markup)
+
+async def cycle_monitor(arbitrage_logic, interval=1.0):
+    while True:
+        try:
+            source = arbitrage_logic.market_stream if arbitrage_logic.market_stream is not None else arbitrage_logic.binance_api
+            prices = await source.get_prices()
+            volumes = await arbitrage_logic.binance_api.get_24h_volumes()
+            await arbitrage_logic.find_cycle_arbitrage_opportunities(prices, volumes)
+        except Exception as e:
+            logger.error(f"Ошибка поиска циклов: {str(e)}")
+        await asyncio.sleep(interval)
\ No newline at end of file
@@ -0,0 +1,1014 @@
+import asyncio
+import json
+import random
+import time
+import logging
+import os
+import tempfile
+import tracemalloc
+from typing import Dict, List
+import aiohttp
+import aiosqlite
+import numpy as np
+from aiohttp import web
+from binance_api import BinanceAPI
+from market_stream import MarketDataStream
+from rate_limiter import WeightRateLimiter
+from market_table import MarketTable
+from session_data import SessionData
+from triangle_index import TriangleIndex
+from opportunity_store import OpportunityStore
+from sharded_scan import ShardedScanner
+from fill_simulator import FillSimulator, BUY, SELL
+from payload_decoder import decode_depth, decode_klines
+from multi_exchange_manager import MultiExchangeManager
+from simulated_exchange import SimulatedExchange, SimulatedFeed
+from trade_executor import TradeExecutor
+from database_manager import DatabaseManager
+from leg_executor import LegExecutor
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Локальные заглушки биржи и замеры производительности.
+# Запуск: python benchmarks.py
+
+DEPTH_PAYLOAD = {
+    'lastUpdateId': 1,
+    'bids': [[f"{100 - i * 0.01:.2f}", "1.0"] for i in range(100)],
+    'asks': [[f"{100 + i * 0.01:.2f}", "1.0"] for i in range(100)],
+}
+
+
+class StandInServer:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.host = host
+        self.port = port
+        self.app = web.Application()
+        self.app.router.add_get('/api/v3/depth', self.handle_depth)
+        self.runner = None
+
+    async def handle_depth(self, request: web.Request) -> web.Response:
+        return web.json_response(DEPTH_PAYLOAD)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+
+def record_depth_stream(symbol: str = 'BTCUSDT', events: int = 5000, seed: int = 42) -> List[Dict]:
+    # Синтетическая запись потока: чередование depthUpdate и bookTicker с непрерывными U/u
+    rng = random.Random(seed)
+    messages = []
+    update_id = 100
+    for _ in range(events):
+        first_id = update_id + 1
+        update_id += rng.randint(1, 3)
+        bids = [[f"{100 - rng.randint(1, 50) * 0.01:.2f}", f"{rng.choice([0, rng.uniform(0.1, 5)]):.4f}"] for _ in range(3)]
+        asks = [[f"{100 + rng.randint(1, 50) * 0.01:.2f}", f"{rng.choice([0, rng.uniform(0.1, 5)]):.4f}"] for _ in range(3)]
+        messages.append({'stream': f"{symbol.lower()}@depth@100ms",
+                         'data': {'e': 'depthUpdate', 's': symbol, 'U': first_id, 'u': update_id, 'b': bids, 'a': asks}})
+    return messages
+
+
+class ReplayExchangeServer(StandInServer):
+    # Воспроизводит записанный поток по WebSocket и отдает снимок стакана,
+    # согласованный с уже отправленными событиями. drop_indexes имитирует потерю сообщений
+    def __init__(self, messages: List[Dict], drop_indexes=(), host: str = '127.0.0.1', port: int = 0):
+        super().__init__(host, port)
+        self.messages = messages
+        self.drop_indexes = set(drop_indexes)
+        self.books: Dict[str, Dict] = {}
+        self.app.router.add_get('/stream', self.handle_stream)
+
+    def _apply(self, data: Dict):
+        book = self.books.setdefault(data['s'], {'lastUpdateId': data['U'] - 1, 'bids': {}, 'asks': {}})
+        for side, key in (('bids', 'b'), ('asks', 'a')):
+            for price, qty in data[key]:
+                if float(qty) == 0:
+                    book[side].pop(price, None)
+                else:
+                    book[side][price] = qty
+        book['lastUpdateId'] = data['u']
+
+    async def handle_depth(self, request: web.Request) -> web.Response:
+        book = self.books.get(request.query.get('symbol'))
+        if book is None:
+            return web.json_response({'lastUpdateId': 0, 'bids': [], 'asks': []})
+        return web.json_response({
+            'lastUpdateId': book['lastUpdateId'],
+            'bids': sorted(book['bids'].items(), key=lambda x: -float(x[0])),
+            'asks': sorted(book['asks'].items(), key=lambda x: float(x[0])),
+        })
+
+    async def handle_stream(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        for i, message in enumerate(self.messages):
+            self._apply(message['data'])
+            if i not in self.drop_indexes:
+                await ws.send_str(json.dumps(message))
+            if i % 100 == 0:
+                await asyncio.sleep(0.001)
+        await ws.receive()
+        return ws
+
+
+async def _run_concurrently(fetch, total: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await fetch()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return total / (time.perf_counter() - started)
+
+
+async def bench_http_session(total: int = 2000, concurrency: int = 20):
+    server = StandInServer()
+    await server.start()
+    url = f"{server.base_url}/api/v3/depth"
+    try:
+        # Старый путь: новая ClientSession (и новое соединение) на каждый запрос
+        async def fetch_per_call_session():
+            async with aiohttp.ClientSession() as session:
+                async with session.get(url, params={'symbol': 'BTCUSDT', 'limit': 100}) as response:
+                    await response.json()
+
+        before = await _run_concurrently(fetch_per_call_session, total, concurrency)
+
+        # Лимитер без ограничений: измеряем только транспорт
+        unlimited = WeightRateLimiter(weight_limit=10 ** 9, burst=10 ** 9)
+        async with BinanceAPI('key', 'secret', base_url=server.base_url, rate_limiter=unlimited) as api:
+            after = await _run_concurrently(lambda: api.get_orderbook('BTCUSDT'), total, concurrency)
+    finally:
+        await server.stop()
+
+    print(f"HTTP session: per-call {before:.0f} req/s, pooled {after:.0f} req/s ({after / before:.1f}x)")
+    return {'before': before, 'after': after}
+
+
+async def bench_order_book_stream(events: int = 5000):
+    messages = record_depth_stream(events=events)
+    server = ReplayExchangeServer(messages, drop_indexes=(events // 2,))
+    await server.start()
+    api = BinanceAPI('key', 'secret', base_url=server.base_url)
+    stream = MarketDataStream(api, ['BTCUSDT'], stream_url=f"ws://{server.host}:{server.port}", resync_delay=0.01)
+    try:
+        started = time.perf_counter()
+        await stream.start()
+        book = stream.books['BTCUSDT']
+        last_id = messages[-1]['data']['u']
+        while book.last_update_id < last_id and time.perf_counter() - started < 30:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        local = await stream.get_orderbook('BTCUSDT', limit=1000)
+        reference = server.books['BTCUSDT']
+        in_sync = (local is not None
+                   and {p: q for p, q in local['bids']} == {float(p): float(q) for p, q in reference['bids'].items()}
+                   and {p: q for p, q in local['asks']} == {float(p): float(q) for p, q in reference['asks'].items()})
+    finally:
+        await stream.stop()
+        await api.close()
+        await server.stop()
+
+    print(f"Order book stream: {events} events in {elapsed:.2f}s ({events / elapsed:.0f} msg/s), "
+          f"resyncs={book.resync_count}, in_sync={in_sync}")
+    return {'elapsed': elapsed, 'resyncs': book.resync_count, 'in_sync': in_sync}
+
+
+def synthetic_universe(pairs: int = 2000, assets: int = 250, seed: int = 7):
+    # Граф пар как у Binance: большинство котируется к нескольким базовым валютам (USDT, BTC, ...),
+    # цены согласованы с небольшим шумом
+    rng = random.Random(seed)
+    names = [f"A{i:03d}" for i in range(assets)]
+    hubs = names[:8]
+    values = {name: rng.uniform(0.01, 1000) for name in names}
+    markets, prices, volumes, seen = [], {}, {}, set()
+    while len(markets) < pairs:
+        if rng.random() < 0.8:
+            base, quote = rng.choice(names), rng.choice(hubs)
+        else:
+            base, quote = rng.sample(names, 2)
+        if base == quote:
+            continue
+        if (base, quote) in seen or (quote, base) in seen:
+            continue
+        seen.add((base, quote))
+        symbol = f"{base}{quote}"
+        markets.append({'symbol': symbol, 'base_asset': base, 'quote_asset': quote})
+        prices[symbol] = {'price': values[base] / values[quote] * rng.uniform(0.99, 1.01),
+                          'volatility': rng.uniform(0, 2)}
+        volumes[symbol] = rng.uniform(0, 100000)
+    return markets, prices, volumes
+
+
+def legacy_triangle_scan(paths: List[List[str]], prices: Dict, volumes: Dict, session: SessionData) -> int:
+    # Прежний путь ArbitrageLogic: строковые ключи пар в обеих ориентациях на каждую ногу каждого цикла
+    def get_price(s1, s2):
+        pair = f"{s1}{s2}"
+        if pair in prices and 'price' in prices[pair]:
+            return prices[pair]['price']
+        pair = f"{s2}{s1}"
+        if pair in prices and 'price' in prices[pair]:
+            return 1 / prices[pair]['price']
+        return None
+
+    def get_volume(s1, s2):
+        return volumes.get(f"{s1}{s2}", volumes.get(f"{s2}{s1}", 0))
+
+    def get_volatility(s1, s2):
+        quote = prices.get(f"{s1}{s2}") or prices.get(f"{s2}{s1}") or {}
+        return quote.get('volatility')
+
+    found = 0
+    for path in paths:
+        legs = list(zip(path, path[1:]))
+        rates = [get_price(s1, s2) for s1, s2 in legs]
+        if not all(rates):
+            continue
+        rate = 1
+        for r in rates:
+            rate *= r
+        profit = (rate - 1) * 100
+        if profit > session.min_profit_percent:
+            volume = min(get_volume(s1, s2) for s1, s2 in legs)
+            if volume >= session.min_volume:
+                volatilities = [v for v in (get_volatility(s1, s2) for s1, s2 in legs) if v is not None]
+                volatility = max(volatilities) if volatilities else 0
+                if session.min_volatility_percent <= volatility <= session.max_volatility_percent:
+                    found += 1
+    return found
+
+
+def bench_triangle_scan(pairs: int = 2000, repeats: int = 5):
+    markets, prices, volumes = synthetic_universe(pairs)
+    session = SessionData()
+
+    started = time.perf_counter()
+    index = TriangleIndex(MarketTable(markets))
+    build_time = time.perf_counter() - started
+    paths = [index.path(cycle_id) for cycle_id in range(len(index))]
+
+    started = time.perf_counter()
+    for _ in range(repeats):
+        legacy = legacy_triangle_scan(paths, prices, volumes, session)
+    before = (time.perf_counter() - started) / repeats
+
+    started = time.perf_counter()
+    for _ in range(repeats):
+        index.table.load(prices, volumes)
+        result = index.evaluate()
+        selected = index.filter(result, session.min_profit_percent, session.min_volume,
+                                session.min_volatility_percent, session.max_volatility_percent)
+    after = (time.perf_counter() - started) / repeats
+
+    print(f"Triangle scan: {pairs} pairs, {len(index)} cycles (index build {build_time * 1000:.0f} ms): "
+          f"dict loop {before * 1000:.1f} ms, vectorized {after * 1000:.1f} ms, "
+          f"matches={legacy == len(selected)} ({len(selected)} found)")
+
+    started = time.perf_counter()
+    execution = index.table.executable(index.leg_edge[selected])
+    executable = execution['executable'] & (execution['net_profit'] > session.min_profit_percent)
+    print(f"  executable-profit filter: {(time.perf_counter() - started) * 1000:.2f} ms, "
+          f"{int(executable.sum())} of {len(selected)} candidates left after fees")
+    return {'before': before, 'after': after}
+
+
+def bench_opportunity_store(inserts: int = 50000, paths: int = 500, seed: int = 3):
+    rng = random.Random(seed)
+    stream = [{'path': f"P{rng.randrange(paths)}", 'profit': rng.random(), 'timestamp': datetime.now()}
+              for _ in range(inserts)]
+
+    # Прежний update_opportunity: фильтр по datetime.now(), добавление, сортировка и обрезка на каждую вставку
+    started = time.perf_counter()
+    legacy = []
+    for opportunity in stream:
+        legacy = [op for op in legacy if (datetime.now() - op['timestamp']).total_seconds() < 300]
+        legacy.append(opportunity)
+        legacy.sort(key=lambda x: x['profit'], reverse=True)
+        legacy = legacy[:10]
+    before = time.perf_counter() - started
+
+    started = time.perf_counter()
+    store = OpportunityStore(capacity=10, ttl=300.0)
+    for opportunity in stream:
+        store.push('binance', opportunity)
+    after = time.perf_counter() - started
+
+    print(f"Opportunity store: {inserts} inserts, list rebuild {before / inserts * 1e6:.2f} us/insert, "
+          f"heap store {after / inserts * 1e6:.2f} us/insert, "
+          f"best={store.best('binance')['profit']:.4f} (list with duplicates {legacy[0]['profit']:.4f})")
+    return {'before': before, 'after': after}
+
+
+async def bench_sharded_scan(pairs: int = 5000, assets: int = 400, repeats: int = 20):
+    markets, prices, volumes = synthetic_universe(pairs, assets)
+    session = SessionData()
+    thresholds = (session.min_profit_percent, session.min_volume,
+                  session.min_volatility_percent, session.max_volatility_percent)
+    index = TriangleIndex(MarketTable(markets))
+    index.table.load(prices, volumes)
+
+    started = time.perf_counter()
+    for _ in range(repeats):
+        expected = index.filter(index.evaluate(), *thresholds)
+    single = repeats / (time.perf_counter() - started)
+    print(f"Sharded scan: {pairs} pairs, {len(index)} cycles, in-process {single:.0f} scans/s")
+
+    cores = os.cpu_count() or 1
+    for workers in sorted({1, 2, 4, cores}):
+        scanner = ShardedScanner(index, workers)
+        try:
+            cycle_ids, _ = await scanner.scan(*thresholds)
+            started = time.perf_counter()
+            for _ in range(repeats):
+                await scanner.scan(*thresholds)
+            rate = repeats / (time.perf_counter() - started)
+        finally:
+            scanner.close()
+        print(f"  {workers} workers ({cores} cores): {rate:.0f} scans/s, "
+              f"matches={np.array_equal(np.sort(cycle_ids), expected)}")
+
+
+def synthetic_books(symbols: int = 300, levels: int = 100, seed: int = 11) -> Dict[str, Dict]:
+    rng = random.Random(seed)
+    books = {}
+    for i in range(symbols):
+        mid = rng.uniform(0.1, 1000)
+        tick = mid * 0.0002
+        books[f"S{i:03d}"] = {
+            'bids': [[mid - tick * (k + rng.random()), rng.uniform(0.1, 5)] for k in range(levels)],
+            'asks': [[mid + tick * (k + rng.random()), rng.uniform(0.1, 5)] for k in range(levels)],
+        }
+    return books
+
+
+def bench_fill_simulation(paths: int = 500, symbols: int = 300):
+    books = synthetic_books(symbols)
+    names = sorted(books)
+    rng = random.Random(5)
+    legs = [[(rng.choice(names), rng.choice((BUY, SELL))) for _ in range(3)] for _ in range(paths)]
+    simulator = FillSimulator()
+
+    started = time.perf_counter()
+    batch = simulator.build_batch(legs, books)
+    build = time.perf_counter() - started
+    started = time.perf_counter()
+    result = simulator.max_profitable_size(batch)
+    sizing = time.perf_counter() - started
+
+    # Поштучный прогон тех же путей для сравнения с пакетным
+    started = time.perf_counter()
+    for path_legs in legs[:50]:
+        simulator.max_profitable_size(simulator.build_batch([path_legs], books))
+    single = (time.perf_counter() - started) / 50
+
+    print(f"Fill simulation: {paths} 3-leg paths over {symbols} books x 100 levels: "
+          f"batch build {build * 1000:.1f} ms, sizing {sizing * 1000:.1f} ms "
+          f"({(build + sizing) / paths * 1e6:.0f} us/path vs {single * 1e6:.0f} us/path one by one), "
+          f"{int(result['feasible'].sum())} feasible")
+
+
+def synthetic_payloads(levels: int = 1000, candles: int = 1000, seed: int = 13):
+    rng = random.Random(seed)
+    depth = {
+        'lastUpdateId': 1027024,
+        'bids': [[f"{100 - i * 0.01:.8f}", f"{rng.uniform(0.1, 50):.8f}"] for i in range(levels)],
+        'asks': [[f"{100 + i * 0.01:.8f}", f"{rng.uniform(0.1, 50):.8f}"] for i in range(levels)],
+    }
+    klines = []
+    open_time = 1499040000000
+    for _ in range(candles):
+        o, c = rng.uniform(90, 110), rng.uniform(90, 110)
+        klines.append([open_time, f"{o:.8f}", f"{max(o, c) + 1:.8f}", f"{min(o, c) - 1:.8f}", f"{c:.8f}",
+                       f"{rng.uniform(100, 1e5):.8f}", open_time + 59999, f"{rng.uniform(1e4, 1e7):.8f}",
+                       rng.randint(10, 5000), f"{rng.uniform(50, 5e4):.8f}", f"{rng.uniform(5e3, 5e6):.8f}", "0"])
+        open_time += 60000
+    # Тело ответа в том виде, в каком его отдает Binance (без пробелов)
+    return json.dumps(depth, separators=(',', ':')).encode(), json.dumps(klines, separators=(',', ':')).encode()
+
+
+def bench_payload_decoding(repeats: int = 200):
+    depth_raw, klines_raw = synthetic_payloads()
+
+    def legacy_depth():
+        payload = json.loads(depth_raw)
+        return [[float(p), float(q)] for p, q in payload['bids']], [[float(p), float(q)] for p, q in payload['asks']]
+
+    def legacy_klines():
+        return [[float(v) for v in row[:11]] for row in json.loads(klines_raw)]
+
+    results = {}
+    for name, legacy, fast in (('depth 1000x2', legacy_depth, lambda: decode_depth(depth_raw)),
+                               ('klines 1000', legacy_klines, lambda: decode_klines(klines_raw))):
+        timings = []
+        for fn in (legacy, fast):
+            started = time.perf_counter()
+            for _ in range(repeats):
+                fn()
+            timings.append((time.perf_counter() - started) / repeats)
+        results[name] = timings
+        print(f"Decode {name}: json + list of lists {timings[0] * 1e6:.0f} us, "
+              f"NumPy decoder {timings[1] * 1e6:.0f} us")
+
+    bids, asks = legacy_depth()
+    book = decode_depth(depth_raw)
+    candles = decode_klines(klines_raw)
+    print(f"  matches={np.array_equal(book['bids'], bids) and np.array_equal(book['asks'], asks) and np.allclose(candles['close'], [row[4] for row in legacy_klines()])}")
+    return results
+
+
+class SyntheticExchange:
+    # Адаптер биржи с фиксированной задержкой ответа и собственным написанием символов
+    def __init__(self, markets: List[Dict], prices: Dict, latency: float, seed: int, lowercase: bool = False):
+        rng = random.Random(seed)
+        spell = str.lower if lowercase else str.upper
+        self.latency = latency
+        self.markets = [{'symbol': f"{spell(m['base_asset'])}-{spell(m['quote_asset'])}",
+                         'base_asset': spell(m['base_asset']), 'quote_asset': spell(m['quote_asset'])}
+                        for m in markets]
+        self.tickers = {}
+        for market, source in zip(self.markets, markets):
+            mid = prices[source['symbol']]['price'] * rng.uniform(0.995, 1.005)
+            self.tickers[market['symbol']] = {'bids': [[mid * 0.9995, rng.uniform(0.1, 10)]],
+                                              'asks': [[mid * 1.0005, rng.uniform(0.1, 10)]]}
+
+    async def get_markets(self):
+        return self.markets
+
+    async def get_book_tickers(self):
+        await asyncio.sleep(self.latency)
+        return self.tickers
+
+
+async def bench_cross_exchange_scan(exchanges: int = 5, pairs: int = 2000):
+    markets, prices, _ = synthetic_universe(pairs)
+    manager = MultiExchangeManager(default_timeout=0.5)
+    for i in range(exchanges):
+        manager.register_exchange(f"ex{i}", SyntheticExchange(markets, prices, latency=0.05 * (i + 1), seed=i,
+                                                              lowercase=bool(i % 2)))
+    # Биржа, не укладывающаяся в таймаут, не должна задерживать снимок
+    manager.register_exchange('slow', SyntheticExchange(markets, prices, latency=5.0, seed=99), timeout=0.3)
+    await manager.get_snapshot()
+
+    started = time.perf_counter()
+    snapshot = await manager.get_snapshot()
+    fetch = time.perf_counter() - started
+    sequential = sum(0.05 * (i + 1) for i in range(exchanges)) + 0.3
+
+    started = time.perf_counter()
+    found = manager.scan_spreads(snapshot)
+    scan = time.perf_counter() - started
+
+    # Прежний путь: попарное сравнение бирж по каждой паре в Python
+    started = time.perf_counter()
+    legacy = 0
+    for p in range(len(snapshot.pairs)):
+        best = None
+        for b in range(len(snapshot.exchanges)):
+            for s in range(len(snapshot.exchanges)):
+                if b == s or np.isnan(snapshot.ask[b, p]) or np.isnan(snapshot.bid[s, p]):
+                    continue
+                spread = snapshot.bid[s, p] * 0.999 / (snapshot.ask[b, p] * 1.001) - 1
+                if spread > 0 and (best is None or spread > best):
+                    best = spread
+        legacy += best is not None
+    loop = time.perf_counter() - started
+
+    print(f"Cross-exchange: {len(snapshot.exchanges)} exchanges x {len(snapshot.pairs)} pairs, "
+          f"concurrent snapshot {fetch * 1000:.0f} ms (sequential would be >= {sequential * 1000:.0f} ms), "
+          f"failed={list(snapshot.failed)}; spread scan {scan * 1000:.2f} ms vs Python loop {loop * 1000:.0f} ms, "
+          f"matches={legacy == len(found)} ({len(found)} found)")
+
+
+def synthetic_feed(markets: List[Dict], prices: Dict, events: int = 2000, levels: int = 5, seed: int = 17) -> SimulatedFeed:
+    # Начальные стаканы всех пар, затем случайные обновления уровней с интервалом ~1 мс
+    rng = random.Random(seed)
+    feed = []
+    for m in markets:
+        mid = prices[m['symbol']]['price']
+        feed.append({'t': 0.0, 's': m['symbol'],
+                     'b': [[mid * (1 - 0.0005 * (k + 1)), rng.uniform(50, 500) / mid] for k in range(levels)],
+                     'a': [[mid * (1 + 0.0005 * (k + 1)), rng.uniform(50, 500) / mid] for k in range(levels)]})
+    t = 0.0
+    for _ in range(events):
+        m = rng.choice(markets)
+        mid = prices[m['symbol']]['price']
+        t += 0.001
+        k = rng.randrange(levels)
+        feed.append({'t': t, 's': m['symbol'],
+                     'b': [[mid * (1 - 0.0005 * (k + 1)), rng.uniform(50, 500) / mid]],
+                     'a': [[mid * (1 + 0.0005 * (k + 1)), rng.uniform(50, 500) / mid]]})
+    return SimulatedFeed(feed)
+
+
+async def bench_simulated_exchange(orders: int = 20000, ticks: int = 500, latency: float = 0.0005):
+    markets = [{'symbol': 'BTCUSDT', 'base_asset': 'BTC', 'quote_asset': 'USDT'},
+               {'symbol': 'ETHBTC', 'base_asset': 'ETH', 'quote_asset': 'BTC'},
+               {'symbol': 'ETHUSDT', 'base_asset': 'ETH', 'quote_asset': 'USDT'}]
+    prices = {'BTCUSDT': {'price': 60000.0}, 'ETHBTC': {'price': 0.05}, 'ETHUSDT': {'price': 3000.0}}
+    feed = synthetic_feed(markets, prices)
+
+    # Пропускная способность движка: поток лимитных и рыночных заявок без задержки сети
+    exchange = SimulatedExchange(markets, partial_fill_rate=0.05, initial_balances={'USDT': 1e9, 'BTC': 1e4}, seed=1)
+    await exchange.replay(SimulatedFeed(feed.events[:len(markets)]), speed=None)
+    rng = random.Random(3)
+    started = time.perf_counter()
+    for i in range(orders):
+        side = rng.choice(('BUY', 'SELL'))
+        if i % 4:
+            price = 60000 * (1 + (0.0015 if side == 'BUY' else -0.0015) * rng.random())
+            await exchange.place_order('BTCUSDT', side, 'LIMIT', quantity=rng.uniform(0.001, 0.01), price=round(price, 2))
+        else:
+            await exchange.place_order('BTCUSDT', side, 'MARKET', quantity=rng.uniform(0.001, 0.01))
+    throughput = orders / (time.perf_counter() - started)
+    fills = exchange.stats['fills']
+
+    # Tick-to-trade через TradeExecutor: событие потока -> execute_arbitrage -> исполнение трех ног
+    exchange = SimulatedExchange(markets, order_latency=latency, latency_jitter=latency / 2,
+                                 partial_fill_rate=0.02, initial_balances={'USDT': 1e6}, seed=2)
+    executor = TradeExecutor(None, None, None, None)
+    executor.add_exchange('simulated', exchange)
+    executor.enable_trading(True)
+    executor.set_test_mode(False)
+    executor.set_max_concurrent_trades(ticks + 1)
+    opportunity = {'path': 'USDT->BTC->ETH->USDT', 'volume': 100.0}
+    latencies, pending = [], []
+
+    def on_tick(symbol):
+        if symbol == 'ETHUSDT' and len(pending) < ticks:
+            tick_at = time.perf_counter()
+
+            async def trade():
+                await executor.execute_arbitrage('simulated', opportunity, 100.0)
+                latencies.append(time.perf_counter() - tick_at)
+            pending.append(asyncio.ensure_future(trade()))
+
+    exchange.add_listener(on_tick)
+    await exchange.replay(feed, speed=None)
+    await asyncio.gather(*pending)
+    latencies = np.array(latencies) * 1000
+    print(f"Simulated exchange: matching {throughput:.0f} orders/s "
+          f"({fills} fills); tick-to-trade over {len(latencies)} 3-leg trades with "
+          f"{latency * 1000:.1f} ms order latency: p50 {np.percentile(latencies, 50):.2f} ms, "
+          f"p99 {np.percentile(latencies, 99):.2f} ms, partial fills={exchange.stats['partial_fills']}")
+
+
+async def bench_leg_execution(trades: int = 200, latency: float = 0.001):
+    markets = [{'symbol': 'BTCUSDT', 'base_asset': 'BTC', 'quote_asset': 'USDT'},
+               {'symbol': 'ETHBTC', 'base_asset': 'ETH', 'quote_asset': 'BTC'},
+               {'symbol': 'ETHUSDT', 'base_asset': 'ETH', 'quote_asset': 'USDT'}]
+    prices = {'BTCUSDT': {'price': 60000.0}, 'ETHBTC': {'price': 0.05}, 'ETHUSDT': {'price': 3000.0}}
+    # Начальные стаканы пар; перед каждой сделкой уровни восстанавливаются, чтобы ликвидность не кончалась
+    books = synthetic_feed(markets, prices, events=0).events
+    path, size = 'USDT->BTC->ETH->USDT', 100.0
+
+    async def make_exchange():
+        # Задержка доставки заявки и отдельно задержка ответа REST после исполнения
+        exchange = SimulatedExchange(markets, order_latency=latency, response_latency=latency,
+                                     initial_balances={'USDT': 1e6, 'BTC': 10.0, 'ETH': 100.0}, seed=5)
+        for event in books:
+            exchange.apply_event(event)
+        return exchange
+
+    def refill(exchange):
+        for event in books:
+            exchange.apply_event(event)
+
+    # Последовательно: следующая нога уходит после ответа REST на предыдущую
+    exchange = await make_exchange()
+    sequential = []
+    for _ in range(trades):
+        refill(exchange)
+        started = time.perf_counter()
+        trade_id = await exchange.execute_arbitrage_trade(path, size)
+        sequential.append(time.perf_counter() - started - latency)
+        await exchange.close_arbitrage_trade(trade_id)
+
+    # Конвейер: зависимая нога уходит по событию исполнения, без ожидания ответа
+    exchange = await make_exchange()
+    executor = LegExecutor(exchange, fee_rate=exchange.taker_fee)
+    pipelined = []
+    for _ in range(trades):
+        refill(exchange)
+        pipelined.append((await executor.execute(path, size))['first_submit_to_last_fill'])
+
+    # Параллельно: запас BTC и ETH покрывает все ноги, они отправляются одновременно
+    inventory = {'BTC': 10.0, 'ETH': 100.0}
+    results = []
+    for _ in range(trades):
+        refill(exchange)
+        results.append(await executor.execute(path, size, inventory))
+    parallel = [r['first_submit_to_last_fill'] for r in results]
+    statuses = {r['status'] for r in results}
+
+    def summary(values):
+        values = np.array(values) * 1000
+        return f"p50 {np.percentile(values, 50):.2f} ms, p99 {np.percentile(values, 99):.2f} ms"
+    print(f"Leg execution, first submit to last fill over {trades} 3-leg trades "
+          f"({latency * 1000:.1f} ms delivery + {latency * 1000:.1f} ms response): "
+          f"sequential {summary(sequential)}; pipelined {summary(pipelined)}; "
+          f"parallel {summary(parallel)} (statuses {sorted(statuses)})")
+
+
+class NullServices:
+    # Заглушки risk_manager, db_manager и notification_manager для TradeExecutor
+    def __init__(self):
+        self.closed: Dict[str, float] = {}
+
+    def remove_position(self, trade_id):
+        pass
+
+    async def close_trade(self, trade_id, actual_profit):
+        self.closed[trade_id] = time.perf_counter()
+
+    async def send_trade_closure(self, user_id, trade):
+        pass
+
+
+async def bench_position_monitoring(positions: int = 300, latency: float = 0.0005):
+    markets = [{'symbol': 'BTCUSDT', 'base_asset': 'BTC', 'quote_asset': 'USDT'},
+               {'symbol': 'ETHBTC', 'base_asset': 'ETH', 'quote_asset': 'BTC'},
+               {'symbol': 'ETHUSDT', 'base_asset': 'ETH', 'quote_asset': 'USDT'}]
+    prices = {'BTCUSDT': {'price': 60000.0}, 'ETHBTC': {'price': 0.05}, 'ETHUSDT': {'price': 3000.0}}
+    books = synthetic_feed(markets, prices, events=0).events
+    services = NullServices()
+    exchange = SimulatedExchange(markets, order_latency=latency, initial_balances={'USDT': 1e9}, seed=4)
+    executor = TradeExecutor(None, services, services, services)
+    executor.add_exchange('simulated', exchange)
+    executor.enable_trading(True)
+    executor.set_test_mode(False)
+    executor.set_max_concurrent_trades(positions + 1)
+    executor.set_stop_loss(1.0)
+    opportunity = {'path': 'USDT->BTC->ETH->USDT', 'volume': 100.0}
+    for _ in range(positions):
+        for event in books:
+            exchange.apply_event(event)
+        await executor.execute_arbitrage('simulated', opportunity, 100.0)
+    for event in books:
+        exchange.apply_event(event)
+
+    # Опрос: стоимость одного прохода monitor_positions по всем позициям (цены не сработали)
+    started = time.perf_counter()
+    await executor.monitor_positions()
+    poll = time.perf_counter() - started
+
+    # События: обвал ETHUSDT на 3% — stop-loss всех позиций с момента тика
+    executor.watch_exchange('simulated')
+    crash = {'t': 0.0, 's': 'ETHUSDT', 'b': [[p * 0.97, q] for p, q in books[2]['b']],
+             'a': [[p * 0.97, q] for p, q in books[2]['a']]}
+    crash['b'] += [[p, 0.0] for p, _ in books[2]['b']]
+    crash['a'] += [[p, 0.0] for p, _ in books[2]['a']]
+    opened = len(executor.open_positions)
+    tick_at = time.perf_counter()
+    exchange.apply_event(crash)
+    while executor.open_positions:
+        await asyncio.sleep(0)
+    closed = np.array(sorted(services.closed.values())) - tick_at
+    print(f"Position monitoring over {opened} positions: poll pass {poll * 1000:.2f} ms "
+          f"(then up to a 10 s sleep); event-driven stop-loss after tick: first close "
+          f"{closed[0] * 1000:.2f} ms, all {len(closed)} closed in {closed[-1] * 1000:.2f} ms")
+
+
+class TableMetadata:
+    # Метаданные биржи, у которой есть только таблица цен
+    def __init__(self, table: MarketTable):
+        self.table = table
+        self.metadata = self
+
+    def get_market_table(self) -> MarketTable:
+        return self.table
+
+
+def bench_position_pnl(positions: int = 5000, pairs: int = 2000, seed: int = 19):
+    markets, prices, volumes = synthetic_universe(pairs)
+    index = TriangleIndex(MarketTable(markets))
+    table = index.table
+    table.load(prices, volumes)
+    executor = TradeExecutor(None, None, None, None)
+    executor.add_exchange('synthetic', TableMetadata(table))
+    rng = random.Random(seed)
+    for i in range(positions):
+        path = index.path(rng.randrange(len(index)))
+        symbols = table.edge_symbols(table.path_edges(path))
+        position = {'exchange': 'synthetic', 'path': '->'.join(path), 'size': 100.0,
+                    'entry_prices': {symbol: prices[symbol]['price'] for symbol in symbols}}
+        executor.attach_leg_edges(position)
+        executor.open_positions[f"p{i}"] = position
+        executor._track_position(f"p{i}", position)
+    moved = {symbol: quote['price'] * rng.uniform(0.97, 1.03) for symbol, quote in prices.items()}
+    table.update(moved)
+
+    # До: цикл по ногам каждой позиции со сборкой строковых ключей и поиском в словаре
+    legacy_positions = [{k: v for k, v in p.items() if k != 'leg_edges'} for p in executor.open_positions.values()]
+    started = time.perf_counter()
+    legacy = np.array([executor.calculate_profit_loss(p, moved) for p in legacy_positions])
+    before = time.perf_counter() - started
+
+    positions_table = executor.get_position_table('synthetic')
+    started = time.perf_counter()
+    rows, pnl = positions_table.mark_to_market(table.rate)
+    after = time.perf_counter() - started
+    by_id = dict(zip((positions_table.trade_ids[r] for r in rows), pnl))
+    vectorized = np.array([by_id[f"p{i}"] for i in range(positions)])
+    print(f"Position P&L over {positions} open positions: per-position loop {before * 1000:.2f} ms, "
+          f"columnar gather {after * 1000:.3f} ms, "
+          f"matches={np.allclose(legacy, vectorized)}")
+
+
+def synthetic_order(i: int) -> Dict:
+    return {'id': f"o{i}", 'symbol': 'BTCUSDT', 'type': 'LIMIT', 'side': 'BUY' if i % 2 else 'SELL',
+            'amount': 0.01, 'price': 60000.0 + i % 100, 'status': 'NEW'}
+
+
+async def bench_write_behind(orders: int = 2000, concurrency: int = 20):
+    with tempfile.TemporaryDirectory() as directory:
+        # До: каждая запись — свой execute и commit на пути исполнения
+        db = DatabaseManager(os.path.join(directory, 'before.db'), write_behind=False)
+        await db.connect()
+        started = time.perf_counter()
+        for i in range(orders):
+            await db.conn.execute('''
+                INSERT INTO orders (user_id, order_id, symbol, type, side, amount, price, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (1, f"o{i}", 'BTCUSDT', 'LIMIT', 'BUY', 0.01, 60000.0, 'NEW'))
+            await db.conn.commit()
+        before = time.perf_counter() - started
+        await db.close()
+
+        # После: запись подтверждается постановкой в очередь, коммит — группой
+        db = DatabaseManager(os.path.join(directory, 'after.db'))
+        await db.connect()
+        acks = []
+        started = time.perf_counter()
+        for i in range(orders):
+            ack_started = time.perf_counter()
+            await db.save_order(1, synthetic_order(i))
+            acks.append(time.perf_counter() - ack_started)
+        enqueued = time.perf_counter() - started
+        await db.flush()
+        after = time.perf_counter() - started
+        metrics = db.get_write_metrics()
+        async with db.conn.execute('SELECT COUNT(*) FROM orders') as cursor:
+            stored = (await cursor.fetchone())[0]
+        await db.close()
+
+        # Групповой коммит для ожидающих вызовов: concurrency обработчиков ждут подтверждения записи
+        db = DatabaseManager(os.path.join(directory, 'durable.db'), write_behind=False)
+        await db.connect()
+        started = time.perf_counter()
+        for i in range(0, orders, concurrency):
+            await asyncio.gather(*(db.save_order(1, synthetic_order(j)) for j in range(i, i + concurrency)))
+        durable = time.perf_counter() - started
+        await db.close()
+    print(f"Order writes ({orders}): commit per call {before * 1000:.0f} ms; write-behind ack p50 "
+          f"{np.percentile(acks, 50) * 1e6:.1f} us, enqueue {enqueued * 1000:.0f} ms, durable after flush "
+          f"{after * 1000:.0f} ms ({metrics['batches']} batches, avg {metrics['avg_batch']:.0f}, "
+          f"commit p50 {metrics['commit_ms_p50']:.2f} ms, stored={stored}); "
+          f"{concurrency} waiting writers group-committed {durable * 1000:.0f} ms")
+
+
+def synthetic_history(rows: int, users: int = 1000, seed: int = 23):
+    # Строки orders и trades за ~2 года, пользователи с разной активностью
+    rng = np.random.default_rng(seed)
+    user_ids = (rng.pareto(1.5, rows) * 50).astype(np.int64) % users + 1
+    seconds = np.sort(rng.integers(0, 2 * 365 * 86400, rows))
+    stamps = np.datetime_as_string(np.datetime64('2023-01-01T00:00:00') + seconds.astype('timedelta64[s]'))
+    profits = rng.normal(0.1, 1.0, rows)
+    statuses = np.where(rng.random(rows) < 0.95, 'closed', 'open')
+    orders = [(int(u), f"o{i}", 'BTCUSDT', 'LIMIT', 'BUY', 0.01, 60000.0, 'FILLED', str(t).replace('T', ' '))
+              for i, (u, t) in enumerate(zip(user_ids, stamps))]
+    trades = [(int(u), 'binance', 'USDT->BTC->ETH->USDT', float(p), 100.0, str(st), str(t).replace('T', ' '))
+              for u, p, st, t in zip(user_ids, profits, statuses, stamps)]
+    return orders, trades
+
+
+# Прежний get_trade_statistics: агрегат по всем закрытым сделкам пользователя на каждый запрос
+LEGACY_STATISTICS_SQL = '''
+    SELECT COUNT(*), SUM(CASE WHEN profit > 0 THEN 1 ELSE 0 END), SUM(profit), AVG(profit)
+    FROM trades WHERE user_id = ? AND status = 'closed'
+'''
+
+
+async def _time_reads(db: DatabaseManager, user_ids: List[int], legacy: bool = False) -> Dict[str, float]:
+    # legacy — схема до миграций: таблицы user_stats еще нет, статистика считается агрегатом
+    statistics = (lambda u: db._read(LEGACY_STATISTICS_SQL, (u,), one=True)) if legacy else db.get_trade_statistics
+    timings = {}
+    for name, call in (('history', lambda u: db.get_order_history(u)),
+                       ('statistics', statistics),
+                       ('range', lambda u: db.get_user_trades(u, '2024-06-01', '2024-07-01'))):
+        started = time.perf_counter()
+        for user_id in user_ids:
+            await call(user_id)
+        timings[name] = (time.perf_counter() - started) / len(user_ids)
+    return timings
+
+
+async def bench_sqlite_profile(rows: int = 1_000_000, queries: int = 20):
+    orders, trades = synthetic_history(rows)
+    user_ids = list(range(1, queries + 1))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'history.db')
+        # Исходная схема без индексов и журнал по умолчанию, как до обновления
+        db = DatabaseManager(path)
+        db.conn = await db.pool.open()
+        try:
+            await db.create_tables()
+            await db.conn.executemany('''
+                INSERT INTO orders (user_id, order_id, symbol, type, side, amount, price, status, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', orders)
+            await db.conn.executemany('''
+                INSERT INTO trades (user_id, exchange, path, profit, volume, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', trades)
+            await db.conn.commit()
+            before = await _time_reads(db, user_ids, legacy=True)
+        finally:
+            await db.pool.close()
+
+        # connect() применяет профиль и обновляет схему существующей базы
+        db = DatabaseManager(path)
+        started = time.perf_counter()
+        try:
+            await db.connect()
+            upgrade = time.perf_counter() - started
+            after = await _time_reads(db, user_ids)
+        finally:
+            await db.close()
+    line = ', '.join(f"{name} {before[name] * 1000:.1f} -> {after[name] * 1000:.2f} ms" for name in before)
+    print(f"SQLite profile over {rows} orders + {rows} trades (per user query, before -> after): {line}; "
+          f"upgrade of existing database {upgrade:.1f} s")
+
+
+async def bench_connection_pool(rows: int = 200_000, reports: int = 20, writes: int = 200):
+    orders, trades = synthetic_history(rows)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for readers in (0, 4):
+            path = os.path.join(directory, f"pool{readers}.db")
+            db = DatabaseManager(path, readers=readers)
+            await db.connect()
+            await db.conn.executemany('''
+                INSERT INTO trades (user_id, exchange, path, profit, volume, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', trades)
+            await db.conn.commit()
+
+            # Тяжелые отчеты (полный проход по trades) идут параллельно с подтверждаемыми записями заявок
+            async def report():
+                for _ in range(reports):
+                    await db._read('SELECT user_id, SUM(profit), AVG(volume), COUNT(*) FROM trades GROUP BY user_id')
+
+            async def order_writes():
+                latencies = []
+                for i in range(writes):
+                    started = time.perf_counter()
+                    await db.save_order(1, synthetic_order(i), wait=True)
+                    latencies.append(time.perf_counter() - started)
+                    await asyncio.sleep(0.001)
+                return latencies
+
+            started = time.perf_counter()
+            _, latencies = await asyncio.gather(report(), order_writes())
+            elapsed = time.perf_counter() - started
+            metrics = db.get_pool_metrics()['readers']
+            await db.close()
+            results[readers] = (np.array(latencies) * 1000, elapsed, metrics)
+    parts = []
+    for readers, (latencies, elapsed, metrics) in results.items():
+        name = 'single connection' if readers == 0 else f"{readers} readers + writer (saturation {metrics['saturation']:.2f})"
+        parts.append(f"{name}: write p50 {np.percentile(latencies, 50):.1f} ms, "
+                     f"p99 {np.percentile(latencies, 99):.1f} ms, total {elapsed:.2f} s")
+    line = '; '.join(parts)
+    print(f"Connection pool ({reports} full-table reports concurrent with {writes} durable order writes): {line}")
+
+
+async def bench_trade_statistics(rows: int = 1_000_000, queries: int = 50):
+    _, trades = synthetic_history(rows)
+    # closed_at = created_at: для статистики важен день закрытия
+    trades = [trade + (trade[6],) for trade in trades]
+    user_ids = list(range(1, queries + 1))
+    with tempfile.TemporaryDirectory() as directory:
+        db = DatabaseManager(os.path.join(directory, 'stats.db'))
+        await db.connect()
+        started = time.perf_counter()
+        await db.conn.executemany('''
+            INSERT INTO trades (user_id, exchange, path, profit, volume, status, created_at, closed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', trades)
+        await db.conn.commit()
+        load = time.perf_counter() - started
+
+        started = time.perf_counter()
+        expected = [await db._read(LEGACY_STATISTICS_SQL, (user_id,), one=True) for user_id in user_ids]
+        aggregate = (time.perf_counter() - started) / queries
+        started = time.perf_counter()
+        stats = [await db.get_trade_statistics(user_id) for user_id in user_ids]
+        materialized = (time.perf_counter() - started) / queries
+        mismatches = sum(1 for old, new in zip(expected, stats)
+                         if old[0] != new[0] or old[1] != new[1] or not np.isclose(old[2] or 0, new[2] or 0))
+        started = time.perf_counter()
+        await db.rebuild_trade_statistics()
+        rebuild = time.perf_counter() - started
+        heaviest = max(row[0] for row in expected)
+        await db.close()
+    print(f"Trade statistics over {rows} trades (per user, heaviest {heaviest} trades): aggregate "
+          f"{aggregate * 1000:.2f} ms -> materialized {materialized * 1000:.3f} ms, mismatches {mismatches}; "
+          f"load with triggers {load:.1f} s, full rebuild {rebuild:.1f} s")
+
+
+async def _traced(call):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = await call()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+async def bench_history_streaming(rows: int = 1_000_000):
+    orders, trades = synthetic_history(rows)
+    user_id = 1
+    with tempfile.TemporaryDirectory() as directory:
+        db = DatabaseManager(os.path.join(directory, 'stream.db'))
+        await db.connect()
+        await db.conn.executemany('''
+            INSERT INTO orders (user_id, order_id, symbol, type, side, amount, price, status, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', orders)
+        await db.conn.executemany('''
+            INSERT INTO trades (user_id, exchange, path, profit, volume, status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', trades)
+        await db.conn.commit()
+        del orders, trades
+
+        async def full_list():
+            history = await db.get_order_history(user_id)
+            return len(history), np.array([row[6] for row in history]).sum()
+
+        async def streamed():
+            count, total = 0, 0.0
+            async for row in db.iter_order_history(user_id):
+                count += 1
+                total += row[6]
+            return count, total
+
+        async def columns():
+            loaded = await db.load_order_columns(user_id)
+            return len(loaded['id']), loaded['amount'].sum()
+
+        results = {}
+        for name, call in (('fetchall', full_list), ('keyset iterator', streamed), ('column loader', columns)):
+            results[name] = await _traced(call)
+        # Страница /history: прежде читалась вся история сделок пользователя
+        _, first_page, _ = await _traced(lambda: db._read(
+            'SELECT * FROM trades WHERE user_id = ? ORDER BY created_at DESC', (user_id,)))
+        _, keyset_page, _ = await _traced(lambda: db.get_user_trade_history(user_id, limit=10))
+        await db.close()
+    count = results['fetchall'][0][0]
+    assert all(result[0][0] == count for result in results.values())
+    line = ', '.join(f"{name} {elapsed * 1000:.0f} ms / peak {peak / 2 ** 20:.1f} MiB"
+                     for name, (_, elapsed, peak) in results.items())
+    print(f"Order history of the heaviest user ({count} of {rows} rows): {line}; "
+          f"10-row trade history page {first_page * 1000:.1f} ms (full read) -> {keyset_page * 1000:.2f} ms (keyset)")
+
+
+async def main():
+    await bench_http_session()
+    await bench_order_book_stream()
+    bench_triangle_scan()
+    bench_opportunity_store()
+    await bench_sharded_scan()
+    bench_fill_simulation()
+    bench_payload_decoding()
+    await bench_cross_exchange_scan()
+    await bench_simulated_exchange()
+    await bench_leg_execution()
+    await bench_position_monitoring()
+    bench_position_pnl()
+    await bench_write_behind()
+    await bench_sqlite_profile()
+    await bench_connection_pool()
+    await bench_trade_statistics()
+    await bench_history_streaming()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
\ No newline at end of file
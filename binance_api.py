@@ -1,54 +1,228 @@
 import asyncio
 import hmac
 import hashlib
+import logging
 import time
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional
 import aiohttp
+import numpy as np
 from urllib.parse import urlencode
+from exchange_metadata import ExchangeMetadataCache
+from payload_decoder import loads, decode_depth, decode_klines
+from rate_limiter import WeightRateLimiter, RequestPriority, endpoint_weight, endpoint_priority
+
+logger = logging.getLogger(__name__)
+
+# Статусы executionReport, после которых заявка больше не изменится
+FINAL_ORDER_STATUSES = ('FILLED', 'CANCELED', 'EXPIRED', 'REJECTED', 'EXPIRED_IN_MATCH')
+
 
 class BinanceAPI:
-    def __init__(self, api_key: str, api_secret: str):
+    def __init__(self, api_key: str, api_secret: str, base_url: str = 'https://api.binance.com',
+                 pool_size: int = 100, dns_cache_ttl: int = 300, keepalive_timeout: float = 30.0,
+                 request_timeout: float = 10.0, rate_limiter: WeightRateLimiter = None,
+                 metadata_cache_path: str = 'exchange_info_cache.json', metadata_ttl: float = 3600.0,
+                 taker_fee: float = 0.001, stream_url: str = 'wss://stream.binance.com:9443',
+                 listen_key_keepalive: float = 1800.0, reconnect_delay: float = 1.0):
+        self.exchange_name = 'binance'
         self.API_KEY = api_key
         self.API_SECRET = api_secret
-        self.BASE_URL = 'https://api.binance.com'
+        self.BASE_URL = base_url
+        self.pool_size = pool_size
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.rate_limiter = rate_limiter or WeightRateLimiter()
+        self.metadata = ExchangeMetadataCache(self, cache_path=metadata_cache_path, ttl=metadata_ttl,
+                                              taker_fee=taker_fee)
+        # Пользовательский поток (listenKey): события executionReport передаются слушателям add_fill_listener
+        self.stream_url = stream_url
+        self.listen_key_keepalive = listen_key_keepalive
+        self.reconnect_delay = reconnect_delay
+        self.fill_listeners: List[Callable[[Dict], None]] = []
+        self.listen_key: Optional[str] = None
+        self._user_stream_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        # Одна сессия на весь срок жизни бота: пул соединений, keep-alive и кэш DNS
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers={'X-MBX-APIKEY': self.API_KEY},
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+            )
+        if self.fill_listeners:
+            self._start_user_stream()
+
+    async def close(self):
+        if self._user_stream_task is not None:
+            self._user_stream_task.cancel()
+            await asyncio.gather(self._user_stream_task, return_exceptions=True)
+            self._user_stream_task = None
+        if self.listen_key is not None and self.session is not None and not self.session.closed:
+            try:
+                await self._request('DELETE', '/api/v3/userDataStream', {'listenKey': self.listen_key}, signed=False)
+            except Exception as e:
+                logger.warning(f"Не удалось закрыть listenKey пользовательского потока: {str(e)}")
+        self.listen_key = None
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
 
-    async def _request(self, method: str, endpoint: str, params: Dict = None) -> Dict:
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _request(self, method: str, endpoint: str, params: Dict = None, timeout: float = None,
+                       priority: RequestPriority = None, raw: bool = False, signed: bool = True) -> Dict:
+        if self.session is None or self.session.closed:
+            await self.start()
         url = f"{self.BASE_URL}{endpoint}"
-        headers = {'X-MBX-APIKEY': self.API_KEY}
-        
-        if params:
+        # Все запросы проходят через общий планировщик с учетом веса и приоритета
+        if priority is None:
+            priority = endpoint_priority(method, endpoint)
+        await self.rate_limiter.acquire(endpoint_weight(method, endpoint, params), priority)
+
+        if params and signed:
             query_string = urlencode(params)
             signature = hmac.new(self.API_SECRET.encode('utf-8'), query_string.encode('utf-8'), hashlib.sha256).hexdigest()
             params['signature'] = signature
 
-        async with aiohttp.ClientSession() as session:
-            if method == 'GET':
-                async with session.get(url, headers=headers, params=params) as response:
-                    return await response.json()
-            elif method == 'POST':
-                async with session.post(url, headers=headers, data=params) as response:
-                    return await response.json()
+        if method == 'POST':
+            kwargs = {'data': params}
+        else:
+            kwargs = {'params': params}
+        # Без явного timeout действует таймаут сессии по умолчанию
+        if timeout is not None:
+            kwargs['timeout'] = aiohttp.ClientTimeout(total=timeout)
+        async with self.session.request(method, url, **kwargs) as response:
+            self.rate_limiter.update_from_headers(response.headers)
+            if response.status in (418, 429):
+                self.rate_limiter.pause(float(response.headers.get('Retry-After', 60)))
+            if raw:
+                return await response.read()
+            return await response.json(loads=loads)
 
-    async def get_exchange_info(self) -> Dict:
+    def get_rate_limit_metrics(self) -> Dict:
+        return self.rate_limiter.get_metrics()
+
+    # Пользовательский поток
+
+    def add_fill_listener(self, callback: Callable[[Dict], None]):
+        # Поток запускается с первым слушателем; вне цикла событий — при start()
+        self.fill_listeners.append(callback)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._start_user_stream()
+
+    def _start_user_stream(self):
+        if self._user_stream_task is None or self._user_stream_task.done():
+            self._user_stream_task = asyncio.create_task(self._run_user_stream())
+
+    async def _keep_listen_key_alive(self):
+        # listenKey живет 60 минут без продления
+        while True:
+            await asyncio.sleep(self.listen_key_keepalive)
+            try:
+                await self._request('PUT', '/api/v3/userDataStream', {'listenKey': self.listen_key}, signed=False)
+            except Exception as e:
+                logger.warning(f"Не удалось продлить listenKey пользовательского потока: {str(e)}")
+
+    async def _run_user_stream(self):
+        # Отдельная сессия без общего таймаута запроса: соединение потока живет сутками
+        async with aiohttp.ClientSession() as ws_session:
+            while True:
+                keepalive = None
+                try:
+                    response = await self._request('POST', '/api/v3/userDataStream', signed=False)
+                    self.listen_key = response['listenKey']
+                    keepalive = asyncio.create_task(self._keep_listen_key_alive())
+                    async with ws_session.ws_connect(f"{self.stream_url}/ws/{self.listen_key}", heartbeat=30) as ws:
+                        logger.info("Подключен пользовательский поток: события исполнения заявок")
+                        async for msg in ws:
+                            if msg.type == aiohttp.WSMsgType.TEXT:
+                                self.handle_user_event(loads(msg.data))
+                            elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                                break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Ошибка пользовательского потока: {str(e)}")
+                finally:
+                    if keepalive is not None:
+                        keepalive.cancel()
+                await asyncio.sleep(self.reconnect_delay)
+
+    def handle_user_event(self, data: Dict):
+        # executionReport -> событие в формате ответа POST /api/v3/order, как у SimulatedExchange
+        if data.get('e') != 'executionReport':
+            return
+        status = data['X']
+        event = {
+            'symbol': data['s'],
+            'orderId': data['i'],
+            'side': data['S'],
+            'type': data['o'],
+            'status': status,
+            'origQty': float(data['q']),
+            'executedQty': float(data['z']),
+            'cummulativeQuoteQty': float(data['Z']),
+            'transactTime': data.get('T'),
+            # У снятой заявки c — идентификатор запроса отмены, исходный — в C
+            'clientOrderId': data['C'] if status == 'CANCELED' and data.get('C') else data['c'],
+            'final': status in FINAL_ORDER_STATUSES,
+        }
+        for callback in self.fill_listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика исполнения {event['clientOrderId']}: {str(e)}")
+
+    async def fetch_exchange_info(self) -> Dict:
         return await self._request('GET', '/api/v3/exchangeInfo')
 
+    async def get_exchange_info(self) -> Dict:
+        await self.metadata.ensure_fresh()
+        return self.metadata.exchange_info
+
     async def get_account_balance(self) -> List[Dict]:
         params = {'timestamp': int(time.time() * 1000)}
         account_info = await self._request('GET', '/api/v3/account', params)
         return account_info['balances']
 
     async def get_orderbook(self, symbol: str, limit: int = 100) -> Dict:
+        # bids/asks — массивы (n, 2) float64, разобранные прямо из тела ответа
         params = {'symbol': symbol, 'limit': limit}
-        return await self._request('GET', '/api/v3/depth', params)
+        return decode_depth(await self._request('GET', '/api/v3/depth', params, raw=True))
 
-    async def place_order(self, symbol: str, side: str, type: str, quantity: float, price: float = None) -> Dict:
+    async def place_order(self, symbol: str, side: str, type: str, quantity: float = None, price: float = None,
+                          quote_quantity: float = None, client_order_id: str = None) -> Dict:
         params = {
             'symbol': symbol,
             'side': side,
             'type': type,
-            'quantity': quantity,
             'timestamp': int(time.time() * 1000)
         }
+        if quantity is not None:
+            params['quantity'] = quantity
+        if quote_quantity is not None:
+            # Рыночная покупка на сумму в quote-активе
+            params['quoteOrderQty'] = quote_quantity
+        if client_order_id is not None:
+            # По этому идентификатору исполнение сопоставляется с событием executionReport пользовательского потока
+            params['newClientOrderId'] = client_order_id
         if price:
             params['price'] = price
         return await self._request('POST', '/api/v3/order', params)
@@ -59,21 +233,25 @@ class BinanceAPI:
             params['symbol'] = symbol
         return await self._request('GET', '/api/v3/openOrders', params)
 
-    async def cancel_order(self, symbol: str, order_id: int) -> Dict:
+    async def cancel_order(self, symbol: str, order_id: int = None, client_order_id: str = None) -> Dict:
         params = {
             'symbol': symbol,
-            'orderId': order_id,
             'timestamp': int(time.time() * 1000)
         }
+        if order_id is not None:
+            params['orderId'] = order_id
+        if client_order_id is not None:
+            # Заявка, ответ на которую еще не пришел, снимается по собственному идентификатору
+            params['origClientOrderId'] = client_order_id
         return await self._request('DELETE', '/api/v3/order', params)
 
-    async def get_klines(self, symbol: str, interval: str, limit: int = 500) -> List[List]:
+    async def get_klines(self, symbol: str, interval: str, limit: int = 500) -> np.ndarray:
         params = {
             'symbol': symbol,
             'interval': interval,
             'limit': limit
         }
-        return await self._request('GET', '/api/v3/klines', params)
+        return decode_klines(await self._request('GET', '/api/v3/klines', params, raw=True))
 
     async def get_24hr_ticker(self, symbol: str) -> Dict:
         params = {'symbol': symbol}
@@ -83,7 +261,33 @@ class BinanceAPI:
         params = {'symbol': symbol}
         return await self._request('GET', '/api/v3/ticker/price', params)
 
+    async def get_book_tickers(self) -> Dict[str, Dict]:
+        # Один запрос без symbol возвращает лучшие bid/ask по всем парам биржи.
+        # Записи имеют форму стакана глубины 1, чтобы их можно было передавать туда же, куда и get_orderbook
+        tickers = await self._request('GET', '/api/v3/ticker/bookTicker')
+        return {t['symbol']: {'bids': [[float(t['bidPrice']), float(t['bidQty'])]],
+                              'asks': [[float(t['askPrice']), float(t['askQty'])]]}
+                for t in tickers}
+
+    async def get_prices(self) -> Dict[str, Dict]:
+        tickers = await self.get_book_tickers()
+        return {symbol: {'price': (t['bids'][0][0] + t['asks'][0][0]) / 2,
+                         'bid': t['bids'][0][0], 'ask': t['asks'][0][0]}
+                for symbol, t in tickers.items()}
+
+    async def get_24h_volumes(self) -> Dict[str, float]:
+        tickers = await self._request('GET', '/api/v3/ticker/24hr')
+        return {t['symbol']: float(t['quoteVolume']) for t in tickers}
+
     async def get_markets(self) -> List[Dict]:
-        exchange_info = await self.get_exchange_info()
-        return [{'symbol': s['symbol'], 'base_asset': s['baseAsset'], 'quote_asset': s['quoteAsset']}
-                for s in exchange_info['symbols'] if s['status'] == 'TRADING']
\ No newline at end of file
+        await self.metadata.ensure_fresh()
+        return self.metadata.markets
+
+    async def build_market_graph(self) -> Dict[str, Dict[str, tuple]]:
+        # Актив -> сосед -> (символ пары, нужно ли брать 1/price для обмена актива на соседа)
+        graph = {}
+        for market in await self.get_markets():
+            base, quote = market['base_asset'], market['quote_asset']
+            graph.setdefault(base, {})[quote] = (market['symbol'], False)
+            graph.setdefault(quote, {})[base] = (market['symbol'], True)
+        return graph
\ No newline at end of file
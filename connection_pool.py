@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+from urllib.request import pathname2url
+import aiosqlite
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    def __init__(self, db_name: str, readers: int = 4, history: int = 1000):
+        # Одно соединение-писатель и readers соединений только для чтения: в режиме WAL
+        # читатели не ждут писателя и друг друга, медленный отчет не задерживает запись заявок
+        self.db_name = db_name
+        self.size = 0 if db_name == ':memory:' else readers
+        self.writer: Optional[aiosqlite.Connection] = None
+        self.readers: List[aiosqlite.Connection] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self.stats = {'acquired': 0, 'waited': 0, 'waiting': 0, 'in_use': 0, 'max_in_use': 0}
+        self.wait_times: deque = deque(maxlen=history)
+
+    async def open(self) -> aiosqlite.Connection:
+        self.writer = await aiosqlite.connect(self.db_name)
+        return self.writer
+
+    async def open_readers(self, pragmas=()):
+        # Вызывается после создания схемы: файл базы уже существует
+        self._idle = asyncio.Queue()
+        uri = f"file:{pathname2url(os.path.abspath(self.db_name))}?mode=ro"
+        for _ in range(self.size):
+            conn = await aiosqlite.connect(uri, uri=True)
+            for name, value in pragmas:
+                await conn.execute(f'PRAGMA {name} = {value}')
+            await conn.execute('PRAGMA query_only = ON')
+            self.readers.append(conn)
+            self._idle.put_nowait(conn)
+        logger.info(f"Opened {self.size} read-only connections to {self.db_name}")
+
+    async def close(self):
+        for conn in self.readers:
+            await conn.close()
+        self.readers.clear()
+        self._idle = None
+        if self.writer is not None:
+            await self.writer.close()
+            self.writer = None
+
+    @asynccontextmanager
+    async def reader(self):
+        # Без читателей (база в памяти) чтение идет через писателя
+        if not self.readers:
+            yield self.writer
+            return
+        started = time.perf_counter()
+        try:
+            conn = self._idle.get_nowait()
+        except asyncio.QueueEmpty:
+            self.stats['waited'] += 1
+            self.stats['waiting'] += 1
+            try:
+                conn = await self._idle.get()
+            finally:
+                self.stats['waiting'] -= 1
+        self.wait_times.append(time.perf_counter() - started)
+        self.stats['acquired'] += 1
+        self.stats['in_use'] += 1
+        self.stats['max_in_use'] = max(self.stats['max_in_use'], self.stats['in_use'])
+        try:
+            yield conn
+        finally:
+            self.stats['in_use'] -= 1
+            self._idle.put_nowait(conn)
+
+    def metrics(self) -> Dict:
+        # saturation — доля чтений, которым не хватило свободного соединения
+        waits = np.array(self.wait_times) * 1000
+        acquired = self.stats['acquired']
+        return {
+            **self.stats,
+            'readers': len(self.readers),
+            'saturation': self.stats['waited'] / acquired if acquired else 0.0,
+            'wait_ms_p50': float(np.percentile(waits, 50)) if len(waits) else 0.0,
+            'wait_ms_p99': float(np.percentile(waits, 99)) if len(waits) else 0.0,
+        }
\ No newline at end of file
@@ -0,0 +1,87 @@
+import logging
+from typing import Dict, List, Tuple
+import numpy as np
+from market_table import MarketTable
+
+logger = logging.getLogger(__name__)
+
+
+class NegativeCycleSearch:
+    def __init__(self, table: MarketTable, fee_rate: float = 0.001, max_legs: int = 4, max_rounds: int = None):
+        self.table = table
+        self.version = table.version
+        self.fee_rate = fee_rate
+        self.max_legs = max_legs
+        self.max_rounds = max_rounds or 2 * max_legs
+        self.edge_src = table.edge_src
+        self.edge_dst = table.edge_dst
+        self.edge_pair = table.edge_pair
+        logger.info(f"Граф для поиска циклов: {len(table.assets)} активов, {len(self.edge_src)} ребер, до {max_legs} ног")
+
+    def edge_weights(self) -> np.ndarray:
+        # Вес ребра -log(курс * (1 - комиссия)): прибыльный цикл — цикл отрицательного веса
+        rates = self.table.rate
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weights = -np.log(rates * (1 - self.fee_rate))
+        weights[~np.isfinite(weights) | ~(rates > 0)] = np.inf
+        return weights
+
+    def search(self, eps: float = 1e-12) -> List[Tuple[List[int], float]]:
+        # Bellman-Ford с виртуальным источником (все расстояния 0) и SPFA-отсечением:
+        # на каждом раунде релаксируются только ребра из вершин, улучшенных на прошлом раунде,
+        # а циклы в графе предшественников собираются после каждого раунда
+        weights = self.edge_weights()
+        usable = np.isfinite(weights)
+        vertex_count = len(self.table.assets)
+        dist = np.zeros(vertex_count)
+        pred_edge = np.full(vertex_count, -1, dtype=np.int64)
+        active = np.ones(vertex_count, dtype=bool)
+        cycles = {}
+        for _ in range(self.max_rounds):
+            edges = np.flatnonzero(usable & active[self.edge_src])
+            if len(edges) == 0:
+                break
+            candidate = dist[self.edge_src[edges]] + weights[edges]
+            targets = self.edge_dst[edges]
+            order = np.lexsort((candidate, targets))
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = targets[order][1:] != targets[order][:-1]
+            best = order[first]
+            best_targets = targets[best]
+            improved = candidate[best] < dist[best_targets] - eps
+            if not improved.any():
+                break
+            dist[best_targets[improved]] = candidate[best][improved]
+            pred_edge[best_targets[improved]] = edges[best][improved]
+            active = np.zeros(vertex_count, dtype=bool)
+            active[best_targets[improved]] = True
+            self._extract_cycles(pred_edge, weights, best_targets[improved], cycles)
+        return [(list(edges), total) for edges, total in cycles.items()]
+
+    def _extract_cycles(self, pred_edge: np.ndarray, weights: np.ndarray, starts: np.ndarray, cycles: Dict):
+        for start in starts:
+            position = {}
+            walk = []
+            vertex = int(start)
+            while vertex not in position and pred_edge[vertex] >= 0 and len(walk) <= 2 * self.max_legs:
+                position[vertex] = len(walk)
+                edge = int(pred_edge[vertex])
+                walk.append(edge)
+                vertex = int(self.edge_src[edge])
+            if vertex not in position:
+                continue
+            # Ребра собраны в обратном порядке, разворачиваем в прямой
+            cycle_edges = walk[position[vertex]:][::-1]
+            if len(cycle_edges) > self.max_legs:
+                continue
+            total = float(weights[cycle_edges].sum())
+            if total >= 0:
+                continue
+            # Одна и та же петля, найденная из разных вершин, приводится к началу в наименьшем активе
+            sources = [int(self.edge_src[e]) for e in cycle_edges]
+            shift = sources.index(min(sources))
+            cycle_edges = cycle_edges[shift:] + cycle_edges[:shift]
+            cycles.setdefault(tuple(cycle_edges), total)
+
+    def path(self, cycle_edges: List[int]) -> List[str]:
+        return self.table.path(cycle_edges)
\ No newline at end of file
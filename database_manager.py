@@ -1,26 +1,280 @@
 import aiosqlite
 import logging
+import numpy as np
+from connection_pool import ConnectionPool
+from write_behind import WriteBehindQueue
 
 logger = logging.getLogger(__name__)
 
+# Профиль SQLite для бота: WAL (читатели не блокируют писателя), synchronous=NORMAL
+# (fsync на контрольной точке, а не на каждом коммите), отображение файла в память и крупный кэш страниц
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', 268435456),
+    ('cache_size', -65536),
+    ('temp_store', 'MEMORY'),
+)
+# Соединения только для чтения получают настройки кэша; журнал и синхронизация — свойства писателя
+READER_PRAGMAS = ('mmap_size', 'cache_size', 'temp_store')
+
+# Ключ постраничного чтения истории: (user_id, время, id). Столбец времени и его позиция в SELECT *; id — первый столбец
+KEYSET_COLUMNS = {'orders': ('timestamp', 9), 'trades': ('created_at', 7)}
+
+# Материализованная статистика закрытых сделок: итог по пользователю и корзины по дням (UTC).
+# Поддерживается триггерами trades в той же транзакции, что и запись сделки
+STATS_COLUMNS = 'total_trades, profitable_trades, total_profit, total_volume, total_duration'
+STATS_TABLES = (
+    ('user_stats', 'user_id', '{row}.user_id'),
+    ('user_daily_stats', 'user_id, day', '{row}.user_id, date(COALESCE({row}.closed_at, {row}.created_at))'),
+)
+
+
+def _stats_delta(table, keys, values, row, sign):
+    # Вклад одной сделки (row — NEW или OLD) со знаком sign; строка учитывается, только если сделка закрыта
+    values = values.format(row=row)
+    return f'''
+        INSERT INTO {table} ({keys}, {STATS_COLUMNS})
+        SELECT {values}, {sign}1, {sign}(CASE WHEN {row}.profit > 0 THEN 1 ELSE 0 END),
+               {sign}COALESCE({row}.profit, 0), {sign}COALESCE({row}.volume, 0),
+               {sign}COALESCE((julianday({row}.closed_at) - julianday({row}.created_at)) * 1440, 0)
+        WHERE {row}.status = 'closed'
+        ON CONFLICT ({keys}) DO UPDATE SET
+            total_trades = total_trades + excluded.total_trades,
+            profitable_trades = profitable_trades + excluded.profitable_trades,
+            total_profit = total_profit + excluded.total_profit,
+            total_volume = total_volume + excluded.total_volume,
+            total_duration = total_duration + excluded.total_duration;'''
+
+
+def _stats_trigger(name, event, when, deltas):
+    body = ''.join(_stats_delta(table, keys, values, row, sign)
+                   for row, sign in deltas for table, keys, values in STATS_TABLES)
+    return f'CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON trades WHEN {when} BEGIN{body}\n    END'
+
+
+def stats_rebuild_statements(user_id=None):
+    # Полный пересчет статистики (всех пользователей или одного) агрегатом по trades
+    where, params = ('', ()) if user_id is None else (' AND user_id = ?', (user_id,))
+    statements = []
+    for table, keys, values in STATS_TABLES:
+        values = values.replace('{row}.', '')
+        statements.append((f'DELETE FROM {table} WHERE 1{where}', params))
+        statements.append((f'''
+            INSERT INTO {table} ({keys}, {STATS_COLUMNS})
+            SELECT {values}, COUNT(*), SUM(CASE WHEN profit > 0 THEN 1 ELSE 0 END),
+                   SUM(COALESCE(profit, 0)), SUM(COALESCE(volume, 0)),
+                   SUM(COALESCE((julianday(closed_at) - julianday(created_at)) * 1440, 0))
+            FROM trades
+            WHERE status = 'closed'{where}
+            GROUP BY {values}
+        ''', params))
+    return statements
+
+
+# Обновления схемы по номеру PRAGMA user_version: каждое применяется один раз, в своей транзакции
+SCHEMA_MIGRATIONS = [
+    # 1: индексы под пути чтения: история и выборки по user_id + статус/время,
+    # статистика закрытых сделок (profit в индексе — покрывающий), обновления заявок по order_id
+    [
+        'CREATE INDEX IF NOT EXISTS idx_trades_user_status ON trades (user_id, status, profit)',
+        'CREATE INDEX IF NOT EXISTS idx_trades_user_created ON trades (user_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_user_timestamp ON orders (user_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_user_order ON orders (user_id, order_id)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_user_status ON orders (user_id, status)',
+        'CREATE INDEX IF NOT EXISTS idx_stop_losses_user_timestamp ON stop_losses (user_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_take_profits_user_timestamp ON take_profits (user_id, timestamp)',
+        'ANALYZE',
+    ],
+    # 2: user_stats и user_daily_stats, триггеры вставки, закрытия/правки и удаления сделки, заполнение по истории
+    [
+        '''CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            total_trades INTEGER NOT NULL DEFAULT 0,
+            profitable_trades INTEGER NOT NULL DEFAULT 0,
+            total_profit REAL NOT NULL DEFAULT 0,
+            total_volume REAL NOT NULL DEFAULT 0,
+            total_duration REAL NOT NULL DEFAULT 0
+        )''',
+        '''CREATE TABLE IF NOT EXISTS user_daily_stats (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            total_trades INTEGER NOT NULL DEFAULT 0,
+            profitable_trades INTEGER NOT NULL DEFAULT 0,
+            total_profit REAL NOT NULL DEFAULT 0,
+            total_volume REAL NOT NULL DEFAULT 0,
+            total_duration REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID''',
+        _stats_trigger('trades_stats_insert', 'INSERT', "NEW.status = 'closed'", [('NEW', '')]),
+        _stats_trigger('trades_stats_update', 'UPDATE OF user_id, profit, volume, status, created_at, closed_at',
+                       "OLD.status = 'closed' OR NEW.status = 'closed'", [('OLD', '-'), ('NEW', '')]),
+        _stats_trigger('trades_stats_delete', 'DELETE', "OLD.status = 'closed'", [('OLD', '-')]),
+        *[sql for sql, _ in stats_rebuild_statements()],
+    ],
+]
+
 class DatabaseManager:
-    def __init__(self, db_name='arbitrage_bot.db'):
+    def __init__(self, db_name='arbitrage_bot.db', write_behind=True, batch_size=100, batch_delay=0.005, readers=4):
         self.db_name = db_name
+        # conn — единственное пишущее соединение; чтения идут через читателей пула
+        self.pool = ConnectionPool(db_name, readers)
+        self.conn = None
+        self.writer = None
+        # write_behind: записи подтверждаются сразу после постановки в очередь, иначе каждый вызов ждет коммита
+        self.write_behind = write_behind
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
 
     async def connect(self):
         try:
-            self.conn = await aiosqlite.connect(self.db_name)
+            self.conn = await self.pool.open()
             logger.info(f"Connected to database: {self.db_name}")
+            await self.apply_profile()
             await self.create_tables()
+            await self.upgrade_schema()
+            await self.pool.open_readers([(name, value) for name, value in PRAGMAS if name in READER_PRAGMAS])
+            self.writer = WriteBehindQueue(self.conn, self.batch_size, self.batch_delay)
+            self.writer.start()
         except aiosqlite.Error as e:
             logger.error(f"Error connecting to database: {str(e)}")
             raise
 
     async def close(self):
+        if self.writer:
+            await self.writer.close()
+            self.writer = None
         if self.conn:
-            await self.conn.close()
+            await self.pool.close()
+            self.conn = None
             logger.info("Closed database connection")
 
+    async def apply_profile(self):
+        for name, value in PRAGMAS:
+            async with self.conn.execute(f'PRAGMA {name} = {value}') as cursor:
+                row = await cursor.fetchone()
+            if name == 'journal_mode' and row and str(row[0]).upper() != value:
+                # Например, база в памяти: WAL недоступен, остается прежний журнал
+                logger.warning(f"Journal mode {value} not applied, using {row[0]}")
+
+    async def upgrade_schema(self):
+        try:
+            async with self.conn.execute('PRAGMA user_version') as cursor:
+                version = (await cursor.fetchone())[0]
+            for number, statements in enumerate(SCHEMA_MIGRATIONS[version:], start=version + 1):
+                await self.conn.execute('BEGIN')
+                for statement in statements:
+                    await self.conn.execute(statement)
+                await self.conn.execute(f'PRAGMA user_version = {number}')
+                await self.conn.commit()
+                logger.info(f"Database schema upgraded to version {number}")
+        except aiosqlite.Error as e:
+            await self.conn.rollback()
+            logger.error(f"Error upgrading database schema: {str(e)}")
+            raise
+
+    async def _write(self, sql, params, wait=None, returning=False):
+        # Запись с returning всегда ждет коммита: без него нет lastrowid
+        wait = returning or (wait if wait is not None else not self.write_behind)
+        future = self.writer.submit(sql, params, returning, awaited=wait)
+        if wait:
+            return await future
+        return None
+
+    async def flush(self):
+        try:
+            await self.writer.flush()
+        except aiosqlite.Error as e:
+            logger.error(f"Error flushing queued writes: {str(e)}")
+            raise
+
+    def get_write_metrics(self):
+        return self.writer.metrics()
+
+    def get_pool_metrics(self):
+        return {'readers': self.pool.metrics(), 'writer': self.writer.metrics()}
+
+    async def _read(self, sql, params=(), one=False):
+        async with self.pool.reader() as conn:
+            async with conn.execute(sql, params) as cursor:
+                return await (cursor.fetchone() if one else cursor.fetchall())
+
+    def _history_query(self, columns, table, user_id, start_date=None, end_date=None, cursor=None, descending=False):
+        # cursor — (время, id) последней прочитанной строки; продолжение идет по индексу (user_id, время) без OFFSET
+        time_column = KEYSET_COLUMNS[table][0]
+        op, order = ('<', 'DESC') if descending else ('>', 'ASC')
+        conditions, params = ['user_id = ?'], [user_id]
+        if start_date is not None:
+            conditions.append(f'{time_column} >= ?')
+            params.append(start_date)
+        if end_date is not None:
+            conditions.append(f'{time_column} <= ?')
+            params.append(end_date)
+        if cursor is not None:
+            conditions.append(f'({time_column}, id) {op} (?, ?)')
+            params.extend(cursor)
+        sql = f'''
+            SELECT {columns} FROM {table}
+            WHERE {' AND '.join(conditions)}
+            ORDER BY {time_column} {order}, id {order}
+        '''
+        return sql, params
+
+    async def _iter_history(self, table, user_id, start_date=None, end_date=None, cursor=None, descending=False, chunk_size=1000):
+        # Читатель пула занимается только на время одной страницы
+        position = KEYSET_COLUMNS[table][1]
+        while True:
+            sql, params = self._history_query('*', table, user_id, start_date, end_date, cursor, descending)
+            rows = await self._read(sql + ' LIMIT ?', (*params, chunk_size))
+            for row in rows:
+                yield row
+            if len(rows) < chunk_size:
+                return
+            cursor = (rows[-1][position], rows[-1][0])
+
+    async def _load_columns(self, table, columns, user_id, start_date=None, end_date=None, chunk_size=10000, labels=()):
+        # Строки читаются пачками по chunk_size прямо в столбцы float64 (порядок F): в памяти одновременно
+        # только одна пачка кортежей, итог — массивы, а не список строк.
+        # labels — текстовые столбцы: по ходу чтения кодируются номерами, каждая строка хранится один раз
+        time_column = KEYSET_COLUMNS[table][0]
+        sql, params = self._history_query(
+            f"id, CAST(strftime('%s', {time_column}) AS INTEGER), {', '.join((*columns, *labels))}",
+            table, user_id, start_date, end_date)
+        width = len(columns) + 2
+        data = np.empty((chunk_size, width), order='F')
+        codes = np.empty((chunk_size, len(labels)), dtype=np.int32, order='F')
+        lookups = [{} for _ in labels]
+        count = 0
+        async with self.pool.reader() as conn:
+            async with conn.execute(sql, params) as cursor:
+                while True:
+                    rows = await cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    if count + len(rows) > len(data):
+                        grown = np.empty((2 * len(data), width), order='F')
+                        grown[:count] = data[:count]
+                        data = grown
+                        grown = np.empty((len(data), len(labels)), dtype=np.int32, order='F')
+                        grown[:count] = codes[:count]
+                        codes = grown
+                    if labels:
+                        data[count:count + len(rows)] = [row[:width] for row in rows]
+                        for j, lookup in enumerate(lookups):
+                            codes[count:count + len(rows), j] = [lookup.setdefault(row[width + j], len(lookup)) for row in rows]
+                    else:
+                        data[count:count + len(rows)] = rows
+                    count += len(rows)
+        data = data[:count]
+        result = {'id': data[:, 0].astype(np.int64), 'timestamp': data[:, 1].astype('datetime64[s]')}
+        for i, name in enumerate(columns):
+            result[name] = data[:, i + 2]
+        for j, (name, lookup) in enumerate(zip(labels, lookups)):
+            values = np.empty(len(lookup), dtype=object)
+            values[:] = list(lookup)
+            result[name] = values[codes[:count, j]]
+        return result
+
     async def create_tables(self):
         try:
             await self.conn.execute('''
@@ -87,11 +341,10 @@ class DatabaseManager:
 
     async def add_user(self, telegram_id, username):
         try:
-            await self.conn.execute('''
+            await self._write('''
                 INSERT OR IGNORE INTO users (telegram_id, username)
                 VALUES (?, ?)
-            ''', (telegram_id, username))
-            await self.conn.commit()
+            ''', (telegram_id, username), wait=True)
             logger.info(f"User added or updated: {telegram_id}")
         except aiosqlite.Error as e:
             logger.error(f"Error adding user: {str(e)}")
@@ -99,33 +352,31 @@ class DatabaseManager:
 
     async def get_user(self, telegram_id):
         try:
-            async with self.conn.execute('SELECT * FROM users WHERE telegram_id = ?', (telegram_id,)) as cursor:
-                return await cursor.fetchone()
+            return await self._read('SELECT * FROM users WHERE telegram_id = ?', (telegram_id,), one=True)
         except aiosqlite.Error as e:
             logger.error(f"Error getting user: {str(e)}")
             raise
 
     async def add_trade(self, user_id, exchange, path, profit, volume):
         try:
-            cursor = await self.conn.execute('''
+            row_id = await self._write('''
                 INSERT INTO trades (user_id, exchange, path, profit, volume, status)
                 VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, exchange, path, profit, volume, 'open'))
-            await self.conn.commit()
+            ''', (user_id, exchange, path, profit, volume, 'open'), returning=True)
             logger.info(f"Trade added for user {user_id}")
-            return cursor.lastrowid
+            return row_id
         except aiosqlite.Error as e:
             logger.error(f"Error adding trade: {str(e)}")
             raise
 
     async def close_trade(self, trade_id, profit):
         try:
-            await self.conn.execute('''
+            # user_stats и корзина дня обновляются триггером в той же транзакции
+            await self._write('''
                 UPDATE trades
                 SET status = ?, profit = ?, closed_at = CURRENT_TIMESTAMP
                 WHERE id = ?
-            ''', ('closed', profit, trade_id))
-            await self.conn.commit()
+            ''', ('closed', profit, trade_id), wait=True)
             logger.info(f"Trade {trade_id} closed")
         except aiosqlite.Error as e:
             logger.error(f"Error closing trade: {str(e)}")
@@ -134,107 +385,197 @@ class DatabaseManager:
     async def get_user_trades(self, user_id, status=None):
         try:
             if status:
-                async with self.conn.execute('SELECT * FROM trades WHERE user_id = ? AND status = ?', (user_id, status)) as cursor:
-                    return await cursor.fetchall()
+                return await self._read('SELECT * FROM trades WHERE user_id = ? AND status = ?', (user_id, status))
             else:
-                async with self.conn.execute('SELECT * FROM trades WHERE user_id = ?', (user_id,)) as cursor:
-                    return await cursor.fetchall()
+                return await self._read('SELECT * FROM trades WHERE user_id = ?', (user_id,))
         except aiosqlite.Error as e:
             logger.error(f"Error getting user trades: {str(e)}")
             raise
 
+    async def get_user_trade_history(self, user_id, limit=10, cursor=None):
+        # Последние сделки, от новых к старым; следующая страница — cursor=(created_at, id) последней строки
+        try:
+            sql, params = self._history_query('id, created_at, path, profit, status', 'trades', user_id,
+                                              cursor=cursor, descending=True)
+            return await self._read(sql + ' LIMIT ?', (*params, limit))
+        except aiosqlite.Error as e:
+            logger.error(f"Error getting user trade history: {str(e)}")
+            raise
+
+    async def iter_trades(self, user_id, start_date=None, end_date=None, cursor=None, chunk_size=1000):
+        try:
+            async for row in self._iter_history('trades', user_id, start_date, end_date, cursor, chunk_size=chunk_size):
+                yield row
+        except aiosqlite.Error as e:
+            logger.error(f"Error iterating user trades: {str(e)}")
+            raise
+
+    async def load_trade_columns(self, user_id, start_date=None, end_date=None, chunk_size=10000):
+        # {'id', 'timestamp' (created_at), 'profit', 'volume', 'path'} — массивы NumPy в порядке времени
+        try:
+            return await self._load_columns('trades', ('profit', 'volume'), user_id, start_date, end_date, chunk_size,
+                                            labels=('path',))
+        except aiosqlite.Error as e:
+            logger.error(f"Error loading trade columns: {str(e)}")
+            raise
+
     async def get_trade_statistics(self, user_id):
         try:
-            async with self.conn.execute('''
-                SELECT COUNT(*) as total_trades,
-                       SUM(CASE WHEN profit > 0 THEN 1 ELSE 0 END) as profitable_trades,
-                       SUM(profit) as total_profit,
-                       AVG(profit) as avg_profit
-                FROM trades
-                WHERE user_id = ? AND status = 'closed'
-            ''', (user_id,)) as cursor:
-                return await cursor.fetchone()
+            row = await self._read('''
+                SELECT total_trades, profitable_trades, total_profit, total_profit / total_trades as avg_profit
+                FROM user_stats
+                WHERE user_id = ? AND total_trades > 0
+            ''', (user_id,), one=True)
+            return row if row is not None else (0, None, None, None)
         except aiosqlite.Error as e:
             logger.error(f"Error getting trade statistics: {str(e)}")
             raise
 
-    async def save_order(self, user_id, order):
+    async def get_user_stats(self, user_id):
+        # Итог по закрытым сделкам с суммарным объемом и длительностью (минуты)
         try:
-            await self.conn.execute('''
+            return await self._read(f'SELECT {STATS_COLUMNS} FROM user_stats WHERE user_id = ?', (user_id,), one=True)
+        except aiosqlite.Error as e:
+            logger.error(f"Error getting user stats: {str(e)}")
+            raise
+
+    async def get_daily_statistics(self, user_id, start_day=None, end_day=None):
+        # Корзины по дням закрытия (YYYY-MM-DD, UTC), границы включительно
+        try:
+            return await self._read(f'''
+                SELECT day, {STATS_COLUMNS}
+                FROM user_daily_stats
+                WHERE user_id = ? AND day >= ? AND day <= ?
+                ORDER BY day
+            ''', (user_id, start_day or '', end_day or '9999-12-31'))
+        except aiosqlite.Error as e:
+            logger.error(f"Error getting daily statistics: {str(e)}")
+            raise
+
+    async def rebuild_trade_statistics(self, user_id=None):
+        # Для загрузки истории в обход триггеров или после ручной правки: пересчет одной транзакцией через писателя
+        try:
+            await self._write(stats_rebuild_statements(user_id), (), wait=True)
+            logger.info(f"Trade statistics rebuilt for {'all users' if user_id is None else f'user {user_id}'}")
+        except aiosqlite.Error as e:
+            logger.error(f"Error rebuilding trade statistics: {str(e)}")
+            raise
+
+    async def save_order(self, user_id, order, wait=None):
+        try:
+            await self._write('''
                 INSERT INTO orders (user_id, order_id, symbol, type, side, amount, price, status)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (user_id, order['id'], order['symbol'], order['type'], order['side'], order['amount'], order['price'], order['status']))
-            await self.conn.commit()
+            ''', (user_id, order['id'], order['symbol'], order['type'], order['side'], order['amount'], order['price'], order['status']), wait)
         except aiosqlite.Error as e:
             logger.error(f"Error saving order: {str(e)}")
             raise
 
-    async def update_order(self, user_id, order):
+    async def update_order(self, user_id, order, wait=None):
         try:
-            await self.conn.execute('''
+            await self._write('''
                 UPDATE orders
                 SET status = ?, price = ?
                 WHERE user_id = ? AND order_id = ?
-            ''', (order['status'], order['price'], user_id, order['id']))
-            await self.conn.commit()
+            ''', (order['status'], order['price'], user_id, order['id']), wait)
         except aiosqlite.Error as e:
             logger.error(f"Error updating order: {str(e)}")
             raise
 
-    async def save_stop_loss(self, user_id, order):
+    async def save_stop_loss(self, user_id, order, wait=None):
         try:
-            await self.conn.execute('''
+            await self._write('''
                 INSERT INTO stop_losses (user_id, order_id, symbol, price)
                 VALUES (?, ?, ?, ?)
-            ''', (user_id, order['id'], order['symbol'], order['price']))
-            await self.conn.commit()
+            ''', (user_id, order['id'], order['symbol'], order['price']), wait)
         except aiosqlite.Error as e:
             logger.error(f"Error saving stop loss: {str(e)}")
             raise
 
-    async def save_take_profit(self, user_id, order):
+    async def save_take_profit(self, user_id, order, wait=None):
         try:
-            await self.conn.execute('''
+            await self._write('''
                 INSERT INTO take_profits (user_id, order_id, symbol, price)
                 VALUES (?, ?, ?, ?)
-            ''', (user_id, order['id'], order['symbol'], order['price']))
-            await self.conn.commit()
+            ''', (user_id, order['id'], order['symbol'], order['price']), wait)
         except aiosqlite.Error as e:
             logger.error(f"Error saving take profit: {str(e)}")
             raise
 
-    async def update_order_status(self, user_id, order_id, status):
+    async def update_order_status(self, user_id, order_id, status, wait=None):
         try:
-            await self.conn.execute('''
+            await self._write('''
                 UPDATE orders
                 SET status = ?
                 WHERE user_id = ? AND order_id = ?
-            ''', (status, user_id, order_id))
-            await self.conn.commit()
+            ''', (status, user_id, order_id), wait)
         except aiosqlite.Error as e:
             logger.error(f"Error updating order status: {str(e)}")
             raise
 
     async def get_order_history(self, user_id):
         try:
-            async with self.conn.execute('''
+            return await self._read('''
                 SELECT * FROM orders
                 WHERE user_id = ?
                 ORDER BY timestamp DESC
-            ''', (user_id,)) as cursor:
-                return await cursor.fetchall()
+            ''', (user_id,))
         except aiosqlite.Error as e:
             logger.error(f"Error getting order history: {str(e)}")
             raise
 
+    async def iter_order_history(self, user_id, cursor=None, chunk_size=1000):
+        # Как get_order_history, но страницами по chunk_size: (timestamp, id) < cursor
+        try:
+            async for row in self._iter_history('orders', user_id, cursor=cursor, descending=True, chunk_size=chunk_size):
+                yield row
+        except aiosqlite.Error as e:
+            logger.error(f"Error iterating order history: {str(e)}")
+            raise
+
+    async def iter_user_orders(self, user_id, start_date, end_date, cursor=None, chunk_size=1000):
+        # Заявки (orders) за период, как get_user_trades, но страницами по chunk_size: (timestamp, id) > cursor.
+        # Сделки из trades — iter_trades
+        try:
+            async for row in self._iter_history('orders', user_id, start_date, end_date, cursor, chunk_size=chunk_size):
+                yield row
+        except aiosqlite.Error as e:
+            logger.error(f"Error iterating user orders: {str(e)}")
+            raise
+
+    async def load_order_columns(self, user_id, start_date=None, end_date=None, chunk_size=10000):
+        # {'id', 'timestamp', 'amount', 'price'} — массивы NumPy в порядке времени
+        try:
+            return await self._load_columns('orders', ('amount', 'price'), user_id, start_date, end_date, chunk_size)
+        except aiosqlite.Error as e:
+            logger.error(f"Error loading order columns: {str(e)}")
+            raise
+
     async def get_user_trades(self, user_id, start_date, end_date):
         try:
-            async with self.conn.execute('''
+            return await self._read('''
                 SELECT * FROM orders
                 WHERE user_id = ? AND timestamp BETWEEN ? AND ?
                 ORDER BY timestamp ASC
-            ''', (user_id, start_date, end_date)) as cursor:
-                return await cursor.fetchall()
+            ''', (user_id, start_date, end_date))
         except aiosqlite.Error as e:
             logger.error(f"Error getting user trades: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+
+if __name__ == '__main__':
+    # Пересчет статистики: python database_manager.py [база] [user_id]
+    import asyncio
+    import sys
+
+    async def rebuild(db_name, user_id):
+        db_manager = DatabaseManager(db_name)
+        await db_manager.connect()
+        try:
+            await db_manager.rebuild_trade_statistics(user_id)
+        finally:
+            await db_manager.close()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(rebuild(sys.argv[1] if len(sys.argv) > 1 else 'arbitrage_bot.db',
+                        int(sys.argv[2]) if len(sys.argv) > 2 else None))
\ No newline at end of file
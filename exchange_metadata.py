@@ -0,0 +1,165 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from market_table import MarketTable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SymbolInfo:
+    symbol: str
+    base_asset: str
+    quote_asset: str
+    status: str
+    tick_size: float = 0.0
+    step_size: float = 0.0
+    min_qty: float = 0.0
+    max_qty: float = 0.0
+    min_notional: float = 0.0
+    # Число знаков суммы в quote-активе (quoteOrderQty)
+    quote_precision: int = 8
+
+    @property
+    def is_trading(self) -> bool:
+        return self.status == 'TRADING'
+
+
+def parse_symbol(raw: Dict) -> SymbolInfo:
+    info = SymbolInfo(symbol=raw['symbol'], base_asset=raw['baseAsset'],
+                      quote_asset=raw['quoteAsset'], status=raw['status'],
+                      quote_precision=int(raw.get('quoteAssetPrecision', raw.get('quotePrecision', 8))))
+    for f in raw.get('filters', []):
+        filter_type = f.get('filterType')
+        if filter_type == 'PRICE_FILTER':
+            info.tick_size = float(f['tickSize'])
+        elif filter_type == 'LOT_SIZE':
+            info.step_size = float(f['stepSize'])
+            info.min_qty = float(f['minQty'])
+            info.max_qty = float(f['maxQty'])
+        elif filter_type in ('MIN_NOTIONAL', 'NOTIONAL'):
+            info.min_notional = float(f.get('minNotional', 0))
+    return info
+
+
+class ExchangeMetadataCache:
+    def __init__(self, binance_api, cache_path: str = 'exchange_info_cache.json', ttl: float = 3600.0,
+                 retry_delay: float = 60.0, taker_fee: float = 0.001):
+        self.binance_api = binance_api
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.retry_delay = retry_delay
+        self.taker_fee = taker_fee
+        self.exchange_info: Optional[Dict] = None
+        self.symbols: Dict[str, SymbolInfo] = {}
+        self.by_assets: Dict[Tuple[str, str], SymbolInfo] = {}
+        self.markets: List[Dict] = []
+        self.fetched_at = 0.0
+        # Увеличивается при каждой загрузке, чтобы зависимые индексы знали, когда перестраиваться
+        self.version = 0
+        self._market_table: Optional[MarketTable] = None
+        self._refresh_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def _load(self, exchange_info: Dict, fetched_at: float):
+        # Ответ с ошибкой или без пар не должен заменить рабочие метаданные
+        raw_symbols = exchange_info.get('symbols') if isinstance(exchange_info, dict) else None
+        if not isinstance(raw_symbols, list) or not raw_symbols:
+            raise ValueError(f"exchangeInfo без списка пар: {str(exchange_info)[:200]}")
+        symbols = {}
+        by_assets = {}
+        for raw in raw_symbols:
+            info = parse_symbol(raw)
+            symbols[info.symbol] = info
+            by_assets[(info.base_asset, info.quote_asset)] = info
+        self.exchange_info = exchange_info
+        self.symbols = symbols
+        self.by_assets = by_assets
+        self.markets = [{'symbol': s.symbol, 'base_asset': s.base_asset, 'quote_asset': s.quote_asset,
+                         'step_size': s.step_size, 'min_qty': s.min_qty, 'max_qty': s.max_qty,
+                         'min_notional': s.min_notional}
+                        for s in symbols.values() if s.is_trading]
+        self.fetched_at = fetched_at
+        self.version += 1
+
+    def is_stale(self) -> bool:
+        return self.exchange_info is None or time.time() - self.fetched_at > self.ttl
+
+    def load_from_disk(self) -> bool:
+        if not os.path.exists(self.cache_path):
+            return False
+        try:
+            with open(self.cache_path, 'r') as f:
+                data = json.load(f)
+            self._load(data['exchange_info'], data['fetched_at'])
+            logger.info(f"Метаданные биржи загружены из {self.cache_path}: {len(self.symbols)} пар")
+            return True
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Ошибка чтения кэша метаданных биржи: {str(e)}")
+            return False
+
+    def save_to_disk(self):
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'fetched_at': self.fetched_at, 'exchange_info': self.exchange_info}, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.error(f"Ошибка записи кэша метаданных биржи: {str(e)}")
+
+    async def refresh(self):
+        async with self._refresh_lock:
+            exchange_info = await self.binance_api.fetch_exchange_info()
+            try:
+                self._load(exchange_info, time.time())
+            except ValueError as e:
+                logger.error(f"Метаданные биржи не обновлены, остаются прежние ({len(self.symbols)} пар): {str(e)}")
+                raise
+            self.save_to_disk()
+            logger.info(f"Метаданные биржи обновлены: {len(self.symbols)} пар")
+
+    async def ensure_fresh(self):
+        if self.exchange_info is None and not self.load_from_disk():
+            await self.refresh()
+        elif self.is_stale() and (self._task is None or self._task.done()):
+            # Устаревшие данные отдаем сразу, обновление идет в фоне
+            await self.start()
+
+    async def start(self):
+        if self.exchange_info is None:
+            self.load_from_disk()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _refresh_loop(self):
+        while True:
+            delay = self.fetched_at + self.ttl - time.time() if self.exchange_info is not None else 0
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Ошибка обновления метаданных биржи: {str(e)}")
+                await asyncio.sleep(self.retry_delay)
+
+    def get_market_table(self) -> MarketTable:
+        # Общая таблица цен по интернированным парам, одна на версию метаданных
+        if self._market_table is None or self._market_table.version != self.version:
+            self._market_table = MarketTable(self.markets, self.version, self.taker_fee)
+        return self._market_table
+
+    def get_symbol(self, symbol: str) -> Optional[SymbolInfo]:
+        return self.symbols.get(symbol)
+
+    def get_symbol_by_assets(self, base_asset: str, quote_asset: str) -> Optional[SymbolInfo]:
+        return self.by_assets.get((base_asset, quote_asset))
\ No newline at end of file
@@ -0,0 +1,176 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BUY = 'BUY'
+SELL = 'SELL'
+
+
+def depth_arrays(orderbook: Dict, limit: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # bids по убыванию цены, asks по возрастанию, как в ответе /api/v3/depth
+    bids = np.asarray(orderbook['bids'][:limit], dtype=np.float64).reshape(-1, 2)
+    asks = np.asarray(orderbook['asks'][:limit], dtype=np.float64).reshape(-1, 2)
+    return bids[:, 0], bids[:, 1], asks[:, 0], asks[:, 1]
+
+
+def legs_for_path(table, path: List[str]) -> Optional[List[Tuple[str, str]]]:
+    # Ребро 2p таблицы — продажа base пары p, ребро 2p + 1 — покупка base за quote
+    edges = table.path_edges(path)
+    if len(edges) == 0 or (edges < 0).any():
+        return None
+    return [(table.pairs[table.edge_pair[e]], SELL if e % 2 == 0 else BUY) for e in edges]
+
+
+class FillBatch:
+    def __init__(self, legs: List[List[Tuple[str, str]]], cum_in: np.ndarray, cum_out: np.ndarray,
+                 rate: np.ndarray, best: np.ndarray, is_buy: np.ndarray, active: np.ndarray):
+        self.legs = legs
+        # Массивы формы (пути, ноги, уровни): накопленный вход и выход ноги по уровням стакана
+        # и курс уровня (выход на единицу входа)
+        self.cum_in = cum_in
+        self.cum_out = cum_out
+        self.rate = rate
+        # Формы (пути, ноги): лучшая цена стороны, направление, признак реальной (не выравнивающей) ноги
+        self.best = best
+        self.is_buy = is_buy
+        self.active = active
+
+    def __len__(self) -> int:
+        return len(self.legs)
+
+
+class FillSimulator:
+    def __init__(self, fee_rate: float = 0.001, max_levels: int = 100):
+        self.fee_rate = fee_rate
+        self.max_levels = max_levels
+
+    def build_batch(self, paths: List[List[Tuple[str, str]]], books: Dict[str, Dict]) -> FillBatch:
+        # paths: для каждого пути список ног (символ, BUY|SELL); books: символ -> стакан в формате depth.
+        # Вход ноги BUY — quote (потребляются asks), вход ноги SELL — base (потребляются bids)
+        path_count = len(paths)
+        leg_count = max((len(legs) for legs in paths), default=0)
+        levels = self.max_levels
+        cum_in = np.full((path_count, leg_count, levels), np.inf)
+        cum_out = np.full((path_count, leg_count, levels), np.inf)
+        rate = np.zeros((path_count, leg_count, levels))
+        best = np.full((path_count, leg_count), np.nan)
+        is_buy = np.zeros((path_count, leg_count), dtype=bool)
+        active = np.zeros((path_count, leg_count), dtype=bool)
+        sides = {}
+        for i, legs in enumerate(paths):
+            for k, (symbol, side) in enumerate(legs):
+                key = (symbol, side)
+                if key not in sides:
+                    book = books.get(symbol)
+                    sides[key] = self._side_arrays(book, side) if book is not None else None
+                arrays = sides[key]
+                active[i, k] = True
+                is_buy[i, k] = side == BUY
+                if arrays is None:
+                    continue
+                side_in, side_out, side_rate, side_best = arrays
+                n = len(side_in)
+                cum_in[i, k, :n] = side_in
+                cum_out[i, k, :n] = side_out
+                rate[i, k, :n] = side_rate
+                best[i, k] = side_best
+        return FillBatch(paths, cum_in, cum_out, rate, best, is_buy, active)
+
+    def _side_arrays(self, book: Dict, side: str):
+        bid_px, bid_qty, ask_px, ask_qty = depth_arrays(book, self.max_levels)
+        if side == BUY:
+            price, qty = ask_px, ask_qty
+            level_in, level_out = price * qty, qty
+        else:
+            price, qty = bid_px, bid_qty
+            level_in, level_out = qty, price * qty
+        if len(price) == 0:
+            return None
+        return np.cumsum(level_in), np.cumsum(level_out), level_out / level_in, price[0]
+
+    def _fill_legs(self, batch: FillBatch, sizes: np.ndarray):
+        # Проход по ногам для всех путей сразу: номер уровня, на котором заканчивается вход,
+        # ищется по накопленным суммам, внутри уровня выход интерполируется линейно
+        path_count, leg_count = batch.best.shape
+        rows = np.arange(path_count)
+        amount = np.asarray(sizes, dtype=np.float64).copy()
+        leg_in = np.zeros((path_count, leg_count))
+        leg_out = np.zeros((path_count, leg_count))
+        marginal = np.ones(path_count)
+        for k in range(leg_count):
+            cum_in, cum_out, rate = batch.cum_in[:, k], batch.cum_out[:, k], batch.rate[:, k]
+            level = (cum_in < amount[:, None]).sum(axis=1)
+            inside = level < cum_in.shape[1]
+            level = np.minimum(level, cum_in.shape[1] - 1)
+            prev_in = np.where(level > 0, cum_in[rows, level - 1], 0.0)
+            prev_out = np.where(level > 0, cum_out[rows, level - 1], 0.0)
+            level_rate = rate[rows, level]
+            with np.errstate(invalid='ignore'):
+                out = (prev_out + (amount - prev_in) * level_rate) * (1 - self.fee_rate)
+            # Глубины стакана не хватает — исполнение невозможно
+            out = np.where(inside & (level_rate > 0), out, np.nan)
+            active = batch.active[:, k]
+            out = np.where(active, out, amount)
+            marginal = marginal * np.where(active, level_rate * (1 - self.fee_rate), 1.0)
+            leg_in[:, k] = amount
+            leg_out[:, k] = out
+            amount = out
+        return amount, leg_in, leg_out, marginal
+
+    def simulate(self, batch: FillBatch, sizes) -> Dict[str, np.ndarray]:
+        sizes = np.broadcast_to(np.asarray(sizes, dtype=np.float64), (len(batch),))
+        output, leg_in, leg_out, _ = self._fill_legs(batch, sizes)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # VWAP в quote за base: для BUY — потрачено quote / получено base (до комиссии), для SELL наоборот
+            gross_out = leg_out / (1 - self.fee_rate)
+            vwap = np.where(batch.is_buy, leg_in / gross_out, gross_out / leg_in)
+            slippage = np.where(batch.is_buy, vwap / batch.best - 1, 1 - vwap / batch.best) * 100
+            profit_percent = (output / sizes - 1) * 100
+        vwap[~batch.active] = np.nan
+        slippage[~batch.active] = np.nan
+        return {
+            'feasible': np.isfinite(output),
+            'output': output,
+            'profit': output - sizes,
+            'profit_percent': profit_percent,
+            'vwap': vwap,
+            'slippage': slippage,
+        }
+
+    def max_profitable_size(self, batch: FillBatch, max_size=None, iterations: int = 48) -> Dict[str, np.ndarray]:
+        # Выход пути — вогнутая кусочно-линейная функция входа, поэтому прибыль максимальна там,
+        # где предельный курс пути (произведение курсов текущих уровней с комиссией) падает ниже 1.
+        # Граница ищется бинарным поиском одновременно для всех путей
+        path_count = len(batch)
+        depth_limit = self._depth_limit(batch)
+        high = depth_limit if max_size is None else np.minimum(depth_limit, max_size)
+        high = np.where(np.isfinite(high), high, 0.0)
+        low = np.zeros(path_count)
+        for _ in range(iterations):
+            middle = (low + high) / 2
+            _, _, _, marginal = self._fill_legs(batch, middle)
+            profitable = marginal > 1
+            low = np.where(profitable, middle, low)
+            high = np.where(profitable, high, middle)
+        result = self.simulate(batch, low)
+        result['size'] = low
+        result['profitable'] = result['feasible'] & (result['profit'] > 0)
+        return result
+
+    def _depth_limit(self, batch: FillBatch) -> np.ndarray:
+        # Наибольший вход, который проходит через всю глубину каждой ноги, в единицах входа первой ноги
+        path_count, leg_count = batch.best.shape
+        limit = np.full(path_count, np.inf)
+        reach = np.ones(path_count)
+        for k in range(leg_count):
+            cum_in = batch.cum_in[:, k]
+            finite = np.where(np.isfinite(cum_in), cum_in, 0.0)
+            depth = finite.max(axis=1) if cum_in.shape[1] else np.zeros(path_count)
+            active = batch.active[:, k]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                limit = np.where(active, np.minimum(limit, depth / reach), limit)
+                # Курс лучшего уровня оценивает сверху, сколько входа ноги k дает единица стартового актива
+                reach = np.where(active, reach * batch.rate[:, k, 0] * (1 - self.fee_rate), reach)
+        return np.where(np.isfinite(limit), limit * (1 - 1e-9), 0.0)
\ No newline at end of file
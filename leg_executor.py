@@ -0,0 +1,247 @@
+import asyncio
+import itertools
+import logging
+import math
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+FILLED = 'filled'
+PARTIAL = 'partial'
+FAILED = 'failed'
+
+
+def round_down(amount: float, step: float) -> float:
+    # Вниз до шага; округление до знаков шага убирает хвосты вида 0.30000000000000004
+    if step <= 0:
+        return amount
+    decimals = max(0, -math.floor(math.log10(step)))
+    return round(math.floor(amount / step + 1e-9) * step, decimals)
+
+
+class Leg:
+    def __init__(self, index: int, src: str, dst: str, symbol: str, side: str, info=None):
+        self.index = index
+        self.src = src
+        self.dst = dst
+        self.symbol = symbol
+        self.side = side
+        # SymbolInfo пары: фильтры LOT_SIZE / NOTIONAL и точность quote
+        self.info = info
+        self.amount_in = 0.0
+        self.amount_spent = 0.0
+        self.amount_out = 0.0
+        self.client_order_id: Optional[str] = None
+        self.order_id = None
+        self.status = 'PENDING'
+        self.prefunded = False
+        self.submitted_at: Optional[float] = None
+        self.filled_at: Optional[float] = None
+
+    def as_dict(self) -> Dict:
+        return {
+            'symbol': self.symbol, 'side': self.side, 'src': self.src, 'dst': self.dst,
+            'amount_in': self.amount_in, 'amount_spent': self.amount_spent, 'amount_out': self.amount_out,
+            'status': self.status,
+            'prefunded': self.prefunded, 'order_id': self.order_id,
+            'latency': self.filled_at - self.submitted_at if self.filled_at and self.submitted_at else None,
+        }
+
+
+class LegExecutor:
+    def __init__(self, exchange_api, leg_timeout: float = 2.0, fee_rate: float = 0.001, min_fill_ratio: float = 0.98):
+        # Исполнение пути по ногам: ноги, для которых есть запас входного актива, отправляются сразу и параллельно,
+        # зависимые ноги — по событию исполнения предыдущей, не дожидаясь ответа REST
+        self.exchange_api = exchange_api
+        self.leg_timeout = leg_timeout
+        self.fee_rate = fee_rate
+        # Нога, исполненная меньше чем на min_fill_ratio, считается частично исполненной
+        self.min_fill_ratio = min_fill_ratio
+        self._fills: Dict[str, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        # Без пользовательского потока каждая нога ждет ответа REST, и зависимые ноги уходят позже
+        if hasattr(exchange_api, 'add_fill_listener'):
+            exchange_api.add_fill_listener(self.on_fill)
+        else:
+            logger.warning(f"{type(exchange_api).__name__} не передает события исполнения: ноги сцепляются по ответам REST")
+
+    def on_fill(self, event: Dict):
+        # Событие исполнения из пользовательского потока биржи: {'clientOrderId', 'status', 'executedQty', ...}
+        future = self._fills.get(event.get('clientOrderId'))
+        if future is not None and not future.done() and event.get('status') in ('FILLED', 'PARTIALLY_FILLED', 'EXPIRED', 'CANCELED'):
+            if event['status'] != 'PARTIALLY_FILLED' or event.get('final'):
+                future.set_result(event)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, request: asyncio.Future):
+        if future.done():
+            # Исполнение уже пришло событием; ошибку запоздавшего ответа только забираем
+            if not request.cancelled():
+                request.exception()
+        elif request.cancelled():
+            future.cancel()
+        elif request.exception() is not None:
+            future.set_exception(request.exception())
+        else:
+            future.set_result(request.result())
+
+    def plan(self, path: List[str]) -> List[Leg]:
+        metadata = self.exchange_api.metadata
+        legs = []
+        for i, (src, dst) in enumerate(zip(path, path[1:])):
+            info = metadata.get_symbol_by_assets(src, dst)
+            if info is not None:
+                legs.append(Leg(i, src, dst, info.symbol, 'SELL', info))
+                continue
+            info = metadata.get_symbol_by_assets(dst, src)
+            if info is None:
+                raise ValueError(f"Нет пары для {src}->{dst}")
+            legs.append(Leg(i, src, dst, info.symbol, 'BUY', info))
+        return legs
+
+    def _estimate_inputs(self, legs: List[Leg], size: float) -> List[float]:
+        # Ожидаемый вход каждой ноги по текущим курсам таблицы с учетом комиссии
+        table = self.exchange_api.metadata.get_market_table()
+        amounts = []
+        amount = size
+        for leg in legs:
+            amounts.append(amount)
+            edge = table.edge_id(leg.src, leg.dst)
+            rate = table.rate[edge] if edge >= 0 else float('nan')
+            amount = amount * rate * (1 - self.fee_rate)
+        return amounts
+
+    def _order_amount(self, leg: Leg, amount: float) -> float:
+        # Продажа — количество base по stepSize, покупка — сумма quote по точности quote.
+        # minQty и minNotional проверяются до отправки, оценка второй величины — по курсу таблицы
+        info = leg.info
+        if info is None:
+            return amount
+        table = self.exchange_api.metadata.get_market_table()
+        edge = table.edge_id(leg.src, leg.dst)
+        rate = table.rate[edge] if edge >= 0 else float('nan')
+        if leg.side == 'SELL':
+            amount = round_down(amount, info.step_size)
+            quantity, notional = amount, amount * rate
+        else:
+            amount = round_down(amount, 10.0 ** -info.quote_precision)
+            quantity, notional = amount * rate, amount
+        if amount <= 0 or quantity < info.min_qty or notional < info.min_notional:
+            raise ValueError(f"Нога {leg.symbol} {leg.side}: объем {amount} ниже minQty {info.min_qty} "
+                             f"или minNotional {info.min_notional}")
+        return amount
+
+    async def _submit(self, leg: Leg, amount: float) -> Dict:
+        amount = self._order_amount(leg, amount)
+        leg.client_order_id = f"leg-{next(self._ids)}"
+        leg.amount_in = amount
+        future = asyncio.get_running_loop().create_future()
+        self._fills[leg.client_order_id] = future
+        leg.submitted_at = time.perf_counter()
+        leg.status = 'SUBMITTED'
+        kwargs = {'quantity': amount} if leg.side == 'SELL' else {'quote_quantity': amount}
+        request = asyncio.ensure_future(self.exchange_api.place_order(
+            leg.symbol, leg.side, 'MARKET', client_order_id=leg.client_order_id, **kwargs))
+        # Первым приходит либо событие исполнения, либо ответ REST — берется то, что раньше
+        request.add_done_callback(lambda r: self._resolve(future, r))
+        try:
+            event = await asyncio.wait_for(future, self.leg_timeout)
+        finally:
+            self._fills.pop(leg.client_order_id, None)
+        leg.filled_at = time.perf_counter()
+        leg.order_id = event.get('orderId')
+        if 'code' in event:
+            raise RuntimeError(event.get('msg', event['code']))
+        executed, quote = float(event.get('executedQty', 0)), float(event.get('cummulativeQuoteQty', 0))
+        received = quote if leg.side == 'SELL' else executed
+        leg.amount_out = received * (1 - self.fee_rate)
+        spent = executed if leg.side == 'SELL' else quote
+        leg.amount_spent = spent
+        leg.status = 'FILLED' if spent >= amount * self.min_fill_ratio else ('PARTIALLY_FILLED' if spent > 0 else 'EXPIRED')
+        return event
+
+    async def _cancel(self, leg: Leg):
+        # Заявка без ответа (таймаут) снимается по clientOrderId
+        if leg.client_order_id is None or leg.status not in ('SUBMITTED', 'PARTIALLY_FILLED'):
+            return
+        try:
+            response = await self.exchange_api.cancel_order(leg.symbol, leg.order_id, client_order_id=leg.client_order_id)
+            if 'code' in response:
+                logger.warning(f"Заявка {leg.client_order_id} по {leg.symbol} не снята: {response.get('msg')}")
+            else:
+                leg.status = 'CANCELED'
+        except Exception as e:
+            logger.error(f"Не удалось отменить заявку {leg.client_order_id} по {leg.symbol}: {str(e)}")
+
+    async def execute(self, path, size: float, inventory: Optional[Dict[str, float]] = None) -> Dict:
+        assets = path.split('->') if isinstance(path, str) else list(path)
+        legs = self.plan(assets)
+        inputs = self._estimate_inputs(legs, size)
+        inventory = dict(inventory or {})
+        # Первая нога всегда финансируется стартовым размером, остальные — если запас актива покрывает вход
+        for leg, amount in zip(legs, inputs):
+            if leg.index == 0 or inventory.get(leg.src, 0.0) >= amount:
+                leg.prefunded = True
+                inventory[leg.src] = inventory.get(leg.src, 0.0) - amount
+
+        # Цепочка начинается с ноги, у которой есть вход, и продолжается ногами без запаса:
+        # каждая следующая уходит по исполнению предыдущей с фактически полученным количеством
+        chains: List[List[Leg]] = []
+        for leg in legs:
+            if leg.prefunded:
+                chains.append([])
+            chains[-1].append(leg)
+
+        async def run(chain: List[Leg]):
+            amount = inputs[chain[0].index]
+            for leg in chain:
+                if amount <= 0:
+                    leg.status = 'SKIPPED'
+                    continue
+                await self._submit(leg, amount)
+                amount = leg.amount_out
+
+        status = FILLED
+        error = None
+        first_submit = time.perf_counter()
+        tasks = [asyncio.ensure_future(run(chain)) for chain in chains[1:]]
+        try:
+            await run(chains[0])
+            if tasks:
+                await asyncio.gather(*tasks)
+        except Exception as e:
+            error = 'таймаут ноги' if isinstance(e, asyncio.TimeoutError) else str(e)
+            # Отмена при сбое: неотправленные ноги снимаются, выставленные заявки отменяются
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.gather(*(self._cancel(leg) for leg in legs))
+            status = FAILED
+
+        if status != FAILED and any(leg.status != 'FILLED' for leg in legs):
+            status = PARTIAL if legs[-1].amount_out > 0 else FAILED
+        fills = [leg.filled_at for leg in legs if leg.filled_at is not None]
+        unhedged = self._unhedged(assets[0], legs) if status != FILLED else {}
+        result = {
+            'status': status,
+            'error': error,
+            'start_amount': size,
+            'end_amount': legs[-1].amount_out,
+            'legs': [leg.as_dict() for leg in legs],
+            'unhedged': unhedged,
+            'first_submit_to_last_fill': max(fills) - first_submit if fills else None,
+        }
+        if status != FILLED:
+            logger.warning(f"Исполнение пути {'->'.join(assets)}: {status}{f' ({error})' if error else ''}"
+                           f"{f', незакрытые остатки {unhedged}' if unhedged else ''}")
+        return result
+
+    @staticmethod
+    def _unhedged(start: str, legs: List[Leg]) -> Dict[str, float]:
+        # Промежуточные активы, полученные исполненными ногами и не потраченные следующими
+        balances: Dict[str, float] = {}
+        for leg in legs:
+            balances[leg.dst] = balances.get(leg.dst, 0.0) + leg.amount_out
+            balances[leg.src] = balances.get(leg.src, 0.0) - leg.amount_spent
+        return {asset: amount for asset, amount in balances.items() if asset != start and abs(amount) > 1e-12}
\ No newline at end of file
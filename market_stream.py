@@ -0,0 +1,253 @@
+import asyncio
+import bisect
+import json
+import logging
+import time
+from typing import Callable, Dict, List, Optional
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class LocalOrderBook:
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.bids: Dict[float, float] = {}
+        self.asks: Dict[float, float] = {}
+        # Отсортированные по возрастанию цены: лучший bid в конце, лучший ask в начале
+        self.bid_prices: List[float] = []
+        self.ask_prices: List[float] = []
+        self.last_update_id = 0
+        self.synced = False
+        self.buffer: List[Dict] = []
+        self.resync_count = 0
+        self.updated_at = 0.0
+
+    def load_snapshot(self, snapshot: Dict) -> bool:
+        self.bids = {float(p): float(q) for p, q in snapshot['bids'] if float(q) > 0}
+        self.asks = {float(p): float(q) for p, q in snapshot['asks'] if float(q) > 0}
+        self.bid_prices = sorted(self.bids)
+        self.ask_prices = sorted(self.asks)
+        self.last_update_id = snapshot['lastUpdateId']
+        self.synced = True
+        pending, self.buffer = self.buffer, []
+        for i, event in enumerate(pending):
+            if not self.apply_diff(event):
+                self.buffer = pending[i:]
+                return False
+        self.updated_at = time.monotonic()
+        return True
+
+    def apply_diff(self, event: Dict) -> bool:
+        # Протокол snapshot+diff: событие с u <= lastUpdateId устарело,
+        # событие с U > lastUpdateId + 1 означает пропуск и требует пересинхронизации
+        if not self.synced:
+            self.buffer.append(event)
+            return True
+        if event['u'] <= self.last_update_id:
+            return True
+        if event['U'] > self.last_update_id + 1:
+            self.synced = False
+            self.buffer = [event]
+            self.resync_count += 1
+            return False
+        for price, qty in event['b']:
+            self._set_level(self.bids, self.bid_prices, float(price), float(qty))
+        for price, qty in event['a']:
+            self._set_level(self.asks, self.ask_prices, float(price), float(qty))
+        self.last_update_id = event['u']
+        self.updated_at = time.monotonic()
+        return True
+
+    @staticmethod
+    def _set_level(levels: Dict[float, float], prices: List[float], price: float, qty: float):
+        if qty == 0:
+            if levels.pop(price, None) is not None:
+                del prices[bisect.bisect_left(prices, price)]
+        else:
+            if price not in levels:
+                bisect.insort(prices, price)
+            levels[price] = qty
+
+    def best_bid(self) -> Optional[List[float]]:
+        if not self.bid_prices:
+            return None
+        price = self.bid_prices[-1]
+        return [price, self.bids[price]]
+
+    def best_ask(self) -> Optional[List[float]]:
+        if not self.ask_prices:
+            return None
+        price = self.ask_prices[0]
+        return [price, self.asks[price]]
+
+    def get_depth(self, limit: int = 100) -> Dict:
+        return {
+            'lastUpdateId': self.last_update_id,
+            'bids': [[p, self.bids[p]] for p in reversed(self.bid_prices[-limit:])],
+            'asks': [[p, self.asks[p]] for p in self.ask_prices[:limit]],
+        }
+
+
+class MarketDataStream:
+    def __init__(self, binance_api, symbols: List[str], stream_url: str = 'wss://stream.binance.com:9443',
+                 depth_speed: str = '100ms', snapshot_limit: int = 1000, reconnect_delay: float = 1.0,
+                 resync_delay: float = 0.5):
+        self.binance_api = binance_api
+        self.stream_url = stream_url
+        self.depth_speed = depth_speed
+        self.snapshot_limit = snapshot_limit
+        self.reconnect_delay = reconnect_delay
+        self.resync_delay = resync_delay
+        self.books: Dict[str, LocalOrderBook] = {s.upper(): LocalOrderBook(s.upper()) for s in symbols}
+        self.book_tickers: Dict[str, Dict] = {}
+        self.listeners: List[Callable[[str], None]] = []
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.is_running = False
+        self._task: Optional[asyncio.Task] = None
+        self._resync_tasks: Dict[str, asyncio.Task] = {}
+
+    def add_listener(self, callback: Callable[[str], None]):
+        self.listeners.append(callback)
+
+    def stream_names(self) -> List[str]:
+        names = []
+        for symbol in self.books:
+            names.append(f"{symbol.lower()}@depth@{self.depth_speed}")
+            names.append(f"{symbol.lower()}@bookTicker")
+        return names
+
+    async def start(self):
+        if self.is_running:
+            return
+        self.is_running = True
+        self.session = aiohttp.ClientSession()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.is_running = False
+        tasks = list(self._resync_tasks.values())
+        if self._task:
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._resync_tasks.clear()
+        self._task = None
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    async def _run(self):
+        url = f"{self.stream_url}/stream?streams={'/'.join(self.stream_names())}"
+        while self.is_running:
+            try:
+                async with self.session.ws_connect(url, heartbeat=30) as ws:
+                    logger.info(f"Подключен поток рыночных данных: {len(self.books)} пар")
+                    # После (пере)подключения все стаканы строятся заново из снимка
+                    for symbol, book in self.books.items():
+                        book.synced = False
+                        book.buffer = []
+                        self._schedule_resync(symbol)
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            self.handle_message(json.loads(msg.data))
+                        elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                            break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка потока рыночных данных: {str(e)}")
+            if self.is_running:
+                await asyncio.sleep(self.reconnect_delay)
+
+    def handle_message(self, message: Dict):
+        data = message.get('data', message)
+        if data.get('e') == 'depthUpdate':
+            symbol = data['s']
+            book = self.books.get(symbol)
+            if book is None:
+                return
+            if not book.apply_diff(data):
+                logger.warning(f"Пропуск в потоке стакана {symbol}: ожидался {book.last_update_id + 1}, получен {data['U']}")
+                self._schedule_resync(symbol)
+                return
+            if book.synced:
+                self._notify(symbol)
+        elif 'b' in data and 'a' in data and 's' in data:
+            self.book_tickers[data['s']] = {
+                'bid': float(data['b']),
+                'bid_qty': float(data['B']),
+                'ask': float(data['a']),
+                'ask_qty': float(data['A']),
+                'update_id': data.get('u'),
+            }
+            self._notify(data['s'])
+
+    def _notify(self, symbol: str):
+        for callback in self.listeners:
+            try:
+                callback(symbol)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика обновления {symbol}: {str(e)}")
+
+    def _schedule_resync(self, symbol: str):
+        task = self._resync_tasks.get(symbol)
+        if task is None or task.done():
+            self._resync_tasks[symbol] = asyncio.create_task(self._resync(symbol))
+
+    async def _resync(self, symbol: str):
+        book = self.books[symbol]
+        while self.is_running and not book.synced:
+            try:
+                snapshot = await self.binance_api.get_orderbook(symbol, limit=self.snapshot_limit)
+                if book.load_snapshot(snapshot):
+                    logger.info(f"Стакан {symbol} синхронизирован на lastUpdateId={book.last_update_id}")
+                    self._notify(symbol)
+                    return
+            except Exception as e:
+                logger.error(f"Ошибка получения снимка стакана {symbol}: {str(e)}")
+            await asyncio.sleep(self.resync_delay)
+
+    async def wait_synced(self, timeout: float = 10.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if all(book.synced for book in self.books.values()):
+                return True
+            await asyncio.sleep(0.01)
+        return False
+
+    async def get_orderbook(self, symbol: str, limit: int = 100) -> Optional[Dict]:
+        book = self.books.get(symbol)
+        if book is None or not book.synced:
+            return None
+        return book.get_depth(limit)
+
+    async def get_book_ticker(self, symbol: str) -> Optional[Dict]:
+        if symbol in self.book_tickers:
+            return self.book_tickers[symbol]
+        book = self.books.get(symbol)
+        if book is None or not book.synced or not book.bid_prices or not book.ask_prices:
+            return None
+        bid, bid_qty = book.best_bid()
+        ask, ask_qty = book.best_ask()
+        return {'bid': bid, 'bid_qty': bid_qty, 'ask': ask, 'ask_qty': ask_qty, 'update_id': book.last_update_id}
+
+    def mid_price(self, symbol: str) -> Optional[float]:
+        # Синхронный доступ для обработчиков обновлений
+        ticker = self.book_tickers.get(symbol)
+        if ticker is not None:
+            return (ticker['bid'] + ticker['ask']) / 2
+        book = self.books.get(symbol)
+        if book is None or not book.synced or not book.bid_prices or not book.ask_prices:
+            return None
+        return (book.best_bid()[0] + book.best_ask()[0]) / 2
+
+    async def get_prices(self) -> Dict[str, Dict]:
+        # Формат цен, который ожидает ArbitrageLogic
+        return {symbol: {'price': (t['bid'] + t['ask']) / 2, 'bid': t['bid'], 'ask': t['ask']}
+                for symbol, t in self.book_tickers.items()}
+
+    async def get_current_prices(self, path=None) -> Dict[str, float]:
+        # Формат цен, который ожидает TradeExecutor.calculate_profit_loss
+        return {symbol: (t['bid'] + t['ask']) / 2 for symbol, t in self.book_tickers.items()}
\ No newline at end of file
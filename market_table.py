@@ -0,0 +1,148 @@
+import logging
+from typing import Dict, List
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class MarketTable:
+    def __init__(self, markets: List[Dict], version: int = 0, taker_fee: float = 0.001):
+        # Активы и пары интернируются в целые числа один раз на версию метаданных.
+        # У каждой пары p два направленных ребра: 2p (base -> quote, курс = price)
+        # и 2p + 1 (quote -> base, курс = 1 / price)
+        self.version = version
+        self.pairs: List[str] = [m['symbol'] for m in markets]
+        self.pair_ids: Dict[str, int] = {symbol: i for i, symbol in enumerate(self.pairs)}
+        self.assets: List[str] = sorted({m['base_asset'] for m in markets} | {m['quote_asset'] for m in markets})
+        self.asset_ids: Dict[str, int] = {asset: i for i, asset in enumerate(self.assets)}
+        self.pair_base = np.array([self.asset_ids[m['base_asset']] for m in markets], dtype=np.int32)
+        self.pair_quote = np.array([self.asset_ids[m['quote_asset']] for m in markets], dtype=np.int32)
+
+        edge_count = 2 * len(self.pairs)
+        self.edge_src = np.empty(edge_count, dtype=np.int32)
+        self.edge_dst = np.empty(edge_count, dtype=np.int32)
+        self.edge_src[0::2], self.edge_dst[0::2] = self.pair_base, self.pair_quote
+        self.edge_src[1::2], self.edge_dst[1::2] = self.pair_quote, self.pair_base
+        self.edge_pair = np.arange(edge_count, dtype=np.int32) // 2
+        self.edge_matrix = np.full((len(self.assets), len(self.assets)), -1, dtype=np.int32)
+        self.edge_matrix[self.edge_src, self.edge_dst] = np.arange(edge_count, dtype=np.int32)
+
+        self.rate = np.full(edge_count, np.nan)
+        self.volume = np.zeros(edge_count)
+        self.volatility = np.full(edge_count, np.nan)
+
+        # Параметры исполнения из exchangeInfo по парам: комиссия тейкера, шаг и пределы количества (в base),
+        # минимальная сумма сделки (в quote). Нулевой шаг/минимум означают отсутствие фильтра
+        self.taker_fee = np.array([m.get('taker_fee', taker_fee) for m in markets], dtype=np.float64)
+        self.step_size = np.array([m.get('step_size', 0.0) for m in markets], dtype=np.float64)
+        self.min_qty = np.array([m.get('min_qty', 0.0) for m in markets], dtype=np.float64)
+        self.max_qty = np.array([m.get('max_qty', 0.0) or np.inf for m in markets], dtype=np.float64)
+        self.min_notional = np.array([m.get('min_notional', 0.0) for m in markets], dtype=np.float64)
+
+    @classmethod
+    def from_graph(cls, graph: Dict[str, Dict[str, tuple]], version: int = 0) -> 'MarketTable':
+        # graph в формате BinanceAPI.build_market_graph
+        markets = [{'symbol': symbol, 'base_asset': asset, 'quote_asset': neighbor}
+                   for asset, neighbors in graph.items()
+                   for neighbor, (symbol, is_inverse) in neighbors.items() if not is_inverse]
+        return cls(markets, version)
+
+    def __len__(self) -> int:
+        return len(self.pairs)
+
+    def set_pair(self, pair_id: int, price: float = None, volume: float = None, volatility: float = None):
+        edges = slice(2 * pair_id, 2 * pair_id + 2)
+        if price is not None:
+            self.rate[2 * pair_id] = price
+            self.rate[2 * pair_id + 1] = 1.0 / price if price else np.nan
+        if volume is not None:
+            self.volume[edges] = volume
+        if volatility is not None:
+            self.volatility[edges] = volatility
+
+    def load(self, prices: Dict, volumes: Dict):
+        # Полная загрузка снимка: отсутствующие цены становятся NaN
+        self.rate.fill(np.nan)
+        self.volume.fill(0)
+        self.volatility.fill(np.nan)
+        self.update(prices, volumes)
+
+    def update(self, prices: Dict, volumes: Dict = None) -> List[int]:
+        # prices: символ -> {'price': ..., 'volatility': ...} или символ -> цена
+        changed = []
+        for symbol, quote in prices.items():
+            pair_id = self.pair_ids.get(symbol)
+            if pair_id is None:
+                continue
+            if isinstance(quote, dict):
+                self.set_pair(pair_id, price=quote.get('price'), volatility=quote.get('volatility'))
+            else:
+                self.set_pair(pair_id, price=quote)
+            changed.append(pair_id)
+        for symbol, volume in (volumes or {}).items():
+            pair_id = self.pair_ids.get(symbol)
+            if pair_id is not None:
+                self.set_pair(pair_id, volume=volume)
+                changed.append(pair_id)
+        return changed
+
+    def executable(self, leg_edge: np.ndarray, volume_fraction: float = 0.01) -> Dict[str, np.ndarray]:
+        # Для каждого цикла (строки leg_edge) в единицах стартового актива:
+        # min_size — наименьший вход, проходящий minQty/minNotional на всех ногах,
+        # max_size — наибольший вход в пределах maxQty и доли 24ч объема каждой пары.
+        # net_profit — прибыль в % на max_size после комиссий и округления количества до stepSize
+        leg_edge = np.asarray(leg_edge)
+        cycles, legs = leg_edge.shape
+        rates = self.rate[leg_edge]
+        pairs = self.edge_pair[leg_edge]
+        sell = leg_edge % 2 == 0
+        # Цена пары (quote за base) на каждой ноге независимо от направления
+        price = np.where(sell, rates, 1.0 / rates)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            gross = np.cumprod(rates, axis=1)
+            # Сколько единиц актива-источника ноги k приходится на единицу стартового актива (без комиссий)
+            reach = np.ones((cycles, legs))
+            reach[:, 1:] = gross[:, :-1]
+            # Пределы ноги в единицах ее актива-источника: в base при продаже, в quote при покупке
+            to_src = np.where(sell, 1.0, price)
+            min_src = np.maximum(self.min_qty[pairs] * to_src, self.min_notional[pairs] / np.where(sell, price, 1.0))
+            volume_src = self.volume[leg_edge] * volume_fraction / np.where(sell, price, 1.0)
+            max_src = np.minimum(self.max_qty[pairs] * to_src, volume_src)
+            min_size = (min_src / reach).max(axis=1)
+            max_size = (max_src / reach).min(axis=1)
+
+            amount = np.where(np.isfinite(max_size), max_size, 0.0)
+            start = amount.copy()
+            filled = np.ones(cycles, dtype=bool)
+            for k in range(legs):
+                step = self.step_size[pairs[:, k]]
+                qty = np.where(sell[:, k], amount, amount / price[:, k])
+                qty = np.where(step > 0, np.floor(qty / np.where(step > 0, step, 1.0)) * step, qty)
+                notional = qty * price[:, k]
+                filled &= (qty >= self.min_qty[pairs[:, k]]) & (notional >= self.min_notional[pairs[:, k]]) & (qty > 0)
+                amount = np.where(sell[:, k], notional, qty) * (1 - self.taker_fee[pairs[:, k]])
+            net_profit = (amount / start - 1) * 100
+        valid = np.all(np.isfinite(rates) & (rates > 0), axis=1)
+        executable = valid & filled & (min_size <= max_size) & np.isfinite(net_profit)
+        return {'executable': executable, 'net_profit': np.where(executable, net_profit, np.nan),
+                'min_size': min_size, 'max_size': np.where(executable, max_size, 0.0)}
+
+    def edge_id(self, asset1: str, asset2: str) -> int:
+        a = self.asset_ids.get(asset1)
+        b = self.asset_ids.get(asset2)
+        if a is None or b is None:
+            return -1
+        return int(self.edge_matrix[a, b])
+
+    def path_edges(self, path: List[str]) -> np.ndarray:
+        ids = np.array([self.asset_ids.get(asset, -1) for asset in path], dtype=np.int64)
+        if len(ids) < 2 or (ids < 0).any():
+            return np.full(max(len(ids) - 1, 0), -1, dtype=np.int32)
+        return self.edge_matrix[ids[:-1], ids[1:]]
+
+    def edge_symbols(self, edges) -> List[str]:
+        return [self.pairs[self.edge_pair[e]] for e in edges]
+
+    def path(self, edges) -> List[str]:
+        path = [self.assets[self.edge_src[e]] for e in edges]
+        return path + [self.assets[self.edge_dst[edges[-1]]]]
\ No newline at end of file
@@ -1,10 +1,73 @@
-from typing import Dict
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+import numpy as np
 from binance_api import BinanceAPI
 # Импортируйте другие API бирж по мере необходимости
 
+logger = logging.getLogger(__name__)
+
+# Разные биржи называют один актив по-разному: приводим к общему имени
+ASSET_ALIASES = {
+    'XBT': 'BTC',
+    'XDG': 'DOGE',
+    'BCC': 'BCH',
+}
+
+
+def normalize_asset(asset: str) -> str:
+    asset = asset.upper()
+    return ASSET_ALIASES.get(asset, asset)
+
+
+def pair_key(base_asset: str, quote_asset: str) -> str:
+    return f"{normalize_asset(base_asset)}/{normalize_asset(quote_asset)}"
+
+
+class CrossExchangeSnapshot:
+    def __init__(self, exchanges: List[str], pairs: List[str], bid: np.ndarray, ask: np.ndarray,
+                 bid_qty: np.ndarray, ask_qty: np.ndarray, failed: Dict[str, str], fetched_at: float,
+                 pair_ids: Optional[Dict[str, int]] = None):
+        # Плотные матрицы биржа x пара в общем пространстве пар; отсутствующая котировка — NaN.
+        # pair_ids может быть общим словарем менеджера: номера пар только добавляются, поэтому
+        # для снимка действительны номера меньше len(pairs)
+        self.exchanges = exchanges
+        self.pairs = pairs
+        self.exchange_ids = {name: i for i, name in enumerate(exchanges)}
+        self.pair_ids = pair_ids if pair_ids is not None else {pair: i for i, pair in enumerate(pairs)}
+        self.bid = bid
+        self.ask = ask
+        self.bid_qty = bid_qty
+        self.ask_qty = ask_qty
+        self.failed = failed
+        self.fetched_at = fetched_at
+
+    def quote(self, exchange: str, pair: str) -> Optional[Dict]:
+        e = self.exchange_ids.get(exchange)
+        p = self.pair_ids.get(pair)
+        if e is None or p is None or p >= len(self.pairs):
+            raise ValueError(f"Unknown exchange or pair: {exchange} {pair}")
+        if np.isnan(self.bid[e, p]):
+            return None
+        return {'bid': float(self.bid[e, p]), 'ask': float(self.ask[e, p]),
+                'bid_qty': float(self.bid_qty[e, p]), 'ask_qty': float(self.ask_qty[e, p])}
+
+
 class MultiExchangeManager:
-    def __init__(self):
+    def __init__(self, default_timeout: float = 2.0, metadata_timeout: float = 30.0):
         self.exchanges: Dict[str, object] = {}
+        self.timeouts: Dict[str, float] = {}
+        self.fees: Dict[str, float] = {}
+        self.default_timeout = default_timeout
+        # Загрузка рынков (exchangeInfo) идет до котировок и не расходует таймаут котировок
+        self.metadata_timeout = metadata_timeout
+        # Общее пространство пар растет по мере появления новых рынков, номера столбцов стабильны
+        self.pairs: List[str] = []
+        self.pair_ids: Dict[str, int] = {}
+        # биржа -> символ биржи -> номер пары, пересобирается при смене версии метаданных
+        self._symbol_maps: Dict[str, Dict[str, int]] = {}
+        self._symbol_versions: Dict[str, object] = {}
 
     def add_exchange(self, name: str, api_key: str, api_secret: str):
         if name.lower() == 'binance':
@@ -13,11 +76,122 @@ class MultiExchangeManager:
         # elif name.lower() == 'kraken':
         #     self.exchanges[name] = KrakenAPI(api_key, api_secret)
 
+    def register_exchange(self, name: str, api, timeout: float = None, taker_fee: float = 0.001):
+        # Любой адаптер с get_markets() и get_book_tickers() (или get_prices() с bid/ask)
+        self.exchanges[name] = api
+        self._symbol_maps.pop(name, None)
+        self.fees[name] = taker_fee
+        if timeout is not None:
+            self.timeouts[name] = timeout
+
     async def get_prices(self, exchange_name: str):
         if exchange_name in self.exchanges:
             return await self.exchanges[exchange_name].get_prices()
         raise ValueError(f"Exchange {exchange_name} not found")
 
+    def _intern_pair(self, key: str) -> int:
+        pair_id = self.pair_ids.get(key)
+        if pair_id is None:
+            pair_id = self.pair_ids[key] = len(self.pairs)
+            self.pairs.append(key)
+        return pair_id
+
+    async def _symbol_map(self, name: str, api) -> Dict[str, int]:
+        metadata = getattr(api, 'metadata', None)
+        version = getattr(metadata, 'version', None)
+        if name not in self._symbol_maps or self._symbol_versions.get(name) != version:
+            markets = await api.get_markets()
+            self._symbol_maps[name] = {m['symbol']: self._intern_pair(pair_key(m['base_asset'], m['quote_asset']))
+                                       for m in markets}
+            self._symbol_versions[name] = getattr(metadata, 'version', None)
+        return self._symbol_maps[name]
+
+    async def warm_up(self) -> Dict[str, str]:
+        # Карты символов всех бирж параллельно; возвращает биржи, для которых загрузка не удалась
+        names = list(self.exchanges)
+        results = await asyncio.gather(*(
+            asyncio.wait_for(self._symbol_map(name, self.exchanges[name]), timeout=self.metadata_timeout)
+            for name in names
+        ), return_exceptions=True)
+        failed = {}
+        for name, result in zip(names, results):
+            if isinstance(result, BaseException):
+                failed[name] = 'timeout' if isinstance(result, asyncio.TimeoutError) else str(result)
+                logger.warning(f"Рынки биржи {name} не загружены: {failed[name]}")
+        return failed
+
+    async def _fetch_quotes(self, name: str, api):
+        symbol_map = self._symbol_maps[name]
+        if hasattr(api, 'get_book_tickers'):
+            tickers = await api.get_book_tickers()
+            rows = [(symbol_map[s], t['bids'][0][0], t['bids'][0][1], t['asks'][0][0], t['asks'][0][1])
+                    for s, t in tickers.items() if s in symbol_map and len(t['bids']) and len(t['asks'])]
+        else:
+            prices = await api.get_prices()
+            rows = [(symbol_map[s], q['bid'], 0.0, q['ask'], 0.0)
+                    for s, q in prices.items() if s in symbol_map and 'bid' in q and 'ask' in q]
+        return np.array(rows, dtype=np.float64).reshape(-1, 5)
+
+    async def get_snapshot(self) -> CrossExchangeSnapshot:
+        # Все биржи опрашиваются параллельно; биржа, не уложившаяся в свой таймаут, дает строку NaN.
+        # Холодная загрузка рынков выполняется заранее, в таймаут входит только запрос котировок
+        failed = await self.warm_up()
+        names = list(self.exchanges)
+        results = await asyncio.gather(*(
+            asyncio.wait_for(self._fetch_quotes(name, self.exchanges[name]),
+                             timeout=self.timeouts.get(name, self.default_timeout))
+            for name in names if name not in failed
+        ), return_exceptions=True)
+        results = iter(results)
+        shape = (len(names), len(self.pairs))
+        bid, ask = np.full(shape, np.nan), np.full(shape, np.nan)
+        bid_qty, ask_qty = np.zeros(shape), np.zeros(shape)
+        for e, name in enumerate(names):
+            if name in failed:
+                continue
+            rows = next(results)
+            if isinstance(rows, BaseException):
+                failed[name] = 'timeout' if isinstance(rows, asyncio.TimeoutError) else str(rows)
+                logger.warning(f"Котировки биржи {name} не получены: {failed[name]}")
+                continue
+            columns = rows[:, 0].astype(np.int64)
+            bid[e, columns], bid_qty[e, columns] = rows[:, 1], rows[:, 2]
+            ask[e, columns], ask_qty[e, columns] = rows[:, 3], rows[:, 4]
+        return CrossExchangeSnapshot(names, list(self.pairs), bid, ask, bid_qty, ask_qty, failed, time.time(),
+                                     self.pair_ids)
+
+    def scan_spreads(self, snapshot: CrossExchangeSnapshot, min_spread: float = 0.0) -> List[Dict]:
+        # Один проход по матрице: для каждой пары лучшая продажа (max bid) и лучшая покупка (min ask)
+        # по всем биржам с учетом комиссии тейкера каждой биржи
+        fees = np.array([self.fees.get(name, 0.001) for name in snapshot.exchanges])[:, None]
+        net_bid = np.where(np.isnan(snapshot.bid), -np.inf, snapshot.bid * (1 - fees))
+        net_ask = np.where(np.isnan(snapshot.ask), np.inf, snapshot.ask * (1 + fees))
+        if net_bid.size == 0:
+            return []
+        sell_ex = net_bid.argmax(axis=0)
+        buy_ex = net_ask.argmin(axis=0)
+        columns = np.arange(net_bid.shape[1])
+        best_bid = net_bid[sell_ex, columns]
+        best_ask = net_ask[buy_ex, columns]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            spread = best_bid / best_ask - 1
+        found = np.flatnonzero((sell_ex != buy_ex) & np.isfinite(spread) & (spread > min_spread))
+        volume = np.minimum(snapshot.ask_qty[buy_ex, columns], snapshot.bid_qty[sell_ex, columns])
+        opportunities = [{
+            'pair': snapshot.pairs[p],
+            'buy_exchange': snapshot.exchanges[buy_ex[p]],
+            'sell_exchange': snapshot.exchanges[sell_ex[p]],
+            'buy_price': float(snapshot.ask[buy_ex[p], p]),
+            'sell_price': float(snapshot.bid[sell_ex[p], p]),
+            'spread': float(spread[p]) * 100,
+            'volume': float(volume[p]),
+        } for p in found]
+        opportunities.sort(key=lambda x: x['spread'], reverse=True)
+        return opportunities
+
+    async def find_cross_exchange_opportunities(self, min_spread: float = 0.0) -> List[Dict]:
+        return self.scan_spreads(await self.get_snapshot(), min_spread)
+
     async def execute_trade(self, exchange_name: str, trade_data: Dict):
         if exchange_name in self.exchanges:
             return await self.exchanges[exchange_name].execute_arbitrage_trade(trade_data)
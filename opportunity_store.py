@@ -0,0 +1,179 @@
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _ExchangeOpportunities:
+    def __init__(self):
+        # path -> (seq, expires_at, opportunity); записи куч и очереди с устаревшим seq пропускаются лениво
+        self.entries: Dict[str, tuple] = {}
+        self.best_heap = []
+        self.worst_heap = []
+        self.expiry = deque()
+
+
+class OpportunityStore:
+    def __init__(self, capacity: int = 10, ttl: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.clock = clock
+        self._books: Dict[str, _ExchangeOpportunities] = {}
+        self._seq = itertools.count()
+
+    def _book(self, exchange: str) -> _ExchangeOpportunities:
+        book = self._books.get(exchange)
+        if book is None:
+            book = self._books[exchange] = _ExchangeOpportunities()
+        return book
+
+    def _is_live(self, book: _ExchangeOpportunities, seq: int, path: str) -> bool:
+        entry = book.entries.get(path)
+        return entry is not None and entry[0] == seq
+
+    def _expire(self, book: _ExchangeOpportunities):
+        # TTL одинаков для всех записей, поэтому порядок вставки совпадает с порядком истечения
+        now = self.clock()
+        while book.expiry and book.expiry[0][0] <= now:
+            _, seq, path = book.expiry.popleft()
+            if self._is_live(book, seq, path):
+                del book.entries[path]
+
+    def _compact(self, book: _ExchangeOpportunities):
+        # Кучи перестраиваются, когда мертвых записей становится заметно больше живых
+        if len(book.best_heap) > 4 * self.capacity + 16:
+            book.best_heap = [item for item in book.best_heap if self._is_live(book, item[1], item[2])]
+            heapq.heapify(book.best_heap)
+        if len(book.worst_heap) > 4 * self.capacity + 16:
+            book.worst_heap = [item for item in book.worst_heap if self._is_live(book, item[1], item[2])]
+            heapq.heapify(book.worst_heap)
+        if len(book.expiry) > 4 * self.capacity + 16:
+            book.expiry = deque(item for item in book.expiry if self._is_live(book, item[1], item[2]))
+
+    def push(self, exchange: str, opportunity: Dict) -> bool:
+        book = self._book(exchange)
+        self._expire(book)
+        path = opportunity['path']
+        profit = opportunity['profit']
+        # Возможность по тому же пути заменяет прежнюю запись, а не дублирует ее
+        if path not in book.entries and len(book.entries) >= self.capacity:
+            worst = self._peek(book, book.worst_heap)
+            if worst is not None and worst[0] >= profit:
+                return False
+            if worst is not None:
+                heapq.heappop(book.worst_heap)
+                del book.entries[worst[2]]
+        seq = next(self._seq)
+        expires_at = self.clock() + self.ttl
+        book.entries[path] = (seq, expires_at, opportunity)
+        heapq.heappush(book.best_heap, (-profit, seq, path))
+        heapq.heappush(book.worst_heap, (profit, seq, path))
+        book.expiry.append((expires_at, seq, path))
+        self._compact(book)
+        return True
+
+    def _peek(self, book: _ExchangeOpportunities, heap: List) -> Optional[tuple]:
+        while heap and not self._is_live(book, heap[0][1], heap[0][2]):
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def best(self, exchange: str) -> Optional[Dict]:
+        book = self._books.get(exchange)
+        if book is None:
+            return None
+        self._expire(book)
+        top = self._peek(book, book.best_heap)
+        return book.entries[top[2]][2] if top is not None else None
+
+    def items(self, exchange: str) -> List[Dict]:
+        # Снимок по убыванию прибыли (при равной прибыли — в порядке поступления):
+        # обработчики Telegram могут итерировать его, пока сканер пополняет хранилище
+        book = self._books.get(exchange)
+        if book is None:
+            return []
+        self._expire(book)
+        ordered = sorted(book.entries.values(), key=lambda entry: (-entry[2]['profit'], entry[0]))
+        return [entry[2] for entry in ordered]
+
+    def get(self, exchange: str, path: str) -> Optional[Dict]:
+        book = self._books.get(exchange)
+        if book is None:
+            return None
+        self._expire(book)
+        entry = book.entries.get(path)
+        return entry[2] if entry is not None else None
+
+    def remove(self, exchange: str, path: str) -> bool:
+        book = self._books.get(exchange)
+        if book is None or path not in book.entries:
+            return False
+        del book.entries[path]
+        return True
+
+    def clear(self, exchange: Optional[str] = None):
+        if exchange is None:
+            self._books.clear()
+        else:
+            self._books.pop(exchange, None)
+
+    def count(self, exchange: str) -> int:
+        book = self._books.get(exchange)
+        if book is None:
+            return 0
+        self._expire(book)
+        return len(book.entries)
+
+    def exchanges(self) -> List[str]:
+        return list(self._books)
+
+
+class RegisteredOpportunity:
+    def __init__(self, opportunity: Dict, exchange: str, snapshot: Dict, expires_at: float):
+        self.opportunity = opportunity
+        self.exchange = exchange
+        self.snapshot = snapshot
+        self.expires_at = expires_at
+
+
+class OpportunityRegistry:
+    def __init__(self, ttl: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: Dict[str, RegisteredOpportunity] = {}
+        self._expiry = deque()
+
+    def _expire(self):
+        now = self.clock()
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, opportunity_id = self._expiry.popleft()
+            entry = self._entries.get(opportunity_id)
+            if entry is not None and entry.expires_at == expires_at:
+                del self._entries[opportunity_id]
+
+    def register(self, opportunities: List[Dict], exchange: str, snapshot: Dict) -> int:
+        # Результаты скана сохраняются вместе со снимком цен, по которому они найдены;
+        # snapshot: символ -> котировка, у возможности берутся только ее ноги
+        self._expire()
+        expires_at = self.clock() + self.ttl
+        for opportunity in opportunities:
+            legs = opportunity.get('legs', [opportunity['symbol']])
+            entry = RegisteredOpportunity(opportunity, exchange,
+                                          {symbol: snapshot.get(symbol) for symbol in legs}, expires_at)
+            self._entries[opportunity['id']] = entry
+            self._expiry.append((expires_at, opportunity['id']))
+        return len(opportunities)
+
+    def get(self, opportunity_id: str) -> Optional[RegisteredOpportunity]:
+        self._expire()
+        return self._entries.get(opportunity_id)
+
+    def discard(self, opportunity_id: str):
+        self._entries.pop(opportunity_id, None)
+
+    def __len__(self) -> int:
+        self._expire()
+        return len(self._entries)
\ No newline at end of file
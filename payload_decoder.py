@@ -0,0 +1,94 @@
+import json
+import logging
+import re
+from typing import Dict
+import numpy as np
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+KLINE_DTYPE = np.dtype([
+    ('open_time', np.int64),
+    ('open', np.float64),
+    ('high', np.float64),
+    ('low', np.float64),
+    ('close', np.float64),
+    ('volume', np.float64),
+    ('close_time', np.int64),
+    ('quote_volume', np.float64),
+    ('trades', np.int64),
+    ('taker_buy_base_volume', np.float64),
+    ('taker_buy_quote_volume', np.float64),
+])
+KLINE_FIELDS = 12
+
+# Кавычки, скобки и пробелы выбрасываются одним bytes.translate, остаток — числа через запятую
+_WHITESPACE = b' \t\r\n'
+_STRIP = b'"[]' + _WHITESPACE
+_LAST_UPDATE_ID = re.compile(rb'"lastUpdateId":(\d+)')
+
+
+def _numbers(raw: bytes) -> np.ndarray:
+    # Разбор чисел в C без создания Python-объекта на каждый элемент
+    return np.fromstring(raw.translate(None, _STRIP), dtype=np.float64, sep=',')
+
+
+def _levels(raw: bytes, side: str) -> np.ndarray:
+    # Поиск границ стороны через bytes.find: raw уже без пробелов, сторона заканчивается первым "]]"
+    start = raw.find(b'"' + side.encode() + b'":[')
+    if start < 0:
+        raise ValueError(f"В ответе depth нет поля {side}")
+    start += len(side) + 4
+    if raw[start:start + 1] == b']':
+        return np.empty((0, 2))
+    end = raw.find(b']]', start)
+    if end < 0:
+        raise ValueError(f"Некорректные уровни {side} в ответе depth")
+    values = _numbers(raw[start:end])
+    if len(values) % 2:
+        raise ValueError(f"Некорректные уровни {side} в ответе depth")
+    return values.reshape(-1, 2)
+
+
+def decode_depth(raw: bytes) -> Dict:
+    # Ответ /api/v3/depth -> {'lastUpdateId', 'bids', 'asks'}, стороны — массивы (n, 2) float64 [цена, количество]
+    try:
+        compact = raw.translate(None, _WHITESPACE) if b' ' in raw or b'\n' in raw else raw
+        update_id = _LAST_UPDATE_ID.search(compact)
+        if update_id is None:
+            raise ValueError("В ответе depth нет lastUpdateId")
+        return {
+            'lastUpdateId': int(update_id.group(1)),
+            'bids': _levels(compact, 'bids'),
+            'asks': _levels(compact, 'asks'),
+        }
+    except ValueError:
+        # Ошибки API ({"code": ..., "msg": ...}) и непредвиденный формат разбираются обычным путем
+        payload = loads(raw)
+        if isinstance(payload, dict) and 'bids' in payload and 'asks' in payload:
+            payload['bids'] = np.array(payload['bids'], dtype=np.float64).reshape(-1, 2)
+            payload['asks'] = np.array(payload['asks'], dtype=np.float64).reshape(-1, 2)
+        return payload
+
+
+def decode_klines(raw: bytes) -> np.ndarray:
+    # Ответ /api/v3/klines -> структурированный массив KLINE_DTYPE (последнее поле "ignore" отбрасывается)
+    body = raw.lstrip()
+    if not body.startswith(b'['):
+        payload = loads(raw)
+        raise ValueError(f"Ошибка запроса свечей: {payload}")
+    values = _numbers(body)
+    if len(values) % KLINE_FIELDS == 0:
+        table = values.reshape(-1, KLINE_FIELDS)
+    else:
+        # Непредвиденный формат: медленный, но надежный путь
+        table = np.array([row[:len(KLINE_DTYPE)] for row in loads(raw)], dtype=np.float64).reshape(-1, len(KLINE_DTYPE))
+    klines = np.empty(len(table), dtype=KLINE_DTYPE)
+    for column, name in enumerate(KLINE_DTYPE.names):
+        klines[name] = table[:, column]
+    return klines
\ No newline at end of file
@@ -1,5 +1,6 @@
 import pandas as pd
 import numpy as np
+from datetime import datetime, timedelta
 from typing import List, Dict
 import logging
 
@@ -37,6 +38,23 @@ class PerformanceMonitor:
             "profit_std": df['profit'].std()
         }
 
+    async def get_real_time_metrics(self, user_id: int) -> Dict:
+        # Из материализованной статистики: корзины по дням за неделю и итог пользователя, без прохода по сделкам.
+        # Сутки — текущий день UTC
+        today = datetime.utcnow().date()
+        days = await self.db_manager.get_daily_statistics(user_id, str(today - timedelta(days=6)), str(today))
+        totals = await self.db_manager.get_user_stats(user_id)
+        current = [day for day in days if day[0] == str(today)]
+        trades_today = current[0][1] if current else 0
+        return {
+            "daily_profit": current[0][3] if current else 0.0,
+            "weekly_profit": sum(day[3] for day in days),
+            "win_rate_24h": current[0][2] / trades_today if trades_today else 0.0,
+            "avg_trade_duration": totals[4] / totals[0] if totals and totals[0] else 0.0,
+            "total_trades": totals[0] if totals else 0,
+            "total_profit": totals[2] if totals else 0.0,
+        }
+
     @staticmethod
     def calculate_sharpe_ratio(returns: pd.Series) -> float:
         return np.sqrt(252) * returns.mean() / returns.std()
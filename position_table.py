@@ -0,0 +1,94 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class PositionTable:
+    def __init__(self, max_legs: int = 4, capacity: int = 64):
+        # Открытые позиции одной биржи в столбцах: строка — позиция, столбец — нога.
+        # Ребро ноги — номер в MarketTable (2p — продажа base пары p, 2p + 1 — покупка),
+        # direction: +1 продажа base, -1 покупка, 0 — пустой столбец короткого пути (ребро -1).
+        # entry_rate — курс ребра при входе (цена пары для продажи, 1 / цена для покупки)
+        self.max_legs = max_legs
+        self.leg_edge = np.full((capacity, max_legs), -1, dtype=np.int64)
+        self.entry_price = np.ones((capacity, max_legs))
+        self.entry_rate = np.ones((capacity, max_legs))
+        self.direction = np.zeros((capacity, max_legs), dtype=np.int8)
+        self.size = np.zeros(capacity)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.trade_ids: List[Optional[str]] = [None] * capacity
+        self.rows: Dict[str, int] = {}
+        self._free: List[int] = list(range(capacity - 1, -1, -1))
+        self.version = None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, trade_id: str) -> bool:
+        return trade_id in self.rows
+
+    def _grow(self):
+        capacity = len(self.size)
+        extra = capacity
+        self.leg_edge = np.vstack([self.leg_edge, np.full((extra, self.max_legs), -1, dtype=np.int64)])
+        self.entry_price = np.vstack([self.entry_price, np.ones((extra, self.max_legs))])
+        self.entry_rate = np.vstack([self.entry_rate, np.ones((extra, self.max_legs))])
+        self.direction = np.vstack([self.direction, np.zeros((extra, self.max_legs), dtype=np.int8)])
+        self.size = np.concatenate([self.size, np.zeros(extra)])
+        self.active = np.concatenate([self.active, np.zeros(extra, dtype=bool)])
+        self.trade_ids.extend([None] * extra)
+        self._free.extend(range(capacity + extra - 1, capacity - 1, -1))
+
+    def add(self, trade_id: str, leg_edges: np.ndarray, entry_prices: np.ndarray, size: float) -> int:
+        # entry_prices — цены пар (quote за base) на момент входа, по одной на ногу
+        legs = len(leg_edges)
+        if legs > self.max_legs:
+            raise ValueError(f"Путь из {legs} ног длиннее {self.max_legs}")
+        if trade_id in self.rows:
+            self.remove(trade_id)
+        if not self._free:
+            self._grow()
+        row = self._free.pop()
+        self.leg_edge[row] = -1
+        self.entry_price[row] = 1.0
+        self.entry_rate[row] = 1.0
+        self.direction[row] = 0
+        self.leg_edge[row, :legs] = leg_edges
+        self.entry_price[row, :legs] = entry_prices
+        self.direction[row, :legs] = np.where(np.asarray(leg_edges) % 2, -1, 1)
+        self.entry_rate[row, :legs] = np.asarray(entry_prices, dtype=np.float64) ** self.direction[row, :legs]
+        self.size[row] = size
+        self.active[row] = True
+        self.trade_ids[row] = trade_id
+        self.rows[trade_id] = row
+        return row
+
+    def remove(self, trade_id: str) -> bool:
+        row = self.rows.pop(trade_id, None)
+        if row is None:
+            return False
+        self.active[row] = False
+        self.direction[row] = 0
+        self.trade_ids[row] = None
+        self._free.append(row)
+        return True
+
+    def clear(self):
+        for trade_id in list(self.rows):
+            self.remove(trade_id)
+
+    def mark_to_market(self, rate: np.ndarray, rows: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        # Один gather по вектору курсов ребер и произведение по ногам: rate[ребро] / entry_rate —
+        # изменение курса ноги с момента входа. Пустые столбцы (ребро -1) берут последний элемент — 1.0
+        if rows is None:
+            rows = np.flatnonzero(self.active)
+        rate = np.append(rate, 1.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = rate[self.leg_edge[rows]] / self.entry_rate[rows]
+        pnl = (ratio.prod(axis=1) - 1) * 100
+        return rows, pnl
+
+    def rows_for(self, trade_ids) -> np.ndarray:
+        return np.array([self.rows[t] for t in trade_ids if t in self.rows], dtype=np.int64)
\ No newline at end of file
@@ -0,0 +1,180 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from enum import IntEnum
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RequestPriority(IntEnum):
+    ORDER = 0
+    ACCOUNT = 1
+    MARKET_DATA = 2
+    BACKGROUND = 3
+
+
+# Вес запросов по документации Binance Spot API: (метод, endpoint) -> вес,
+# для эндпоинтов, где вес зависит от параметров, см. endpoint_weight
+ENDPOINT_WEIGHTS: Dict[tuple, int] = {
+    ('GET', '/api/v3/exchangeInfo'): 20,
+    ('GET', '/api/v3/account'): 20,
+    ('POST', '/api/v3/order'): 1,
+    ('DELETE', '/api/v3/order'): 1,
+    ('GET', '/api/v3/klines'): 2,
+    ('POST', '/api/v3/userDataStream'): 2,
+    ('PUT', '/api/v3/userDataStream'): 2,
+    ('DELETE', '/api/v3/userDataStream'): 2,
+}
+
+ENDPOINT_PRIORITIES: Dict[tuple, RequestPriority] = {
+    ('POST', '/api/v3/order'): RequestPriority.ORDER,
+    ('DELETE', '/api/v3/order'): RequestPriority.ORDER,
+    ('GET', '/api/v3/account'): RequestPriority.ACCOUNT,
+    ('GET', '/api/v3/openOrders'): RequestPriority.ACCOUNT,
+    ('POST', '/api/v3/userDataStream'): RequestPriority.ACCOUNT,
+    ('PUT', '/api/v3/userDataStream'): RequestPriority.ACCOUNT,
+    ('DELETE', '/api/v3/userDataStream'): RequestPriority.ACCOUNT,
+    ('GET', '/api/v3/klines'): RequestPriority.BACKGROUND,
+}
+
+DEPTH_WEIGHTS = ((100, 5), (500, 25), (1000, 50), (5000, 250))
+
+
+def endpoint_weight(method: str, endpoint: str, params: Optional[Dict] = None) -> int:
+    params = params or {}
+    if endpoint == '/api/v3/depth':
+        limit = int(params.get('limit', 100))
+        for max_limit, weight in DEPTH_WEIGHTS:
+            if limit <= max_limit:
+                return weight
+        return DEPTH_WEIGHTS[-1][1]
+    if endpoint == '/api/v3/openOrders':
+        return 6 if 'symbol' in params else 80
+    if endpoint == '/api/v3/ticker/24hr':
+        return 2 if 'symbol' in params else 80
+    if endpoint in ('/api/v3/ticker/price', '/api/v3/ticker/bookTicker'):
+        return 2 if 'symbol' in params else 4
+    return ENDPOINT_WEIGHTS.get((method, endpoint), 1)
+
+
+def endpoint_priority(method: str, endpoint: str) -> RequestPriority:
+    return ENDPOINT_PRIORITIES.get((method, endpoint), RequestPriority.MARKET_DATA)
+
+
+class WeightRateLimiter:
+    def __init__(self, weight_limit: int = 6000, burst: int = 600, safety_margin: float = 0.9):
+        # Token bucket пополняется со скоростью минутного лимита, емкость ограничивает всплески
+        self.weight_limit = weight_limit
+        self.capacity = burst
+        self.refill_rate = weight_limit / 60.0
+        self.safety_margin = safety_margin
+        self.tokens = float(burst)
+        self.used_weight = 0
+        self.paused_until = 0.0
+        self._updated_at = time.monotonic()
+        self._queue = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.wait_stats: Dict[RequestPriority, Dict[str, float]] = {
+            p: {'count': 0, 'total_wait': 0.0, 'max_wait': 0.0} for p in RequestPriority
+        }
+
+    def _refill(self):
+        # До конца паузы _updated_at лежит в будущем: токены не начисляются
+        now = time.monotonic()
+        if now <= self._updated_at:
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.refill_rate)
+        self._updated_at = now
+
+    async def acquire(self, weight: int, priority: RequestPriority = RequestPriority.MARKET_DATA):
+        loop = asyncio.get_running_loop()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch())
+        future = loop.create_future()
+        heapq.heappush(self._queue, (int(priority), next(self._seq), min(weight, self.capacity), future, time.monotonic()))
+        self._wakeup.set()
+        await future
+
+    async def _dispatch(self):
+        while True:
+            while self._queue and self._queue[0][3].done():
+                heapq.heappop(self._queue)
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = time.monotonic()
+            if now < self.paused_until:
+                await self._sleep(self.paused_until - now)
+                continue
+            self._refill()
+            priority, _, weight, future, enqueued_at = self._queue[0]
+            if self.tokens < weight:
+                await self._sleep((weight - self.tokens) / self.refill_rate)
+                continue
+            heapq.heappop(self._queue)
+            self.tokens -= weight
+            waited = now - enqueued_at
+            stats = self.wait_stats[RequestPriority(priority)]
+            stats['count'] += 1
+            stats['total_wait'] += waited
+            stats['max_wait'] = max(stats['max_wait'], waited)
+            future.set_result(None)
+
+    async def _sleep(self, delay: float):
+        # Новый запрос с более высоким приоритетом будит диспетчер раньше
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def update_from_headers(self, headers):
+        value = headers.get('X-MBX-USED-WEIGHT-1M')
+        if value is None:
+            return
+        self.used_weight = int(value)
+        # Сервер — источник истины: не выдаем больше, чем осталось в текущем минутном окне
+        remaining = self.weight_limit * self.safety_margin - self.used_weight
+        self._refill()
+        self.tokens = min(self.tokens, max(0.0, remaining))
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+        # Пополнение начинается с конца паузы, а не за все время простоя
+        self._updated_at = self.paused_until
+        logger.warning(f"Лимит запросов Binance превышен, пауза {seconds:.0f} с")
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def queue_depth(self) -> Dict[str, int]:
+        depth = {p.name: 0 for p in RequestPriority}
+        for priority, _, _, future, _ in self._queue:
+            if not future.done():
+                depth[RequestPriority(priority).name] += 1
+        return depth
+
+    def get_metrics(self) -> Dict:
+        self._refill()
+        return {
+            'tokens': self.tokens,
+            'used_weight_1m': self.used_weight,
+            'weight_limit_1m': self.weight_limit,
+            'paused_for': max(0.0, self.paused_until - time.monotonic()),
+            'queue_depth': self.queue_depth(),
+            'wait_time': {
+                p.name: {
+                    'count': s['count'],
+                    'avg': s['total_wait'] / s['count'] if s['count'] else 0.0,
+                    'max': s['max_wait'],
+                }
+                for p, s in self.wait_stats.items()
+            },
+        }
\ No newline at end of file
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from triangle_index import TriangleIndex, evaluate_cycles, filter_cycles
+
+logger = logging.getLogger(__name__)
+
+# Состояние процесса-воркера: представления NumPy поверх общей памяти, создаются один раз в инициализаторе
+_worker: Dict = {}
+
+
+def _init_worker(snapshot_name: str, cycles_name: str, edge_count: int, cycle_count: int):
+    # Воркеры пула используют resource tracker родителя, поэтому блоки удаляет только ShardedScanner.close
+    snapshot = shared_memory.SharedMemory(name=snapshot_name)
+    cycles = shared_memory.SharedMemory(name=cycles_name)
+    columns = np.ndarray((3, edge_count), dtype=np.float64, buffer=snapshot.buf)
+    _worker.update({
+        'blocks': (snapshot, cycles),
+        'rate': columns[0],
+        'volume': columns[1],
+        'volatility': columns[2],
+        'leg_edge': np.ndarray((cycle_count, 3), dtype=np.int32, buffer=cycles.buf),
+    })
+
+
+def _scan_shard(start: int, stop: int, thresholds: Tuple[float, float, float, float]) -> Tuple[np.ndarray, Dict]:
+    # Воркер читает снимок цен из общей памяти, наружу возвращаются только прошедшие фильтры циклы
+    result = evaluate_cycles(_worker['leg_edge'][start:stop], _worker['rate'],
+                             _worker['volume'], _worker['volatility'])
+    selected = filter_cycles(result, *thresholds)
+    return selected + start, {key: values[selected] for key, values in result.items()}
+
+
+class ShardedScanner:
+    def __init__(self, index: TriangleIndex, workers: Optional[int] = None, shards_per_worker: int = 2):
+        self.index = index
+        self.workers = workers or os.cpu_count() or 1
+        self.shard_count = self.workers * shards_per_worker
+        table = index.table
+        edge_count = len(table.rate)
+        cycle_count = len(index)
+
+        # Снимок цен (курс, объем, волатильность по ребрам) копируется в общую память перед каждым сканом,
+        # таблица циклов — один раз на версию индекса
+        self._snapshot_block = shared_memory.SharedMemory(create=True, size=max(1, 3 * edge_count * 8))
+        self._cycles_block = shared_memory.SharedMemory(create=True, size=max(1, cycle_count * 3 * 4))
+        self._snapshot = np.ndarray((3, edge_count), dtype=np.float64, buffer=self._snapshot_block.buf)
+        leg_edge = np.ndarray((cycle_count, 3), dtype=np.int32, buffer=self._cycles_block.buf)
+        leg_edge[:] = index.leg_edge
+
+        bounds = np.linspace(0, cycle_count, self.shard_count + 1).astype(int)
+        self.shards: List[Tuple[int, int]] = [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                         initargs=(self._snapshot_block.name, self._cycles_block.name,
+                                                   edge_count, cycle_count))
+        self._lock = asyncio.Lock()
+        logger.info(f"Шардированный скан: {cycle_count} циклов, {len(self.shards)} шардов, {self.workers} процессов")
+
+    def publish_snapshot(self):
+        table = self.index.table
+        self._snapshot[0] = table.rate
+        self._snapshot[1] = table.volume
+        self._snapshot[2] = table.volatility
+
+    async def scan(self, min_profit: float, min_volume: float, min_volatility: float,
+                   max_volatility: float) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        # Один скан за раз: следующий снимок нельзя публиковать, пока воркеры читают текущий
+        async with self._lock:
+            self.publish_snapshot()
+            loop = asyncio.get_running_loop()
+            thresholds = (min_profit, min_volume, min_volatility, max_volatility)
+            parts = await asyncio.gather(*(loop.run_in_executor(self._pool, _scan_shard, start, stop, thresholds)
+                                           for start, stop in self.shards))
+        if not parts:
+            # Рынок без треугольников: те же ключи, что у index.evaluate(), с пустыми массивами
+            return np.empty(0, dtype=np.int64), {'valid': np.empty(0, dtype=bool), 'profit': np.empty(0),
+                                                 'volume': np.empty(0), 'volatility': np.empty(0)}
+        cycle_ids = np.concatenate([ids for ids, _ in parts])
+        result = {key: np.concatenate([part[key] for _, part in parts])
+                  for key in ('valid', 'profit', 'volume', 'volatility')}
+        return cycle_ids, result
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        # Представления NumPy держат ссылки на буферы, без их удаления close() не освободит память
+        del self._snapshot
+        for block in (self._snapshot_block, self._cycles_block):
+            block.close()
+            block.unlink()
\ No newline at end of file
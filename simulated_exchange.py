@@ -0,0 +1,429 @@
+import asyncio
+import bisect
+import itertools
+import json
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional
+import numpy as np
+from exchange_metadata import SymbolInfo
+from market_table import MarketTable
+
+logger = logging.getLogger(__name__)
+
+FEED_OWNER = 'feed'
+
+
+@dataclass(eq=False)
+class SimOrder:
+    order_id: int
+    symbol: str
+    side: str
+    type: str
+    price: Optional[float]
+    quantity: float
+    owner: str = 'client'
+    filled: float = 0.0
+    quote_filled: float = 0.0
+    status: str = 'NEW'
+    created_at: float = 0.0
+    client_order_id: Optional[str] = None
+
+    @property
+    def remaining(self) -> float:
+        return self.quantity - self.filled
+
+
+class SimOrderBook:
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        # Уровень цены — очередь заявок в порядке поступления (приоритет цена-время)
+        self.bids: Dict[float, Deque[SimOrder]] = {}
+        self.asks: Dict[float, Deque[SimOrder]] = {}
+        self.bid_prices: List[float] = []
+        self.ask_prices: List[float] = []
+        self.update_id = 0
+
+    def _side(self, side: str):
+        return (self.bids, self.bid_prices) if side == 'BUY' else (self.asks, self.ask_prices)
+
+    def rest(self, order: SimOrder):
+        levels, prices = self._side(order.side)
+        if order.price not in levels:
+            levels[order.price] = deque()
+            bisect.insort(prices, order.price)
+        levels[order.price].append(order)
+        self.update_id += 1
+
+    def remove(self, order: SimOrder) -> bool:
+        levels, prices = self._side(order.side)
+        queue = levels.get(order.price)
+        if queue is None or order not in queue:
+            return False
+        queue.remove(order)
+        if not queue:
+            del levels[order.price]
+            del prices[bisect.bisect_left(prices, order.price)]
+        self.update_id += 1
+        return True
+
+    def best_bid(self) -> Optional[float]:
+        return self.bid_prices[-1] if self.bid_prices else None
+
+    def best_ask(self) -> Optional[float]:
+        return self.ask_prices[0] if self.ask_prices else None
+
+    def depth(self, side: str, limit: int) -> np.ndarray:
+        levels, prices = self._side(side)
+        selected = reversed(prices[-limit:]) if side == 'BUY' else prices[:limit]
+        rows = [(price, sum(o.remaining for o in levels[price])) for price in selected]
+        return np.array(rows, dtype=np.float64).reshape(-1, 2)
+
+
+class SimulatedFeed:
+    # Записанный поток обновлений стакана: события {'t': смещение в секундах, 's': символ, 'b': [[цена, кол-во]], 'a': [...]}
+    def __init__(self, events: List[Dict]):
+        self.events = events
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def save(self, path: str):
+        with open(path, 'w') as f:
+            for event in self.events:
+                f.write(json.dumps(event) + '\n')
+
+    @classmethod
+    def load(cls, path: str) -> 'SimulatedFeed':
+        with open(path, 'r') as f:
+            return cls([json.loads(line) for line in f if line.strip()])
+
+
+class SimulatedExchange:
+    def __init__(self, markets: List[Dict], order_latency: float = 0.0, latency_jitter: float = 0.0,
+                 partial_fill_rate: float = 0.0, taker_fee: float = 0.001, initial_balances: Dict[str, float] = None,
+                 seed: int = 0, exchange_name: str = 'simulated', response_latency: float = 0.0):
+        # Локальная биржа для нагрузочных тестов: свой движок сопоставления заявок,
+        # задержка доставки заявок и частичные исполнения задаются параметрами.
+        # response_latency — задержка ответа REST после исполнения; событие исполнения
+        # слушатели add_fill_listener получают сразу, как из пользовательского потока
+        self.exchange_name = exchange_name
+        self.markets = [dict(m) for m in markets]
+        self.symbols = {m['symbol']: m for m in self.markets}
+        self.by_assets = {(m['base_asset'], m['quote_asset']): m['symbol'] for m in self.markets}
+        self.books: Dict[str, SimOrderBook] = {m['symbol']: SimOrderBook(m['symbol']) for m in self.markets}
+        self.order_latency = order_latency
+        self.latency_jitter = latency_jitter
+        self.response_latency = response_latency
+        self.partial_fill_rate = partial_fill_rate
+        self.taker_fee = taker_fee
+        self.balances: Dict[str, float] = dict(initial_balances or {})
+        # Средства, зарезервированные под стоящие в стакане лимитные заявки клиента
+        self.locked: Dict[str, float] = {}
+        self.orders: Dict[int, SimOrder] = {}
+        self.trades: Dict[str, Dict] = {}
+        self.listeners: List[Callable[[str], None]] = []
+        self.fill_listeners: List[Callable[[Dict], None]] = []
+        self.client_orders: Dict[str, SimOrder] = {}
+        self._rng = random.Random(seed)
+        self._order_ids = itertools.count(1)
+        self._trade_ids = itertools.count(1)
+        self._feed_orders: Dict[tuple, SimOrder] = {}
+        # Интерфейс метаданных, как у BinanceAPI.metadata: TradeExecutor считает P&L по общей таблице цен
+        self.metadata = self
+        self.version = 1
+        self.table = MarketTable(self.markets, self.version, taker_fee)
+        self.stats = {'orders': 0, 'fills': 0, 'partial_fills': 0, 'feed_events': 0, 'rejected': 0}
+
+    def get_market_table(self) -> MarketTable:
+        return self.table
+
+    def get_symbol_by_assets(self, base_asset: str, quote_asset: str) -> Optional[SymbolInfo]:
+        symbol = self.by_assets.get((base_asset, quote_asset))
+        if symbol is None:
+            return None
+        return SymbolInfo(symbol=symbol, base_asset=base_asset, quote_asset=quote_asset, status='TRADING')
+
+    def add_listener(self, callback: Callable[[str], None]):
+        self.listeners.append(callback)
+
+    def add_fill_listener(self, callback: Callable[[Dict], None]):
+        self.fill_listeners.append(callback)
+
+    async def _deliver(self):
+        # Задержка сети и шлюза биржи до попадания заявки в движок
+        delay = self.order_latency + (self._rng.uniform(0, self.latency_jitter) if self.latency_jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _refresh_price(self, symbol: str):
+        book = self.books[symbol]
+        bid, ask = book.best_bid(), book.best_ask()
+        if bid is not None and ask is not None:
+            self.table.set_pair(self.table.pair_ids[symbol], price=(bid + ask) / 2)
+
+    # Рыночный поток
+
+    def apply_event(self, event: Dict):
+        # Уровни потока — заявки владельца FEED_OWNER; новое количество заменяет прежнюю заявку уровня
+        symbol = event['s']
+        book = self.books[symbol]
+        for side, key in (('BUY', 'b'), ('SELL', 'a')):
+            for price, qty in event.get(key, []):
+                price, qty = float(price), float(qty)
+                current = self._feed_orders.pop((symbol, side, price), None)
+                if current is not None:
+                    book.remove(current)
+                if qty > 0:
+                    order = SimOrder(next(self._order_ids), symbol, side, 'LIMIT', price, qty, owner=FEED_OWNER)
+                    self._feed_orders[(symbol, side, price)] = order
+                    book.rest(order)
+        self._refresh_price(symbol)
+        self.stats['feed_events'] += 1
+        for callback in self.listeners:
+            callback(symbol)
+
+    async def replay(self, feed: SimulatedFeed, speed: Optional[float] = 1.0):
+        # speed=None — воспроизведение без пауз, иначе с исходными интервалами, ускоренными в speed раз
+        started = time.monotonic()
+        for event in feed.events:
+            if speed:
+                delay = event.get('t', 0.0) / speed - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                await asyncio.sleep(0)
+            self.apply_event(event)
+
+    # Движок сопоставления
+
+    def _match(self, order: SimOrder, quote_limit: Optional[float] = None):
+        book = self.books[order.symbol]
+        levels, prices = (book.asks, book.ask_prices) if order.side == 'BUY' else (book.bids, book.bid_prices)
+        while prices and order.remaining > 1e-12:
+            price = prices[0] if order.side == 'BUY' else prices[-1]
+            if order.price is not None and (price > order.price if order.side == 'BUY' else price < order.price):
+                break
+            if quote_limit is not None and quote_limit - order.quote_filled <= 1e-12:
+                break
+            maker = levels[price][0]
+            qty = min(order.remaining, maker.remaining)
+            if quote_limit is not None:
+                qty = min(qty, (quote_limit - order.quote_filled) / price)
+            partial = self.partial_fill_rate and self._rng.random() < self.partial_fill_rate
+            if partial:
+                qty *= self._rng.uniform(0.1, 0.9)
+            maker.filled += qty
+            maker.quote_filled += qty * price
+            order.filled += qty
+            order.quote_filled += qty * price
+            self.stats['fills'] += 1
+            self._settle(order.symbol, order.side, qty, qty * price)
+            if maker.owner != FEED_OWNER:
+                self._settle(maker.symbol, maker.side, qty, qty * price)
+                self._release(maker, qty)
+            if maker.remaining <= 1e-12:
+                maker.status = 'FILLED'
+                book.remove(maker)
+                if maker.owner == FEED_OWNER:
+                    self._feed_orders.pop((maker.symbol, maker.side, maker.price), None)
+            else:
+                maker.status = 'PARTIALLY_FILLED'
+                book.update_id += 1
+            if partial:
+                # Остаток ликвидности «ушел» к другим участникам: заявка исполнена частично
+                self.stats['partial_fills'] += 1
+                break
+        if quote_limit is not None and quote_limit - order.quote_filled <= 1e-9 * max(quote_limit, 1.0):
+            order.quantity = order.filled
+        if order.remaining <= 1e-12:
+            order.status = 'FILLED'
+        elif order.filled > 0:
+            order.status = 'PARTIALLY_FILLED'
+
+    def _settle(self, symbol: str, side: str, qty: float, quote_qty: float):
+        # Расчет одной сделки: списание отданного актива и зачисление полученного за вычетом комиссии
+        market = self.symbols[symbol]
+        base, quote = market['base_asset'], market['quote_asset']
+        if side == 'BUY':
+            self.balances[quote] = self.balances.get(quote, 0.0) - quote_qty
+            self.balances[base] = self.balances.get(base, 0.0) + qty * (1 - self.taker_fee)
+        else:
+            self.balances[base] = self.balances.get(base, 0.0) - qty
+            self.balances[quote] = self.balances.get(quote, 0.0) + quote_qty * (1 - self.taker_fee)
+
+    def _hold(self, order: SimOrder) -> tuple:
+        # Актив и сумма, которые резервирует остаток лимитной заявки
+        market = self.symbols[order.symbol]
+        if order.side == 'BUY':
+            return market['quote_asset'], order.remaining * order.price
+        return market['base_asset'], order.remaining
+
+    def _release(self, order: SimOrder, qty: float):
+        asset = self.symbols[order.symbol]['quote_asset' if order.side == 'BUY' else 'base_asset']
+        amount = qty * order.price if order.side == 'BUY' else qty
+        self.locked[asset] = max(self.locked.get(asset, 0.0) - amount, 0.0)
+
+    def available(self, asset: str) -> float:
+        return self.balances.get(asset, 0.0) - self.locked.get(asset, 0.0)
+
+    def _cost(self, order: SimOrder, quote_quantity: Optional[float]) -> tuple:
+        # Сколько и какого актива спишет заявка; для рыночных — оценка по текущему стакану
+        market = self.symbols[order.symbol]
+        if order.type == 'LIMIT':
+            if order.side == 'BUY':
+                return market['quote_asset'], order.quantity * order.price
+            return market['base_asset'], order.quantity
+        if order.side == 'BUY' and quote_quantity is not None:
+            return market['quote_asset'], quote_quantity
+        if order.side == 'SELL' and quote_quantity is None:
+            return market['base_asset'], order.quantity
+        book = self.books[order.symbol]
+        levels, prices = (book.asks, book.ask_prices) if order.side == 'BUY' else (book.bids, book.bid_prices)
+        selected = prices if order.side == 'BUY' else reversed(prices)
+        base_total, quote_total = 0.0, 0.0
+        for price in selected:
+            size = sum(o.remaining for o in levels[price])
+            if order.side == 'BUY':
+                size = min(size, order.quantity - base_total)
+            else:
+                size = min(size, (quote_quantity - quote_total) / price)
+            base_total += size
+            quote_total += size * price
+            if (order.quantity - base_total if order.side == 'BUY' else quote_quantity - quote_total) <= 1e-12:
+                break
+        return (market['quote_asset'], quote_total) if order.side == 'BUY' else (market['base_asset'], base_total)
+
+    def _response(self, order: SimOrder) -> Dict:
+        return {
+            'symbol': order.symbol,
+            'orderId': order.order_id,
+            'side': order.side,
+            'type': order.type,
+            'status': order.status,
+            'origQty': order.quantity,
+            'executedQty': order.filled,
+            'cummulativeQuoteQty': order.quote_filled,
+            'transactTime': int(time.time() * 1000),
+            'clientOrderId': order.client_order_id,
+        }
+
+    def _report(self, order: SimOrder):
+        # Аналог executionReport: final — заявка больше не изменится (рыночная или снятая)
+        if not self.fill_listeners or order.client_order_id is None:
+            return
+        event = self._response(order)
+        event['final'] = order.status != 'NEW' and (order.type != 'LIMIT' or order.status != 'PARTIALLY_FILLED')
+        for callback in self.fill_listeners:
+            callback(event)
+
+    async def _respond(self, order: SimOrder) -> Dict:
+        if self.response_latency > 0:
+            await asyncio.sleep(self.response_latency)
+        return self._response(order)
+
+    async def place_order(self, symbol: str, side: str, type: str, quantity: float = None, price: float = None,
+                          quote_quantity: float = None, client_order_id: str = None) -> Dict:
+        # Формат ответа как у POST /api/v3/order; quote_quantity — аналог quoteOrderQty для рыночных заявок
+        if symbol not in self.books:
+            return {'code': -1121, 'msg': 'Invalid symbol.'}
+        await self._deliver()
+        order = SimOrder(next(self._order_ids), symbol, side, type, price if type == 'LIMIT' else None,
+                         quantity if quantity is not None else float('inf'), created_at=time.monotonic(),
+                         client_order_id=client_order_id)
+        asset, required = self._cost(order, quote_quantity)
+        if required > self.available(asset) + 1e-9:
+            # Как и биржа, не принимаем заявку, которую нечем обеспечить
+            self.stats['rejected'] += 1
+            return {'code': -2010, 'msg': 'Account has insufficient balance for requested action.'}
+        if client_order_id is not None:
+            self.client_orders[client_order_id] = order
+        self.stats['orders'] += 1
+        self._match(order, quote_quantity)
+        if type == 'LIMIT' and order.remaining > 1e-12:
+            # Остаток лимитной заявки встает в очередь своего уровня (GTC)
+            self.books[symbol].rest(order)
+            self.orders[order.order_id] = order
+            asset, amount = self._hold(order)
+            self.locked[asset] = self.locked.get(asset, 0.0) + amount
+        elif order.remaining > 1e-12:
+            order.status = 'EXPIRED' if order.filled == 0 else 'PARTIALLY_FILLED'
+            if quote_quantity is not None:
+                order.quantity = order.filled
+        if order.filled > 0:
+            self._refresh_price(symbol)
+        self._report(order)
+        return await self._respond(order)
+
+    async def cancel_order(self, symbol: str, order_id: int = None, client_order_id: str = None) -> Dict:
+        await self._deliver()
+        if order_id is None and client_order_id in self.client_orders:
+            order_id = self.client_orders[client_order_id].order_id
+        order = self.orders.pop(order_id, None)
+        if order is None or not self.books[symbol].remove(order):
+            return {'code': -2011, 'msg': 'Unknown order sent.'}
+        order.status = 'CANCELED'
+        self._release(order, order.remaining)
+        self._report(order)
+        return await self._respond(order)
+
+    # Рыночные данные в форматах BinanceAPI
+
+    async def get_markets(self) -> List[Dict]:
+        return self.markets
+
+    async def get_orderbook(self, symbol: str, limit: int = 100) -> Dict:
+        book = self.books[symbol]
+        return {'lastUpdateId': book.update_id, 'bids': book.depth('BUY', limit), 'asks': book.depth('SELL', limit)}
+
+    async def get_book_tickers(self) -> Dict[str, Dict]:
+        tickers = {}
+        for symbol, book in self.books.items():
+            bids, asks = book.depth('BUY', 1), book.depth('SELL', 1)
+            if len(bids) and len(asks):
+                tickers[symbol] = {'bids': bids.tolist(), 'asks': asks.tolist()}
+        return tickers
+
+    async def get_prices(self) -> Dict[str, Dict]:
+        return {symbol: {'price': (t['bids'][0][0] + t['asks'][0][0]) / 2, 'bid': t['bids'][0][0], 'ask': t['asks'][0][0]}
+                for symbol, t in (await self.get_book_tickers()).items()}
+
+    async def get_current_prices(self, path=None) -> Dict[str, float]:
+        return {symbol: quote['price'] for symbol, quote in (await self.get_prices()).items()}
+
+    async def get_balance(self, asset: str) -> float:
+        return self.balances.get(asset, 0.0)
+
+    # Интерфейс, который использует TradeExecutor
+
+    async def execute_arbitrage_trade(self, path, trade_size: float) -> str:
+        # Ноги исполняются рыночными заявками по очереди: выход каждой ноги — вход следующей
+        assets = path.split('->') if isinstance(path, str) else list(path)
+        amount = trade_size
+        legs = []
+        for src, dst in zip(assets, assets[1:]):
+            if (src, dst) in self.by_assets:
+                response = await self.place_order(self.by_assets[(src, dst)], 'SELL', 'MARKET', quantity=amount)
+            elif (dst, src) in self.by_assets:
+                response = await self.place_order(self.by_assets[(dst, src)], 'BUY', 'MARKET', quote_quantity=amount)
+            else:
+                raise ValueError(f"Нет пары для {src}->{dst}")
+            if 'code' in response:
+                raise RuntimeError(f"Нога {src}->{dst} отклонена: {response['msg']}")
+            received = response['cummulativeQuoteQty'] if response['side'] == 'SELL' else response['executedQty']
+            amount = received * (1 - self.taker_fee)
+            legs.append(response)
+            if response['status'] != 'FILLED':
+                logger.warning(f"Нога {src}->{dst} исполнена не полностью ({response['status']}): {response['executedQty']}")
+            if amount <= 0:
+                break
+        trade_id = f"sim-{next(self._trade_ids)}"
+        self.trades[trade_id] = {'path': assets, 'size': trade_size, 'result': amount, 'legs': legs}
+        return trade_id
+
+    async def close_arbitrage_trade(self, trade_id: str) -> Dict:
+        trade = self.trades.pop(trade_id)
+        return {'actual_profit': trade['result'] - trade['size'], 'legs': trade['legs']}
\ No newline at end of file
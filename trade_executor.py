@@ -1,7 +1,11 @@
 import logging
-from typing import Dict, List
+from typing import Dict, List, Set
 from enum import Enum
 import asyncio
+import itertools
+import numpy as np
+from leg_executor import LegExecutor, FAILED
+from position_table import PositionTable
 
 logger = logging.getLogger(__name__)
 
@@ -25,11 +29,64 @@ class TradeExecutor:
         self.trading_mode = TradingMode.MODERATE
         self.open_positions: Dict[str, Dict] = {}
         self.test_mode = True
+        self.market_stream = None
+        # Исполнение по ногам для бирж с place_order; запас активов позволяет отправлять ноги параллельно
+        self.leg_executors: Dict[str, LegExecutor] = {}
+        self.inventory: Dict[str, Dict[str, float]] = {}
+        self.leg_timeout = 2.0
+        self._trade_ids = itertools.count(1)
+        # биржа -> символ -> позиции, зависящие от цены символа; обновление цены пересчитывает только их
+        self.position_index: Dict[str, Dict[str, Set[str]]] = {}
+        # Биржи, цены которых приходят событиями; опрос trading_monitor их пропускает
+        self.watched_exchanges: Set[str] = set()
+        self._closing: Set[str] = set()
+        self._close_tasks: Set[asyncio.Task] = set()
+        # Столбцовые таблицы открытых позиций по биржам: P&L всех позиций — один gather по курсам
+        self.position_tables: Dict[str, PositionTable] = {}
+        # Последние известные цены биржи для расчета P&L без таблицы цен
+        self.last_prices: Dict[str, Dict[str, float]] = {}
 
     def add_exchange(self, exchange_name: str, exchange_api):
         self.exchanges[exchange_name] = exchange_api
         logger.info(f"Добавлена биржа: {exchange_name}")
 
+    def set_market_stream(self, market_stream, exchange: str = 'binance'):
+        self.market_stream = market_stream
+        self.watched_exchanges.add(exchange)
+
+        def on_update(symbol):
+            price = market_stream.mid_price(symbol)
+            if price is not None:
+                self.on_price_update(exchange, {symbol: price})
+        market_stream.add_listener(on_update)
+        logger.info("Мониторинг позиций использует поток рыночных данных")
+
+    def watch_exchange(self, exchange: str):
+        # Для адаптеров, которые сами обновляют свою таблицу цен и сообщают об изменившемся символе
+        api = self.exchanges[exchange]
+        self.watched_exchanges.add(exchange)
+        api.add_listener(lambda symbol: self.on_price_update(exchange, symbols=[symbol]))
+        logger.info(f"Мониторинг позиций на {exchange} по событиям обновления цен")
+
+    def get_market_table(self, exchange: str):
+        # Общая таблица цен биржи (см. ExchangeMetadataCache.get_market_table), если биржа ее предоставляет
+        metadata = getattr(self.exchanges.get(exchange), 'metadata', None)
+        return metadata.get_market_table() if metadata is not None else None
+
+    def get_leg_executor(self, exchange: str):
+        api = self.exchanges.get(exchange)
+        metadata = getattr(api, 'metadata', None)
+        if not hasattr(api, 'place_order') or not hasattr(metadata, 'get_symbol_by_assets'):
+            return None
+        if exchange not in self.leg_executors:
+            fee_rate = getattr(metadata, 'taker_fee', 0.001)
+            self.leg_executors[exchange] = LegExecutor(api, self.leg_timeout, fee_rate)
+        return self.leg_executors[exchange]
+
+    def set_inventory(self, exchange: str, balances: Dict[str, float]):
+        self.inventory[exchange] = dict(balances)
+        logger.info(f"Запас активов для параллельного исполнения на {exchange}: {balances}")
+
     def enable_trading(self, enabled: bool):
         self.is_trading_enabled = enabled
         status = 'включена' if enabled else 'выключена'
@@ -67,44 +124,197 @@ class TradeExecutor:
         logger.info(f"Тестовый режим {status}")
         return f"Тестовый режим {status}"
 
-    async def execute_arbitrage(self, exchange: str, opportunity: Dict, position_size: float):
+    async def execute_arbitrage(self, exchange: str, opportunity: Dict, position_size: float) -> Dict:
+        # {'status': 'success' | 'test' | 'error', 'message', 'trade_id', 'profit', 'size'}
         if not self.is_trading_enabled:
-            return "Торговля отключена"
+            return {'status': 'error', 'message': "Торговля отключена"}
         if exchange not in self.exchanges:
-            return f"Биржа {exchange} не найдена"
+            return {'status': 'error', 'message': f"Биржа {exchange} не найдена"}
         exchange_positions = [p for p in self.open_positions.values() if p['exchange'] == exchange]
         if len(exchange_positions) >= self.max_concurrent_trades:
-            return f"Достигнуто максимальное количество одновременных сделок на бирже {exchange}"
+            return {'status': 'error', 'message': f"Достигнуто максимальное количество одновременных сделок на бирже {exchange}"}
         trade_size = min(position_size, self.max_position_size, opportunity['volume'])
         if self.test_mode:
             logger.info(f"Тестовый режим: Выполнение арбитража на {exchange} {opportunity['path']} с размером {trade_size} USDT")
-            return f"Тестовый режим: Арбитраж выполнен на {exchange}"
+            return {'status': 'test', 'message': f"Тестовый режим: Арбитраж выполнен на {exchange}"}
         try:
-            trade_id = await self.exchanges[exchange].execute_arbitrage_trade(opportunity['path'], trade_size)
-            self.open_positions[trade_id] = {
+            leg_executor = self.get_leg_executor(exchange)
+            execution = None
+            if leg_executor is not None:
+                execution = await leg_executor.execute(opportunity['path'], trade_size, self.inventory.get(exchange))
+                if execution['status'] == FAILED:
+                    unhedged = execution['unhedged']
+                    return {'status': 'error', 'unhedged': unhedged,
+                            'message': f"Ошибка при выполнении арбитража на {exchange}: {execution['error'] or 'ноги не исполнены'}"
+                                       f"{f'; незакрытые остатки {unhedged}' if unhedged else ''}"}
+                trade_id = f"{exchange}-{next(self._trade_ids)}"
+                logger.info(f"Исполнение {trade_id}: {execution['status']}, "
+                            f"от первой заявки до последнего исполнения {execution['first_submit_to_last_fill'] * 1000:.1f} мс")
+            else:
+                trade_id = await self.exchanges[exchange].execute_arbitrage_trade(opportunity['path'], trade_size)
+            position = {
                 'exchange': exchange,
                 'path': opportunity['path'],
                 'size': trade_size,
-                'entry_prices': opportunity['prices'],
+                'entry_prices': opportunity.get('prices', {}),
+                'execution': execution,
+                'user_id': opportunity.get('user_id'),
             }
+            self.attach_leg_edges(position)
+            self.open_positions[trade_id] = position
+            self._track_position(trade_id, position)
             logger.info(f"Открыта арбитражная позиция {trade_id} на {exchange} по пути {opportunity['path']}")
-            return f"Открыта арбитражная позиция {trade_id} на {exchange}"
+            # Фактическая прибыль известна из исполнения ног, иначе — оценка возможности
+            profit = execution['end_amount'] - execution['start_amount'] if execution is not None else opportunity.get('profit', 0.0)
+            return {'status': 'success', 'message': f"Открыта арбитражная позиция {trade_id} на {exchange}",
+                    'trade_id': trade_id, 'profit': profit, 'size': trade_size}
         except Exception as e:
             logger.error(f"Ошибка при выполнении арбитража на {exchange}: {str(e)}")
-            return f"Ошибка при выполнении арбитража на {exchange}: {str(e)}"
+            return {'status': 'error', 'message': f"Ошибка при выполнении арбитража на {exchange}: {str(e)}"}
+
+    def _position_symbols(self, position: Dict) -> List[str]:
+        table = self.get_market_table(position['exchange'])
+        if 'leg_edges' in position and table is not None:
+            return table.edge_symbols(position['leg_edges'])
+        path = position['path'].split('->') if isinstance(position['path'], str) else position['path']
+        return [key for a, b in zip(path, path[1:]) for key in (f"{a}{b}", f"{b}{a}")]
+
+    def _track_position(self, trade_id: str, position: Dict):
+        index = self.position_index.setdefault(position['exchange'], {})
+        for symbol in self._position_symbols(position):
+            index.setdefault(symbol, set()).add(trade_id)
+        positions = self.get_position_table(position['exchange'])
+        if positions is not None and 'leg_edges' in position and len(position['leg_edges']) <= positions.max_legs:
+            positions.add(trade_id, position['leg_edges'], self._entry_prices(position), position['size'])
+
+    @staticmethod
+    def _entry_prices(position: Dict) -> np.ndarray:
+        # Курс ребра покупки — 1 / цена пары
+        edges = np.asarray(position['leg_edges'])
+        return np.where(edges % 2, 1.0 / position['entry_rates'], position['entry_rates'])
+
+    def get_position_table(self, exchange: str):
+        table = self.get_market_table(exchange)
+        if table is None:
+            return None
+        positions = self.position_tables.get(exchange)
+        if positions is None:
+            positions = self.position_tables[exchange] = PositionTable()
+            positions.version = table.version
+        elif positions.version != table.version:
+            # Метаданные перечитаны и ребра перенумерованы: ноги переводятся по символам
+            positions.clear()
+            positions.version = table.version
+            for trade_id, position in self.open_positions.items():
+                if position['exchange'] != exchange or 'leg_symbols' not in position:
+                    continue
+                pair_ids = [table.pair_ids.get(symbol) for symbol in position['leg_symbols']]
+                if None in pair_ids:
+                    position.pop('leg_edges', None)
+                    continue
+                position['leg_edges'] = np.array(pair_ids, dtype=np.int64) * 2 + (np.asarray(position['leg_edges']) % 2)
+                position['table_version'] = table.version
+                if len(position['leg_edges']) <= positions.max_legs:
+                    positions.add(trade_id, position['leg_edges'], self._entry_prices(position), position['size'])
+        return positions
+
+    def _untrack_position(self, trade_id: str, position: Dict):
+        positions = self.position_tables.get(position['exchange'])
+        if positions is not None:
+            positions.remove(trade_id)
+        index = self.position_index.get(position['exchange'], {})
+        for symbol in self._position_symbols(position):
+            trade_ids = index.get(symbol)
+            if trade_ids is not None:
+                trade_ids.discard(trade_id)
+                if not trade_ids:
+                    del index[symbol]
+
+    def on_price_update(self, exchange: str, prices: Dict = None, symbols: List[str] = None) -> List[str]:
+        # Синхронный обработчик тика: обновляет таблицу цен, пересчитывает P&L только зависящих позиций
+        # и сразу планирует закрытие по take-profit/stop-loss, не дожидаясь очередного опроса
+        index = self.position_index.get(exchange)
+        current_prices = self.last_prices.setdefault(exchange, {})
+        if prices:
+            table = self.get_market_table(exchange)
+            if table is not None:
+                table.update(prices)
+            current_prices.update(prices)
+            symbols = list(prices)
+        if not index or not symbols:
+            return []
+        affected = set()
+        for symbol in symbols:
+            affected.update(index.get(symbol, ()))
+        affected -= self._closing
+        triggered = []
+        positions = self.get_position_table(exchange)
+        if positions is not None and len(positions):
+            rows, pnl = positions.mark_to_market(self.get_market_table(exchange).rate, positions.rows_for(affected))
+            for row, profit_loss in zip(rows, pnl):
+                trade_id = positions.trade_ids[row]
+                affected.discard(trade_id)
+                reason = self._exit_reason(profit_loss)
+                if reason is not None:
+                    self._schedule_close(trade_id, reason)
+                    triggered.append(trade_id)
+        # Позиции вне таблицы (нет таблицы цен биржи или слишком длинный путь) — по одной
+        for trade_id in affected:
+            position = self.open_positions.get(trade_id)
+            if position is None:
+                continue
+            reason = self._check_exit(trade_id, position, current_prices)
+            if reason is not None:
+                self._schedule_close(trade_id, reason)
+                triggered.append(trade_id)
+        return triggered
+
+    def _schedule_close(self, trade_id: str, reason: str):
+        self._closing.add(trade_id)
+        task = asyncio.ensure_future(self._close_triggered(trade_id, reason))
+        self._close_tasks.add(task)
+        task.add_done_callback(self._close_tasks.discard)
+
+    def _exit_reason(self, profit_loss: float):
+        if not np.isfinite(profit_loss):
+            return None
+        if profit_loss >= self.take_profit_percent:
+            return 'take_profit'
+        if profit_loss <= -self.stop_loss_percent:
+            return 'stop_loss'
+        return None
+
+    def _check_exit(self, trade_id: str, position: Dict, current_prices: Dict):
+        try:
+            profit_loss = self.calculate_profit_loss(position, current_prices)
+        except Exception as e:
+            logger.error(f"Ошибка при мониторинге позиции {trade_id}: {str(e)}")
+            return None
+        return self._exit_reason(profit_loss)
+
+    async def _close_triggered(self, trade_id: str, reason: str):
+        try:
+            await self.close_position(trade_id, reason)
+        finally:
+            self._closing.discard(trade_id)
 
     async def monitor_positions(self):
-        for trade_id, position in list(self.open_positions.items()):
-            try:
-                exchange = self.exchanges[position['exchange']]
-                current_prices = await exchange.get_current_prices(position['path'])
-                profit_loss = self.calculate_profit_loss(position, current_prices)
-                if profit_loss >= self.take_profit_percent:
-                    await self.close_position(trade_id, 'take_profit')
-                elif profit_loss <= -self.stop_loss_percent:
-                    await self.close_position(trade_id, 'stop_loss')
-            except Exception as e:
-                logger.error(f"Ошибка при мониторинге позиции {trade_id}: {str(e)}")
+        # Опрос для бирж без потока цен: один снимок на биржу, все биржи параллельно
+        exchanges = {p['exchange'] for p in self.open_positions.values()} - self.watched_exchanges
+        exchanges = [e for e in exchanges if e in self.exchanges]
+        snapshots = await asyncio.gather(*(self._price_snapshot(self.exchanges[e]) for e in exchanges),
+                                         return_exceptions=True)
+        for exchange, current_prices in zip(exchanges, snapshots):
+            if isinstance(current_prices, Exception):
+                logger.error(f"Ошибка при получении цен {exchange} для мониторинга позиций: {str(current_prices)}")
+                continue
+            self.on_price_update(exchange, current_prices)
+
+    @staticmethod
+    async def _price_snapshot(api) -> Dict[str, float]:
+        if hasattr(api, 'get_current_prices'):
+            return await api.get_current_prices()
+        return {symbol: quote['price'] for symbol, quote in (await api.get_prices()).items()}
 
     async def close_position(self, trade_id: str, reason: str):
         if trade_id not in self.open_positions:
@@ -114,14 +324,21 @@ class TradeExecutor:
         if self.test_mode:
             logger.info(f"Тестовый режим: Закрытие позиции {trade_id} на {exchange} по причине {reason}")
             del self.open_positions[trade_id]
+            self._untrack_position(trade_id, position)
             return f"Тестовый режим: Позиция {trade_id} на {exchange} закрыта"
         try:
-            result = await self.exchanges[exchange].close_arbitrage_trade(trade_id)
+            execution = position.get('execution')
+            if execution is not None:
+                # Ноги уже исполнены: результат известен из исполнения
+                result = {'actual_profit': execution['end_amount'] - execution['start_amount'], 'legs': execution['legs']}
+            else:
+                result = await self.exchanges[exchange].close_arbitrage_trade(trade_id)
             logger.info(f"Закрыта позиция {trade_id} на {exchange} по причине {reason}")
             del self.open_positions[trade_id]
+            self._untrack_position(trade_id, position)
             self.risk_manager.remove_position(trade_id)
             # Обновляем информацию о сделке в базе данных
-            self.db_manager.close_trade(trade_id, result['actual_profit'])
+            await self.db_manager.close_trade(trade_id, result['actual_profit'])
             # Отправляем уведомление пользователю
             await self.notification_manager.send_trade_closure(position['user_id'], {
                 'id': trade_id,
@@ -133,9 +350,38 @@ class TradeExecutor:
             logger.error(f"Ошибка при закрытии позиции {trade_id} на {exchange}: {str(e)}")
             return f"Ошибка при закрытии позиции {trade_id} на {exchange}: {str(e)}"
 
+    def attach_leg_edges(self, position: Dict):
+        # Ноги позиции переводятся в номера ребер таблицы один раз при открытии,
+        # дальше P&L считается индексированием массивов без сборки строк
+        table = self.get_market_table(position['exchange'])
+        if table is None:
+            return
+        path = position['path'].split('->') if isinstance(position['path'], str) else position['path']
+        leg_edges = table.path_edges(path)
+        if len(leg_edges) == 0 or (leg_edges < 0).any():
+            return
+        entry_prices = position['entry_prices']
+        entry_rates = table.rate[leg_edges].copy()
+        for i, (edge, symbol) in enumerate(zip(leg_edges, table.edge_symbols(leg_edges))):
+            if symbol in entry_prices:
+                price = entry_prices[symbol]
+                entry_rates[i] = 1.0 / price if edge % 2 else price
+        position['leg_edges'] = leg_edges
+        position['leg_symbols'] = table.edge_symbols(leg_edges)
+        position['entry_rates'] = entry_rates
+        position['table_version'] = table.version
+
     def calculate_profit_loss(self, position: Dict, current_prices: Dict) -> float:
+        if 'leg_edges' in position:
+            table = self.get_market_table(position['exchange'])
+            if table is not None and table.version == position['table_version']:
+                ratio = table.rate[position['leg_edges']] / position['entry_rates']
+                if not np.isfinite(ratio).all():
+                    logger.error(f"Нет текущих цен для пути {position['path']}")
+                    return 0
+                return (float(np.prod(ratio)) - 1) * 100
         entry_prices = position['entry_prices']
-        path = position['path']
+        path = position['path'].split('->') if isinstance(position['path'], str) else position['path']
         initial_amount = position['size']
         final_amount = initial_amount
         for i, symbol in enumerate(path):
@@ -157,8 +403,39 @@ class TradeExecutor:
     def get_open_positions(self) -> List[Dict]:
         return [{'id': k, **v} for k, v in self.open_positions.items()]
 
+    def get_position_metrics(self, user_id=None) -> Dict:
+        # Переоценка всех открытых позиций: по одному gather на биржу
+        positions = []
+        for exchange in {p['exchange'] for p in self.open_positions.values()}:
+            table = self.get_position_table(exchange)
+            priced = set()
+            if table is not None and len(table):
+                rows, pnl = table.mark_to_market(self.get_market_table(exchange).rate)
+                for row, profit_loss in zip(rows, pnl):
+                    trade_id = table.trade_ids[row]
+                    priced.add(trade_id)
+                    positions.append((trade_id, float(profit_loss)))
+            for trade_id, position in self.open_positions.items():
+                if position['exchange'] == exchange and trade_id not in priced:
+                    positions.append((trade_id, self.calculate_profit_loss(position, self.last_prices.get(exchange, {}))))
+        result = []
+        for trade_id, profit_loss in positions:
+            position = self.open_positions[trade_id]
+            if user_id is not None and position.get('user_id') not in (None, user_id):
+                continue
+            pnl = position['size'] * profit_loss / 100 if np.isfinite(profit_loss) else 0.0
+            result.append({'id': trade_id, 'exchange': position['exchange'], 'path': position['path'],
+                           'pnl_percent': profit_loss, 'pnl': pnl})
+        return {
+            'open_positions': len(result),
+            'unrealized_pnl': sum(p['pnl'] for p in result),
+            'positions': result,
+        }
+
     def reset(self):
         self.open_positions.clear()
+        self.position_index.clear()
+        self.position_tables.clear()
         logger.info("Сброс всех открытых позиций")
         return "Все открытые позиции сброшены"
 
@@ -179,7 +456,9 @@ class TradeExecutor:
             self.take_profit_percent = 3.0
         # Для MODERATE режима оставляем настройки по умолчанию
 
-async def trading_monitor(trade_executor):
+async def trading_monitor(trade_executor, interval: float = 10):
+    # Позиции на биржах с потоком цен закрываются по событиям (on_price_update);
+    # опрос остается для остальных бирж
     while True:
         await trade_executor.monitor_positions()
-        await asyncio.sleep(10)  # Проверка каждые 10 секунд
\ No newline at end of file
+        await asyncio.sleep(interval)
\ No newline at end of file
@@ -0,0 +1,80 @@
+import logging
+from typing import Dict, List
+import numpy as np
+from market_table import MarketTable
+
+logger = logging.getLogger(__name__)
+
+
+def evaluate_cycles(leg_edge: np.ndarray, rate: np.ndarray, volume: np.ndarray,
+                    volatility: np.ndarray) -> Dict[str, np.ndarray]:
+    # Один проход NumPy по набору циклов: прибыль, минимальный объем и волатильность
+    # берутся из массивов таблицы по номерам ребер
+    rates = rate[leg_edge]
+    with np.errstate(invalid='ignore'):
+        profit = (np.prod(rates, axis=1) - 1) * 100
+    valid = np.all(np.isfinite(rates) & (rates > 0), axis=1)
+    min_volume = volume[leg_edge].min(axis=1)
+    leg_volatility = volatility[leg_edge]
+    max_volatility = np.where(np.isnan(leg_volatility), -np.inf, leg_volatility).max(axis=1)
+    max_volatility[np.isneginf(max_volatility)] = 0.0
+    return {'valid': valid, 'profit': profit, 'volume': min_volume, 'volatility': max_volatility}
+
+
+def filter_cycles(result: Dict[str, np.ndarray], min_profit: float, min_volume: float,
+                  min_volatility: float, max_volatility: float) -> np.ndarray:
+    mask = (result['valid'] & (result['profit'] > min_profit) & (result['volume'] >= min_volume)
+            & (result['volatility'] >= min_volatility) & (result['volatility'] <= max_volatility))
+    return np.flatnonzero(mask)
+
+
+class TriangleIndex:
+    def __init__(self, table: MarketTable):
+        self.table = table
+        self.version = table.version
+
+        # Смежность: актив -> сосед -> направленное ребро таблицы
+        adjacency: Dict[int, Dict[int, int]] = {i: {} for i in range(len(table.assets))}
+        for edge, (src, dst) in enumerate(zip(table.edge_src.tolist(), table.edge_dst.tolist())):
+            adjacency[src][dst] = edge
+
+        # Каждый треугольник a->b->c->a берется один раз на направление: a — наименьший актив цикла
+        legs = []
+        for a, neighbors in adjacency.items():
+            for b, ab in neighbors.items():
+                if b <= a:
+                    continue
+                for c, bc in adjacency[b].items():
+                    if c <= a or a not in adjacency[c]:
+                        continue
+                    legs.append((ab, bc, adjacency[c][a]))
+        self.leg_edge = np.array(legs, dtype=np.int32).reshape(len(legs), 3)
+
+        # Обратный индекс пара -> циклы в формате CSR: циклы пары p лежат в
+        # pair_cycle_ids[pair_cycle_ptr[p]:pair_cycle_ptr[p + 1]]
+        flat_pairs = table.edge_pair[self.leg_edge.ravel()]
+        order = np.argsort(flat_pairs, kind='stable')
+        self.pair_cycle_ids = (order // 3).astype(np.int32)
+        self.pair_cycle_ptr = np.zeros(len(table.pairs) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(flat_pairs, minlength=len(table.pairs)), out=self.pair_cycle_ptr[1:])
+        logger.info(f"Построен индекс треугольников: {len(table.pairs)} пар, {len(legs)} циклов")
+
+    def __len__(self) -> int:
+        return len(self.leg_edge)
+
+    def cycles_for_pairs(self, pair_ids) -> np.ndarray:
+        if len(pair_ids) == 0:
+            return np.empty(0, dtype=np.int32)
+        chunks = [self.pair_cycle_ids[self.pair_cycle_ptr[p]:self.pair_cycle_ptr[p + 1]] for p in pair_ids]
+        return np.unique(np.concatenate(chunks))
+
+    def evaluate(self, cycle_ids: np.ndarray = None) -> Dict[str, np.ndarray]:
+        leg_edge = self.leg_edge if cycle_ids is None else self.leg_edge[cycle_ids]
+        return evaluate_cycles(leg_edge, self.table.rate, self.table.volume, self.table.volatility)
+
+    def filter(self, result: Dict[str, np.ndarray], min_profit: float, min_volume: float,
+               min_volatility: float, max_volatility: float) -> np.ndarray:
+        return filter_cycles(result, min_profit, min_volume, min_volatility, max_volatility)
+
+    def path(self, cycle_id: int) -> List[str]:
+        return self.table.path(self.leg_edge[cycle_id])
\ No newline at end of file
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+import aiosqlite
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    def __init__(self, conn, batch_size: int = 100, batch_delay: float = 0.005, history: int = 1000,
+                 max_errors: int = 100):
+        # Записи ставятся в очередь и подтверждаются сразу; фоновый писатель собирает их
+        # в одну транзакцию по batch_size записей или по истечении batch_delay секунд
+        self.conn = conn
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.stats = {'items': 0, 'batches': 0, 'max_batch': 0, 'errors': 0}
+        self.batch_sizes: deque = deque(maxlen=history)
+        self.commit_latency: deque = deque(maxlen=history)
+        self._pending: Set[asyncio.Future] = set()
+        # Ошибки записей, которые никто не ожидал, до flush(); старые вытесняются (они уже в логе)
+        self._errors: deque = deque(maxlen=max_errors)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def submit(self, sql, params: Tuple = (), returning: bool = False, awaited: bool = False) -> asyncio.Future:
+        # returning — результатом будет lastrowid, такая запись выполняется отдельным execute.
+        # sql может быть списком пар (sql, params): они выполняются подряд и фиксируются или откатываются вместе.
+        # awaited — вызывающий сам ждет future и получит ошибку из него, flush() ее не повторяет
+        if self._task is None or self._task.done():
+            raise RuntimeError("Write-behind writer is not running")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        self.queue.put_nowait((sql, params, returning, future, awaited))
+        return future
+
+    async def flush(self):
+        # Барьер: все записи, поставленные до вызова, зафиксированы; поднимается ошибка первой неудачной
+        # записи, которую никто не ожидал
+        if self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+        if self._errors:
+            error = self._errors[0]
+            self._errors.clear()
+            raise error
+
+    async def close(self):
+        if self._task is None:
+            return
+        self.queue.put_nowait(None)
+        await self._task
+        self._task = None
+        self._errors.clear()
+
+    def _drain(self, batch: List) -> bool:
+        while len(batch) < self.batch_size:
+            try:
+                item = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return False
+            if item is None:
+                return True
+            batch.append(item)
+        return False
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            stopping = self._drain(batch)
+            if not stopping and len(batch) < self.batch_size and self.batch_delay > 0:
+                # Окно группового коммита: ждем попутные записи
+                await asyncio.sleep(self.batch_delay)
+                stopping = self._drain(batch)
+            try:
+                await self._commit(batch)
+            except Exception as e:
+                # Например, не удался сам откат: писатель продолжает работу, ожидающие записи получают ошибку
+                logger.error(f"Write-behind batch failed: {str(e)}")
+                self._fail(batch, e)
+
+    def _fail(self, batch: List, error: Exception):
+        self.stats['errors'] += 1
+        if not all(item[4] for item in batch):
+            self._errors.append(error)
+        for item in batch:
+            future = item[3]
+            if not future.done():
+                future.set_exception(error)
+                if not item[4]:
+                    # Ошибку получает flush(); неожидаемые future не должны засорять лог
+                    future.exception()
+
+    async def _execute(self, batch: List) -> List:
+        # Подряд идущие записи с одинаковым SQL уходят одним executemany
+        results = []
+        i = 0
+        while i < len(batch):
+            sql, params, returning = batch[i][:3]
+            j = i + 1
+            if not isinstance(sql, str):
+                for statement, statement_params in sql:
+                    await self.conn.execute(statement, statement_params)
+                results.append(None)
+                i = j
+                continue
+            if not returning:
+                while j < len(batch) and batch[j][0] == sql and not batch[j][2]:
+                    j += 1
+            if j - i == 1:
+                cursor = await self.conn.execute(sql, params)
+                results.append(cursor.lastrowid if returning else None)
+            else:
+                await self.conn.executemany(sql, [item[1] for item in batch[i:j]])
+                results.extend([None] * (j - i))
+            i = j
+        return results
+
+    async def _commit(self, batch: List):
+        started = time.perf_counter()
+        try:
+            results = await self._execute(batch)
+            await self.conn.commit()
+        except Exception as e:
+            # Не только ошибки SQLite: неверные параметры дают ValueError/TypeError еще до выполнения
+            await self.conn.rollback()
+            if len(batch) > 1:
+                # Ошибочная запись не должна откатывать остальные: повтор по одной
+                for item in batch:
+                    await self._commit([item])
+                return
+            logger.error(f"Error in write-behind commit: {str(e)}")
+            self._fail(batch, e)
+            return
+        self.commit_latency.append(time.perf_counter() - started)
+        self.batch_sizes.append(len(batch))
+        self.stats['items'] += len(batch)
+        self.stats['batches'] += 1
+        self.stats['max_batch'] = max(self.stats['max_batch'], len(batch))
+        for item, result in zip(batch, results):
+            if not item[3].done():
+                item[3].set_result(result)
+
+    def metrics(self) -> Dict:
+        latency = np.array(self.commit_latency) * 1000
+        sizes = np.array(self.batch_sizes)
+        return {
+            **self.stats,
+            'queue_depth': self.queue.qsize(),
+            'pending': len(self._pending),
+            'avg_batch': float(sizes.mean()) if len(sizes) else 0.0,
+            'commit_ms_p50': float(np.percentile(latency, 50)) if len(latency) else 0.0,
+            'commit_ms_p99': float(np.percentile(latency, 99)) if len(latency) else 0.0,
+        }
\ No newline at end of file